@@ -0,0 +1,290 @@
+"""
+Benchmarks for the DependencyManager, using synthetic collections of tests.
+
+The collections are generated without running pytest, so the overhead of this plugin can be measured in isolation, for
+sizes that would take far too long to collect for real. Each shape of collection stresses a different part of the
+manager, such as the number of edges, the number of names that match multiple tests, or the depth of the graph.
+
+The results are written as JSON, with one entry per shape and size, so they can be compared between releases. Run this
+file with --help for the available options.
+"""
+
+import argparse
+import collections
+import gc
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from pytest_depends.main import DependencyManager
+
+
+# The number of tests in each generated file
+FILE_SIZE = 100
+
+# The number of parameters of each parametrized test
+PARAMETER_COUNT = 10
+
+# The fraction of tests that fail
+FAILURE_RATE = 0.01
+
+Marker = collections.namedtuple('Marker', ['name', 'args', 'kwargs'])
+
+Report = collections.namedtuple('Report', ['when', 'outcome'])
+
+
+class FakeItem(object):
+	""" A minimal stand-in for a collected test, with the attributes that are used by the manager. """
+
+	def __init__(self, nodeid, **kwargs):
+		""" Create a new instance with the given node id, and a depends marker with the given arguments if any. """
+		self.nodeid = nodeid
+		self.path = nodeid.split('::', 1)[0]
+		self.markers = [Marker('depends', (), kwargs)] if kwargs else []
+
+	def iter_markers(self):
+		""" Get the markers of this test. """
+		return iter(self.markers)
+
+	def get_closest_marker(self, name):
+		""" Get the first marker with the given name. """
+		return next((marker for marker in self.markers if marker.name == name), None)
+
+
+def _generate_independent(size):
+	""" Generate tests without any dependencies, which measures the overhead for tests that don't use the plugin. """
+	return [FakeItem(f'test_{index // FILE_SIZE}.py::test_{index}') for index in range(size)]
+
+
+def _generate_chain(size):
+	""" Generate tests that each depend on the previous test in their file, which results in deep graphs. """
+	return [
+		FakeItem(f'test_{index // FILE_SIZE}.py::test_{index}', on = [f'test_{index - 1}'])
+		if index % FILE_SIZE else FakeItem(f'test_{index // FILE_SIZE}.py::test_{index}')
+		for index in range(size)
+	]
+
+
+def _generate_fan_out(size):
+	""" Generate tests that all depend on the first test of their file, which results in tests with many dependents. """
+	return [
+		FakeItem(f'test_{index // FILE_SIZE}.py::test_{index}', on = [f'test_{index - index % FILE_SIZE}'])
+		if index % FILE_SIZE else FakeItem(f'test_{index // FILE_SIZE}.py::test_{index}')
+		for index in range(size)
+	]
+
+
+def _generate_fan_in(size):
+	""" Generate tests where the last test of each file depends on all others, so some tests have many dependencies. """
+	items = []
+	for index in range(size):
+		nodeid = f'test_{index // FILE_SIZE}.py::test_{index}'
+		if index % FILE_SIZE == FILE_SIZE - 1:
+			items.append(FakeItem(nodeid, on = [f'test_{other}' for other in range(index - FILE_SIZE + 1, index)]))
+		else:
+			items.append(FakeItem(nodeid))
+	return items
+
+
+def _generate_parametrized(size):
+	""" Generate parametrized tests that depend on all instances of another one, using its name without parameters. """
+	items = []
+	for index in range(size):
+		test = index // PARAMETER_COUNT
+		nodeid = f'test_{index // FILE_SIZE}.py::test_{test}[{index % PARAMETER_COUNT}]'
+		if test % 2:
+			items.append(FakeItem(nodeid, on = [f'test_{test - 1}']))
+		else:
+			items.append(FakeItem(nodeid))
+	return items
+
+
+def _generate_scope(size):
+	""" Generate tests that depend on all tests of the previous file, using the name of the file. """
+	return [
+		FakeItem(f'test_{index // FILE_SIZE}.py::test_{index}', on = [f'test_{index // FILE_SIZE - 1}.py'])
+		if index >= FILE_SIZE else FakeItem(f'test_{index // FILE_SIZE}.py::test_{index}')
+		for index in range(size)
+	]
+
+
+def _generate_mixed(size):
+	""" Generate tests with a random mix of custom names, relative and absolute names, and unresolvable names. """
+	generator = random.Random(size)
+	items = []
+	for index in range(size):
+		nodeid = f'test_{index // FILE_SIZE}.py::TestClass::test_{index}'
+		kwargs = {'name': f'name_{index}'}
+		dependencies = []
+		for _ in range(generator.randint(0, 3) if index else 0):
+			other = generator.randint(max(0, index - 1000), index - 1)
+			names = [
+				f'name_{other}',
+				f'test_{other}',
+				f'test_{other // FILE_SIZE}.py::TestClass::test_{other}',
+				f'missing_{other}',
+			]
+			# Only depend on entire files before the file of the test itself, to prevent cycles
+			if other // FILE_SIZE < index // FILE_SIZE:
+				names.append(f'test_{other // FILE_SIZE}.py')
+			dependencies.append(generator.choice(names))
+		if dependencies:
+			kwargs['on'] = dependencies
+		items.append(FakeItem(nodeid, **kwargs))
+	return items
+
+
+def _generate_layered(size):
+	""" Generate tests that depend on random tests of the previous file, which results in one large component. """
+	generator = random.Random(size)
+	items = []
+	for index in range(size):
+		nodeid = f'test_{index // FILE_SIZE}.py::test_{index}'
+		if index >= FILE_SIZE:
+			start = (index // FILE_SIZE - 1) * FILE_SIZE
+			others = generator.sample(range(start, start + FILE_SIZE), 3)
+			items.append(FakeItem(nodeid, on = [f'test_{other // FILE_SIZE}.py::test_{other}' for other in others]))
+		else:
+			items.append(FakeItem(nodeid))
+	return items
+
+
+SHAPES = {
+	'independent': _generate_independent,
+	'chain': _generate_chain,
+	'fan-out': _generate_fan_out,
+	'fan-in': _generate_fan_in,
+	'parametrized': _generate_parametrized,
+	'scope': _generate_scope,
+	'mixed': _generate_mixed,
+	'layered': _generate_layered,
+}
+
+
+def _timed(function, *args):
+	""" Call a function, returning its result and the number of seconds it took. """
+	start = time.perf_counter()
+	result = function(*args)
+	return result, time.perf_counter() - start
+
+
+def _run_session(manager, items):
+	""" Register the results of all steps of all tests, as pytest would during a run. """
+	for index, item in enumerate(items):
+		outcome = 'failed' if index % int(1 / FAILURE_RATE) == 1 else 'passed'
+		manager.register_result(item, Report('setup', 'passed'))
+		manager.register_result(item, Report('call', outcome))
+		manager.register_result(item, Report('teardown', 'passed'))
+
+
+def benchmark_manager(shape, size):
+	""" Measure the time and memory used by the manager for a synthetic collection of tests. """
+	items = SHAPES[shape](size)
+	gc.collect()
+
+	manager = DependencyManager()
+	_, items_seconds = _timed(setattr, manager, 'items', items)
+	sorted_items, sorted_seconds = _timed(lambda: manager.sorted_items)
+	_, register_seconds = _timed(_run_session, manager, sorted_items)
+	_, failed_seconds = _timed(lambda: [manager.get_failed(item) for item in items])
+	_, summary_seconds = _timed(lambda: [manager.get_failed_summary(item) for item in items])
+	_, reachability_seconds = _timed(lambda: [manager.count_dependents(item) for item in items])
+	edges = manager._graph.edge_count
+	del manager, sorted_items
+
+	# Measure the memory in a separate run, as tracing slows everything down
+	gc.collect()
+	tracemalloc.start()
+	manager = DependencyManager()
+	manager.items = items
+	manager.sorted_items
+	_, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	# Measure the memory of the reachability index on its own, as it is only created for some options
+	tracemalloc.start()
+	[manager.count_dependents(item) for item in items]
+	_, reachability_peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	return {
+		'benchmark': 'manager',
+		'shape': shape,
+		'size': size,
+		'edges': edges,
+		'items_seconds': items_seconds,
+		'sorted_items_seconds': sorted_seconds,
+		'register_result_seconds': register_seconds,
+		'get_failed_seconds': failed_seconds,
+		'get_failed_summary_seconds': summary_seconds,
+		'count_dependents_seconds': reachability_seconds,
+		'peak_memory_bytes': peak,
+		'reachability_peak_memory_bytes': reachability_peak,
+	}
+
+
+def benchmark_import(repeat):
+	""" Measure the time it takes to import the plugin, which happens on every pytest run, in a fresh interpreter. """
+	code = (
+		'import time, pytest; '
+		'start = time.perf_counter(); '
+		'import pytest_depends; '
+		'print(time.perf_counter() - start)'
+	)
+	timings = [
+		float(subprocess.check_output([sys.executable, '-c', code]).decode('utf-8'))
+		for _ in range(repeat)
+	]
+	return {'benchmark': 'import', 'seconds': min(timings)}
+
+
+def main(argv = None):
+	""" Run the benchmarks and write the results. """
+	parser = argparse.ArgumentParser(description = __doc__.split('\n\n', 1)[0].strip())
+	parser.add_argument(
+		'--sizes',
+		type = int,
+		nargs = '+',
+		default = [1000, 10000, 100000],
+		help = 'The numbers of tests to generate, such as 1000000 for a very large suite (default: %(default)s).',
+	)
+	parser.add_argument(
+		'--shapes',
+		nargs = '+',
+		choices = list(SHAPES),
+		default = list(SHAPES),
+		help = 'The shapes of the dependencies of the generated tests (default: all).',
+	)
+	parser.add_argument(
+		'--import-repeat',
+		type = int,
+		default = 5,
+		help = 'The number of times to measure the import time, of which the fastest is reported (default: %(default)s).',
+	)
+	parser.add_argument('--output', help = 'The file to write the results to (default: stdout).')
+	args = parser.parse_args(argv)
+
+	results = [benchmark_import(args.import_repeat)]
+	for size in args.sizes:
+		for shape in args.shapes:
+			results.append(benchmark_manager(shape, size))
+			print(f'{shape} {size}: done', file = sys.stderr)
+
+	data = {
+		'python': platform.python_version(),
+		'implementation': platform.python_implementation(),
+		'results': results,
+	}
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(data, f, indent = '\t')
+	else:
+		json.dump(data, sys.stdout, indent = '\t')
+		print()
+
+
+if __name__ == '__main__':
+	main()
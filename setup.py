@@ -23,11 +23,7 @@ setup(
 		'Intended Audience :: Developers',
 		'Topic :: Software Development :: Testing',
 		'Programming Language :: Python',
-		'Programming Language :: Python :: 2',
-		'Programming Language :: Python :: 2.7',
 		'Programming Language :: Python :: 3',
-		'Programming Language :: Python :: 3.4',
-		'Programming Language :: Python :: 3.5',
 		'Programming Language :: Python :: 3.6',
 		'Programming Language :: Python :: 3.7',
 		'Programming Language :: Python :: 3.8',
@@ -43,11 +39,10 @@ setup(
 	packages = find_packages('src'),
 	package_dir = { '': 'src' },
 	zip_safe = False,
+	python_requires = '>= 3.6',
 	install_requires = [
 		'colorama',
-		'future-fstrings',
-		'networkx',
-		'pytest >= 3',
+		'pytest >= 7',
 	],
 	entry_points={
 		'pytest11': [
@@ -1,34 +1,40 @@
-# -*- coding: future_fstrings -*-
-
 """
 A module that provides the pytest hooks for this plugin.
 
-The logic itself is in main.py.
+The logic itself is in main.py. This module is imported on every pytest run, including those that don't use this
+plugin at all, so it should stay cheap to import. The other modules are only imported once it is clear that they are
+needed.
 """
 
 import pytest
 
-from pytest_depends.main import DependencyManager
-from pytest_depends.util import clean_nodeid
+from pytest_depends.constants import MARKER_NAME
 
 
 # Each test suite run should have a single manager object. For regular runs, a simple singleton would suffice, but for
 # our own tests this causes problems, as the nested pytest runs get the same instance. This can be worked around by
 # running them all in subprocesses, but this slows the tests down massively. Instead, keep a stack of managers, so each
-# test suite will have its own manager, even nested ones.
+# test suite will have its own manager, even nested ones. The manager is only created once the collected tests turn out
+# to use this plugin, until then the entry for the test suite is None.
 managers = []
 
 
+# The strategies to order the tests, apart from running them after their dependencies
+DEPENDENCY_ORDERS = ['collection', 'critical-path', 'fail-fast', 'scope']
+
 DEPENDENCY_PROBLEM_ACTIONS = {
 	'run': None,
 	'skip': lambda m: pytest.skip(m),
 	'fail': lambda m: pytest.fail(m, False),
 }
 
+# The failure of a test with missing or failed dependencies, decided during the setup and raised when calling the test
+DEPENDENCY_FAILURE_KEY = pytest.StashKey()
 
-def _add_ini_and_option(parser, group, name, help, default, **kwargs):
+
+def _add_ini_and_option(parser, group, name, help, default, ini_type = None, **kwargs):
 	""" Add an option to both the ini file as well as the command line flags, with the latter overriding the former. """
-	parser.addini(name, help + ' This overrides the similarly named option from the config.', default = default)
+	parser.addini(name, help + ' This overrides the similarly named option from the config.', ini_type, default)
 	group.addoption(f'--{name.replace("_", "-")}', help = help, default = None, **kwargs)
 
 
@@ -62,6 +68,18 @@ def pytest_addoption(parser):  # noqa: D103
 		help = 'List all dependencies of all tests as a list of nodeids + the names that could not be resolved.',
 	)
 
+	# Add a flag to write the resolved dependency graph to a file
+	group.addoption(
+		'--depends-export',
+		metavar = 'PATH',
+		default = None,
+		help = (
+			'Write the tests, groups, dependencies and unresolved names to a file, in a format based on its extension. '
+			'Use .json for a single JSON object, .ndjson (or .jsonl) for one JSON object per line, or .dot (or .gv) for '
+			'Graphviz.'
+		),
+	)
+
 	# Add an ini option + flag to choose the action to take for failed dependencies
 	_add_ini_and_option(
 		parser,
@@ -88,10 +106,200 @@ def pytest_addoption(parser):  # noqa: D103
 		choices = DEPENDENCY_PROBLEM_ACTIONS.keys(),
 	)
 
+	# Add an ini option + flag to reuse the resolved dependencies from the previous run
+	_add_ini_and_option(
+		parser,
+		group,
+		name = 'cache_dependency_graph',
+		help = (
+			'Store the resolved dependencies in the pytest cache, and reuse them in the next run if none of the test '
+			'files or conftest.py files changed. Note that markers added by hooks are not tracked.'
+		),
+		default = False,
+		ini_type = 'bool',
+		action = 'store_true',
+	)
+
+	# Add an ini option + flag to choose how to order the tests
+	_add_ini_and_option(
+		parser,
+		group,
+		name = 'dependency_order',
+		help = (
+			'The order in which to run the tests, which always run after their dependencies. '
+			'Use "collection" to keep the order in which they were collected as much as possible, and "critical-path" to '
+			'start the longest chains of dependent tests first, based on the durations of the previous run and the cost '
+			'given on the marker for tests without one. Use "fail-fast" to start with the tests that most other tests '
+			'depend on, weighted by how often they failed in previous runs, and "scope" to keep the tests of the same '
+			'directory, file and class together as much as possible, so their fixtures are set up as few times as possible.'
+		),
+		default = 'collection',
+		choices = DEPENDENCY_ORDERS,
+	)
+
+	# Add an ini option + flag to deselect tests that depend on tests that failed in the previous run
+	_add_ini_and_option(
+		parser,
+		group,
+		name = 'deselect_blocked_tests',
+		help = (
+			'Deselect tests that depend on tests that failed in the previous run, as long as the files defining the failed '
+			'tests have not changed since. The failed tests themselves are still run.'
+		),
+		default = False,
+		ini_type = 'bool',
+		action = 'store_true',
+	)
+
+	# Add an ini option + flag to count dependencies that passed in a previous run as passed, without running them again
+	_add_ini_and_option(
+		parser,
+		group,
+		name = 'reuse_passed_dependencies',
+		help = (
+			'Do not run the dependencies of the selected tests that are not selected themselves, but count them as passed '
+			'if they passed in their last run, and neither their file nor any of the files of reuse_passed_inputs changed '
+			'since.'
+		),
+		default = False,
+		ini_type = 'bool',
+		action = 'store_true',
+	)
+	parser.addini(
+		'reuse_passed_inputs',
+		'Glob patterns of files (relative to the root directory) that the tests depend on, such as build artifacts. The '
+		'results of previous runs are not reused if any of these files changed.',
+		'linelist',
+		[],
+	)
+
+	# Add flags to run the dependencies and dependents of the selected tests as well
+	group.addoption(
+		'--with-dependencies',
+		action = 'store_true',
+		default = False,
+		help = (
+			'Also run the tests that the selected tests depend on, directly or indirectly, even if they were deselected '
+			'(eg using -k or -m).'
+		),
+	)
+	group.addoption(
+		'--with-dependents',
+		action = 'store_true',
+		default = False,
+		help = (
+			'Also run the tests that depend on the selected tests, directly or indirectly, even if they were deselected '
+			'(eg using -k or -m).'
+		),
+	)
+
+	# Add flags to only run the tests that are affected by changes to files
+	group.addoption(
+		'--changed-file',
+		action = 'append',
+		metavar = 'PATH',
+		default = None,
+		help = (
+			'Only run the tests that are affected by a change to this file or directory, the tests that depend on them '
+			'and the tests that these depend on. Can be given multiple times.'
+		),
+	)
+	group.addoption(
+		'--changed-since',
+		metavar = 'REF',
+		default = None,
+		help = (
+			'Like --changed-file, for all files that differ from the given git ref, including uncommitted and untracked '
+			'files.'
+		),
+	)
+
+	# Add an ini option + flag to run the tests that are marked as concurrent on a pool of threads
+	_add_ini_and_option(
+		parser,
+		group,
+		name = 'dependency_concurrency',
+		help = (
+			'Run batches of consecutive tests that are marked as concurrent using the depends marker, and that do not '
+			'depend on each other, concurrently on the given number of threads. Only applies to tests that share their '
+			'module or class, that have the same warning filters, and that only use fixtures with a larger scope, such as '
+			'module or session. Async tests are not supported.'
+		),
+		default = None,
+		type = int,
+	)
+
+	# Add an ini option + flag to measure the overhead of this plugin, and to choose the file to write the results to
+	_add_ini_and_option(
+		parser,
+		group,
+		name = 'dependency_profile',
+		help = (
+			'Measure the time spent in each phase of this plugin, and show it in the terminal summary. The results are '
+			'also written as JSON to the file given by --dependency-profile-path.'
+		),
+		default = False,
+		ini_type = 'bool',
+		action = 'store_true',
+	)
+	_add_ini_and_option(
+		parser,
+		group,
+		name = 'dependency_profile_path',
+		help = 'The file to write the results of --dependency-profile to, pytest-depends-profile.json by default.',
+		default = 'pytest-depends-profile.json',
+		metavar = 'PATH',
+	)
+
+	# Add an ini option + flag to let pytest-xdist schedule the tests based on their dependencies
+	_add_ini_and_option(
+		parser,
+		group,
+		name = 'dependency_scheduling',
+		help = (
+			'When running tests in parallel using pytest-xdist, only send a test to a worker once the tests it depends on '
+			'have completed.'
+		),
+		default = False,
+		ini_type = 'bool',
+		action = 'store_true',
+	)
+
+
+def _uses_changes(config):
+	""" Whether the tests to run are selected based on changes to files. """
+	return config.getoption('changed_file') is not None or config.getoption('changed_since') is not None
+
+
+def _is_selecting(config):
+	""" Whether tests are added to or removed from the selection based on their dependencies. """
+	return config.getoption('with_dependencies') or config.getoption('with_dependents') or _uses_changes(config)
+
+
+def _is_needed(config, items):
+	""" Whether the plugin is needed for a test suite, which is the case when it is used by a test or a flag. """
+	if config.getoption('list_dependency_names') or config.getoption('list_processed_dependencies'):
+		return True
+	if config.getoption('depends_export') or _uses_changes(config):
+		return True
+
+	# Check the markers of each node once, rather than those of all parents for each test
+	seen = set()
+	for item in items:
+		node = item
+		while node is not None and id(node) not in seen:
+			seen.add(id(node))
+			if any(marker.name == MARKER_NAME for marker in node.own_markers):
+				return True
+			node = node.parent
+	return False
+
+
+def _create_manager(config):
+	""" Create the manager for a test suite. """
+	from pytest_depends.main import DependencyManager
 
-def pytest_configure(config):  # noqa: D103
 	manager = DependencyManager()
-	managers.append(manager)
 
 	# Setup the handling of problems with dependencies
 	manager.options['failed_dependency_action'] = _get_ini_or_option(
@@ -104,17 +312,120 @@ def pytest_configure(config):  # noqa: D103
 		'missing_dependency_action',
 		DEPENDENCY_PROBLEM_ACTIONS.keys(),
 	)
+	manager.options['cache_dependency_graph'] = _get_ini_or_option(config, 'cache_dependency_graph', None)
+	manager.options['dependency_order'] = _get_ini_or_option(config, 'dependency_order', DEPENDENCY_ORDERS)
+	manager.options['deselect_blocked_tests'] = _get_ini_or_option(config, 'deselect_blocked_tests', None)
+	manager.options['reuse_passed_dependencies'] = _get_ini_or_option(config, 'reuse_passed_dependencies', None)
+	# The tests that are affected by changes need their dependencies, so these are always selected when using changes
+	manager.options['with_dependencies'] = config.getoption('with_dependencies') or _uses_changes(config)
+	manager.options['with_dependents'] = config.getoption('with_dependents')
+	manager.options['dependency_concurrency'] = int(_get_ini_or_option(config, 'dependency_concurrency', None) or 0)
+	manager.profiler = config.pluginmanager.get_plugin('depends-profiler')
+
+	return manager
+
+
+def pytest_configure(config):  # noqa: D103
+	managers.append(None)
+
+	# Let the controller of pytest-xdist share the results of the tests between the workers, and schedule the tests if
+	# requested. This is only needed when the tests are actually distributed.
+	distributed = config.pluginmanager.hasplugin('xdist') and config.getoption('dist', 'no') != 'no'
+	if distributed and not hasattr(config, 'workerinput'):
+		from pytest_depends.distributed import ControllerPlugin
+
+		scheduling = _get_ini_or_option(config, 'dependency_scheduling', None)
+		config.pluginmanager.register(ControllerPlugin(scheduling), 'depends-controller')
+
+	# Record the durations and outcomes of the tests for the next run if they are used to order or select the tests. On
+	# pytest-xdist, the controller receives the reports of all workers, so only record them there.
+	order = _get_ini_or_option(config, 'dependency_order', DEPENDENCY_ORDERS)
+	deselect_blocked_tests = _get_ini_or_option(config, 'deselect_blocked_tests', None)
+	reuse_passed_dependencies = _get_ini_or_option(config, 'reuse_passed_dependencies', None)
+	if order in ['critical-path', 'fail-fast'] or deselect_blocked_tests or reuse_passed_dependencies:
+		if not hasattr(config, 'workerinput'):
+			from pytest_depends.history import HistoryRecorder
+
+			recorder = HistoryRecorder(config, record_passed = reuse_passed_dependencies)
+			config.pluginmanager.register(recorder, 'depends-history')
+
+	# Measure the overhead of this plugin if requested. Each worker of pytest-xdist writes its own file.
+	if _get_ini_or_option(config, 'dependency_profile', None):
+		from pytest_depends.profiling import Profiler
+
+		profile = _get_ini_or_option(config, 'dependency_profile_path', None)
+		if hasattr(config, 'workerinput'):
+			profile = f'{profile}.{config.workerinput["workerid"]}'
+		config.pluginmanager.register(Profiler(profile), 'depends-profiler')
+
+	# Check the format of the file to export the graph to before collecting the tests, which may take a while
+	if config.getoption('depends_export'):
+		from pytest_depends.export import get_writer
+
+		try:
+			get_writer(config.getoption('depends_export'))
+		except ValueError as e:
+			raise pytest.UsageError(str(e))
+
+	# Collect all tests when selecting tests based on their dependencies, as these may be anywhere, and keep track of the
+	# tests that are deselected
+	if _is_selecting(config):
+		from pytest_depends.selection import Selection
+
+		selection = Selection(config)
+		selection.collect_all()
+		config.pluginmanager.register(selection, 'depends-selection')
 
 	# Register marker
 	config.addinivalue_line("markers", "depends(name='name', on=['other_name']): marks depencies between tests.")
 
 
-@pytest.hookimpl(trylast = True)
+# Wrap the hooks of all other plugins, so the tests are only reordered once all of them are done, and the full
+# collection is known before any of them deselect tests
+@pytest.hookimpl(hookwrapper = True)
 def pytest_collection_modifyitems(config, items):  # noqa: D103
-	manager = managers[-1]
-
-	# Register the founds tests on the manager
-	manager.items = items
+	selection = config.pluginmanager.get_plugin('depends-selection')
+	# Keep the full collection when deselected tests may be needed, so the dependencies on them can be resolved
+	reusing = _get_ini_or_option(config, 'reuse_passed_dependencies', None)
+	collected = list(items) if selection is not None or reusing else items
+	if selection is not None:
+		selection.hold()
+
+	yield
+
+	try:
+		if selection is not None:
+			selection.select_args(items)
+
+		# Don't bother with any of the processing if none of the tests use this plugin
+		if not _is_needed(config, collected):
+			return
+
+		manager = managers[-1] = _create_manager(config)
+		with manager.measure('collection'):
+			_process_collection(config, manager, collected, items)
+	finally:
+		if selection is not None:
+			selection.release(items)
+
+
+def _process_collection(config, manager, collected, items):
+	""" Register the collected tests on the manager, and reorder and select the tests to run. """
+	from pytest_depends.graph import CycleError
+
+	# Register the founds tests on the manager, reusing the dependencies that were resolved in a previous run if possible
+	cached = None
+	if manager.options['cache_dependency_graph']:
+		from pytest_depends.cache import get_fingerprint
+		from pytest_depends.cache import load_graph
+		from pytest_depends.cache import store_graph
+
+		fingerprint = get_fingerprint(collected)
+		cached = load_graph(config, fingerprint)
+	if cached is None:
+		manager.items = collected
+	else:
+		manager.load(collected, cached)
 
 	# Show the extra information if requested
 	if config.getoption('list_dependency_names'):
@@ -124,8 +435,99 @@ def pytest_collection_modifyitems(config, items):  # noqa: D103
 		color = config.getoption('color')
 		manager.print_processed_dependencies(color)
 
+	# Write the graph to a file if requested. The workers of pytest-xdist all collect the same tests, so only the first
+	# one writes it.
+	path = config.getoption('depends_export')
+	if path and getattr(config, 'workerinput', {}).get('workerid', 'gw0') == 'gw0':
+		from pytest_depends.export import export
+
+		try:
+			with manager.measure('export'):
+				export(manager, path)
+		except ValueError as e:
+			raise pytest.UsageError(str(e))
+
 	# Reorder the items so that tests run after their dependencies
-	items[:] = manager.sorted_items
+	try:
+		with manager.measure('sorting'):
+			if manager.options['dependency_order'] == 'critical-path':
+				from pytest_depends.history import load_durations
+
+				ordered = manager.sort_by_critical_path(load_durations(config))
+			elif manager.options['dependency_order'] == 'fail-fast':
+				from pytest_depends.history import load_failure_rates
+
+				ordered = manager.sort_by_impact(load_failure_rates(config))
+			elif manager.options['dependency_order'] == 'scope':
+				from pytest_depends.selection import report
+
+				ordered = manager.sort_by_scope()
+				switches = manager.count_scope_switches(ordered)
+				report(config, f'Ordered the tests by scope: {switches} scope switches')
+				if manager.profiler is not None:
+					# Sorting the tests in collection order as well is only worth it to compare the two when profiling
+					baseline = manager.count_scope_switches(manager.sorted_items)
+					manager.profiler.count('scope_switches', switches)
+					manager.profiler.count('collection_order_scope_switches', baseline)
+			else:
+				ordered = manager.sorted_items
+	except CycleError as e:
+		raise pytest.UsageError(str(e))
+
+	# Deselect the tests that are not affected by the changed files if requested
+	if _uses_changes(config):
+		from pytest_depends.changes import get_changed_paths
+		from pytest_depends.selection import select_changed
+
+		try:
+			changed = get_changed_paths(config)
+		except ValueError as e:
+			raise pytest.UsageError(str(e))
+		select_changed(config, manager, items, changed)
+
+	# Count the dependencies of the selected tests that passed before as passed if requested, so they are not run again
+	if manager.options['reuse_passed_dependencies']:
+		from pytest_depends.selection import reuse_passed
+
+		reuse_passed(config, manager, items)
+
+	# Add the dependencies or dependents of the selected tests if requested, keeping the other deselected tests out
+	if collected is not items:
+		from pytest_depends.selection import select
+
+		select(config, manager, ordered, items)
+	else:
+		items[:] = ordered
+
+	if manager.options['cache_dependency_graph'] and cached is None:
+		store_graph(config, fingerprint, manager.dump())
+
+	# Deselect the tests that are known to be blocked by a failed dependency if requested
+	if manager.options['deselect_blocked_tests']:
+		from pytest_depends.selection import deselect_blocked
+
+		deselect_blocked(config, manager, items)
+
+	# Exchange information with the controller of pytest-xdist if this is a worker
+	if hasattr(config, 'workerinput'):
+		from pytest_depends.distributed import configure_worker
+
+		configure_worker(config, manager)
+
+
+# Run the tests using a pool of threads if requested, leaving the special cases to the regular loop of pytest
+@pytest.hookimpl(tryfirst = True)
+def pytest_runtestloop(session):  # noqa: D103
+	manager = managers[-1]
+	if manager is None or manager.options['dependency_concurrency'] < 2 or hasattr(session.config, 'workerinput'):
+		return None
+	if session.testsfailed or session.config.option.collectonly:
+		return None
+	if session.config.getoption('setuponly', False) or session.config.getoption('usepdb', False):
+		return None
+	from pytest_depends.concurrency import run_tests
+
+	return run_tests(session, manager, manager.options['dependency_concurrency'])
 
 
 @pytest.hookimpl(tryfirst = True, hookwrapper = True)
@@ -136,23 +538,55 @@ def pytest_runtest_makereport(item, call):  # noqa: D103
 	outcome = yield
 
 	# Store the result on the manager
-	manager.register_result(item, outcome.get_result())
+	if manager is None:
+		return
+	if manager.profiler is None:
+		manager.register_result(item, outcome.get_result())
+	else:
+		with manager.profiler.measure('register_result'):
+			manager.register_result(item, outcome.get_result())
 
 
-def pytest_runtest_call(item):  # noqa: D103
-	manager = managers[-1]
-
+def _get_dependency_problem(manager, item):
+	""" Get the configured action and its message if a test has missing or failed dependencies, or None otherwise. """
 	# Handle missing dependencies
-	missing_dependency_action = DEPENDENCY_PROBLEM_ACTIONS[manager.options['missing_dependency_action']]
 	missing = manager.get_missing(item)
-	if missing_dependency_action and missing:
-		missing_dependency_action(f'{item.nodeid} depends on {", ".join(missing)}, which was not found')
+	if manager.options['missing_dependency_action'] != 'run' and missing:
+		message = f'{item.nodeid} depends on {", ".join(missing)}, which was not found'
+		return manager.options['missing_dependency_action'], message
 
 	# Check whether all dependencies succeeded
-	failed_dependency_action = DEPENDENCY_PROBLEM_ACTIONS[manager.options['failed_dependency_action']]
-	failed = manager.get_failed(item)
-	if failed_dependency_action and failed:
-		failed_dependency_action(f'{item.nodeid} depends on {", ".join(failed)}')
+	failed = manager.get_failed_summary(item)
+	if failed and manager.shared_results is not None and manager.shared_results.update(manager):
+		failed = manager.get_failed_summary(item)
+	if manager.options['failed_dependency_action'] != 'run' and failed:
+		return manager.options['failed_dependency_action'], f'{item.nodeid} depends on {failed}'
+	return None
+
+
+# Run before the setup of the test (and that of the skip markers), so none of its fixtures are created if it is skipped
+@pytest.hookimpl(tryfirst = True)
+def pytest_runtest_setup(item):  # noqa: D103
+	manager = managers[-1]
+	if manager is None:
+		return
+	with manager.measure('check_dependencies'):
+		problem = _get_dependency_problem(manager, item)
+	if problem is None:
+		return
+	action, message = problem
+	# Failing during the setup would report the test as an error, so the failure is raised when calling it instead
+	if action == 'fail':
+		item.stash[DEPENDENCY_FAILURE_KEY] = message
+	else:
+		DEPENDENCY_PROBLEM_ACTIONS[action](message)
+
+
+@pytest.hookimpl(tryfirst = True)
+def pytest_runtest_call(item):  # noqa: D103
+	message = item.stash.get(DEPENDENCY_FAILURE_KEY, None)
+	if message is not None:
+		DEPENDENCY_PROBLEM_ACTIONS['fail'](message)
 
 
 def pytest_unconfigure():  # noqa: D103
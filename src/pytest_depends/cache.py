@@ -0,0 +1,80 @@
+"""
+A module to persist data between test runs, using the cache of pytest.
+
+Cached data is only valid as long as nothing that it was derived from has changed. This is checked using fingerprints,
+which are based on the node ids of the tests and the size and modification time of the files that define them.
+"""
+
+import hashlib
+import os
+
+
+# The version of the format of the cached data, which should be increased whenever this format changes
+CACHE_VERSION = 4
+
+# The key under which the resolved dependency graph is stored
+GRAPH_KEY = 'depends/graph'
+
+
+def get_item_path(item):
+	""" Get the path of the file in which a test is defined. """
+	return str(item.path)
+
+
+def get_file_fingerprint(path):
+	""" Get a cheap fingerprint of the contents of a file, or None if the file does not exist. """
+	try:
+		stat = os.stat(path)
+	except OSError:
+		return None
+	return f'{stat.st_mtime_ns}:{stat.st_size}'
+
+
+def get_fingerprint(items):
+	"""
+	Get a fingerprint of a list of collected tests.
+
+	This covers the node ids of the tests (including their order), the files in which they are defined, and the
+	conftest.py files that may apply to these files.
+	"""
+	digest = hashlib.sha1(f'{CACHE_VERSION}\0'.encode('utf-8'))
+	paths = set()
+	for item in items:
+		digest.update(f'{item.nodeid}\0'.encode('utf-8'))
+		paths.add(get_item_path(item))
+
+	# Add the conftest.py files in the directories of the files and all their parents
+	directories = set()
+	for path in paths:
+		directory = os.path.dirname(path)
+		while directory not in directories:
+			directories.add(directory)
+			directory = os.path.dirname(directory)
+	paths.update(os.path.join(directory, 'conftest.py') for directory in directories)
+
+	for path in sorted(paths):
+		digest.update(f'{path}\0{get_file_fingerprint(path)}\0'.encode('utf-8'))
+	return digest.hexdigest()
+
+
+def _get_cache(config):
+	""" Get the cache of pytest, or None if it is not available (eg because the cacheprovider plugin is disabled). """
+	return getattr(config, 'cache', None)
+
+
+def load_graph(config, fingerprint):
+	""" Get the cached dependency graph (as created by DependencyManager.dump) with the given fingerprint, if any. """
+	cache = _get_cache(config)
+	if cache is None:
+		return None
+	data = cache.get(GRAPH_KEY, None)
+	if not data or data.get('fingerprint') != fingerprint:
+		return None
+	return data['graph']
+
+
+def store_graph(config, fingerprint, graph):
+	""" Store a dependency graph (as created by DependencyManager.dump) under the given fingerprint. """
+	cache = _get_cache(config)
+	if cache is not None:
+		cache.set(GRAPH_KEY, {'fingerprint': fingerprint, 'graph': graph})
@@ -0,0 +1,105 @@
+"""
+A module to find the tests that are affected by changes to files.
+
+A test is affected by a change if the file that defines it changed, if a conftest.py file that applies to it changed, or
+if it is inside a directory that changed. The changed files are either given directly, or taken from git.
+"""
+
+import os
+import subprocess
+
+from pytest_depends.cache import get_item_path
+
+
+def _git(directory, *args):
+	""" Run a git command in a directory, and get its output as a string. """
+	try:
+		output = subprocess.run(
+			['git', *args],
+			cwd = directory,
+			stdout = subprocess.PIPE,
+			stderr = subprocess.PIPE,
+			check = True,
+		).stdout
+	except OSError as e:
+		raise ValueError(f'Could not run git: {e}')
+	except subprocess.CalledProcessError as e:
+		raise ValueError(f'Failed to run git {" ".join(args)}: {e.stderr.decode("utf-8", "replace").strip()}')
+	return output.decode('utf-8')
+
+
+def get_git_changes(directory, ref):
+	"""
+	Get the absolute paths of the files that changed compared to a git ref, including uncommitted and untracked files.
+
+	Files that were deleted are included as well, as they may still be referred to by conftest.py files or such. The
+	paths are separated by NUL characters, so git does not quote paths with special characters.
+	"""
+	# Git would read a ref that starts with a dash as an option instead
+	if ref.startswith('-'):
+		raise ValueError(f'Invalid git ref: {ref}')
+	toplevel = _git(directory, 'rev-parse', '--show-toplevel').strip()
+	paths = _git(directory, 'diff', '--name-only', '-z', ref, '--').split('\0')
+	paths.extend(_git(directory, 'ls-files', '-z', '--others', '--exclude-standard', '--full-name').split('\0'))
+	return {os.path.normpath(os.path.join(toplevel, path)) for path in paths if path}
+
+
+def get_changed_paths(config):
+	""" Get the absolute paths of the changed files given by the options, or None if none were given. """
+	files = config.getoption('changed_file')
+	ref = config.getoption('changed_since')
+	if files is None and ref is None:
+		return None
+	changed = {os.path.abspath(path) for path in files or ()}
+	if ref is not None:
+		changed.update(get_git_changes(str(config.rootdir), ref))
+	return changed
+
+
+class ChangeMatcher(object):
+	""" Checks which tests are affected by a set of changed paths, checking each test file only once. """
+
+	def __init__(self, changed):
+		""" Create a new instance for the given absolute paths. """
+		self.changed = {os.path.normcase(os.path.normpath(path)) for path in changed}
+		self._files = {}
+
+	def is_affected(self, item):
+		""" Whether a test is affected by the changes. """
+		path = os.path.normcase(os.path.abspath(get_item_path(item)))
+		if path not in self._files:
+			self._files[path] = self._is_file_affected(path)
+		return self._files[path]
+
+	def get_unmapped(self, items):
+		"""
+		Get the changed paths that cannot affect any of the given tests as far as is known, such as the code under test.
+
+		These are the paths that are not one of the test files, one of their directories, or a conftest.py file in one of
+		these directories.
+		"""
+		mapped = set()
+		for path in {os.path.normcase(os.path.abspath(get_item_path(item))) for item in items}:
+			mapped.add(path)
+			directory = os.path.dirname(path)
+			while directory not in mapped:
+				mapped.add(directory)
+				mapped.add(os.path.join(directory, 'conftest.py'))
+				parent = os.path.dirname(directory)
+				if parent == directory:
+					break
+				directory = parent
+		return sorted(self.changed - mapped)
+
+	def _is_file_affected(self, path):
+		""" Whether a test file is affected by the changes, as it changed itself or one of its directories changed. """
+		if path in self.changed:
+			return True
+		directory = os.path.dirname(path)
+		while True:
+			if directory in self.changed or os.path.join(directory, 'conftest.py') in self.changed:
+				return True
+			parent = os.path.dirname(directory)
+			if parent == directory:
+				return False
+			directory = parent
@@ -0,0 +1,285 @@
+"""
+A module to run independent tests concurrently within a single process, on a pool of threads.
+
+The tests are run in their usual order, but consecutive tests that are marked as concurrent and that don't depend on
+each other are run as a batch. Each test still runs through the usual hooks, so other plugins (such as the one for
+warnings) apply to it, but the protocol of each test is nested in the call of the previous test: once a test has been
+started on the pool, the next test is set up and started, and the call of a test only completes once the test itself
+does. This helps for tests that spend most of their time waiting, such as on network requests.
+
+This is only possible for tests that don't use fixtures of their own, as these would otherwise be torn down before the
+test completes. Fixtures with a larger scope (such as a module or session) are shared by all tests in the batch, so
+tests in a batch need to share their parent as well. Since the hooks of the last test that started are active while the
+other tests run, the tests in a batch need to have the same warning filters as well, and their output and warnings are
+not captured per test. Tests that don't meet these requirements run as usual, as do async tests.
+"""
+
+import concurrent.futures
+import inspect
+import io
+import sys
+import threading
+
+import pytest
+
+from pytest_depends.util import is_concurrent
+
+
+# The exceptions that stop the test session rather than being reported as a failure of a test
+RERAISE = (pytest.exit.Exception, KeyboardInterrupt)
+
+
+def can_run_concurrently(item):
+	""" Whether a test can be part of a batch of tests that run concurrently. """
+	if not isinstance(item, pytest.Function) or not is_concurrent(item):
+		return False
+	# Expected failures that should not run are handled while calling the test, which is skipped for batches
+	if item.get_closest_marker('xfail') is not None:
+		return False
+	if inspect.iscoroutinefunction(getattr(item, 'obj', None)):
+		return False
+	fixture_info = getattr(item, '_fixtureinfo', None)
+	if fixture_info is None:
+		return False
+	return all(
+		definitions[-1].scope != 'function' or _is_direct_parameter(item, name, definitions[-1])
+		for name, definitions in fixture_info.name2fixturedefs.items()
+	)
+
+
+def _is_direct_parameter(item, name, definition):
+	""" Whether a fixture of a test is an argument of pytest.mark.parametrize, which has no setup or teardown. """
+	callspec = getattr(item, 'callspec', None)
+	if callspec is None or name not in callspec.params:
+		return False
+	# Pytest uses this function for the arguments that are not passed to another fixture using indirect
+	return getattr(definition.func, '__name__', None) == 'get_direct_param_fixture_func'
+
+
+def _get_warning_filters(item):
+	""" Get the warning filters that are added to a test using markers. """
+	return [marker.args for marker in item.iter_markers('filterwarnings')]
+
+
+def _fits_batch(manager, batch, item, size):
+	""" Whether a test can be added to a batch of tests of at most the given size. """
+	if len(batch) >= size or item.parent is not batch[0].parent:
+		return False
+	if not can_run_concurrently(item) or not can_run_concurrently(batch[0]):
+		return False
+	if _get_warning_filters(item) != _get_warning_filters(batch[0]):
+		return False
+	return not any(manager.depends_on(item, other) for other in batch)
+
+
+def get_batches(manager, items, size):
+	"""
+	Split the tests into batches of at most the given size that can run concurrently, in order.
+
+	Tests that cannot run concurrently are in a batch of their own. Since the tests are ordered so they run after their
+	dependencies, a test that depends on a test in the current batch always starts a new batch.
+	"""
+	batch = []
+	for item in items:
+		if batch and not _fits_batch(manager, batch, item, size):
+			yield batch
+			batch = []
+		batch.append(item)
+	if batch:
+		yield batch
+
+
+def _call_and_report(item, when, **kwargs):
+	""" Run a phase of a test through its hook, and get the report without logging it yet. """
+	hook = getattr(item.ihook, f'pytest_runtest_{when}')
+	call = pytest.CallInfo.from_call(lambda: hook(item = item, **kwargs), when = when, reraise = RERAISE)
+	return item.ihook.pytest_runtest_makereport(item = item, call = call)
+
+
+class ThreadOutput(object):
+	"""
+	A replacement for sys.stdout or sys.stderr, which writes the output of the tests on the pool to their own buffer.
+
+	Output of other threads is written to the stream that was replaced.
+	"""
+
+	def __init__(self, name, local):
+		""" Create a new instance for the given name of the stream, using the buffers of the given thread local. """
+		self.name = name
+		self.local = local
+		self.stream = getattr(sys, name)
+
+	def write(self, text):  # noqa: D102
+		output = getattr(self.local, 'output', None)
+		if output is None:
+			return self.stream.write(text)
+		return output[self.name].write(text)
+
+	def __getattr__(self, name):  # noqa: D105
+		return getattr(self.stream, name)
+
+
+def _detach(item):
+	"""
+	Remove a test that was set up from the setup state of pytest, so the next test can be set up before it is torn down.
+
+	This returns a function that adds the test back again. Since the tests in a batch don't have fixtures of their own,
+	this leaves the fixtures that the test uses available.
+	"""
+	# This relies on the private setup state of the session, which keeps the nodes that are set up in a dict
+	stack = item.session._setupstate.stack
+	entry = stack.pop(item)
+	return lambda: stack.update({item: entry})
+
+
+class Batch(object):
+	"""
+	The hooks that run a batch of tests, calling the tests concurrently on an executor.
+
+	Pytest only runs one test at a time, so the tests are nested instead: the call of each test starts the test on the
+	executor, and then runs the protocol of the next test, as if it were part of the call, before waiting for the test
+	to complete. The protocol of the next test needs the current test to be torn down first, so the current test is
+	removed from the setup state of pytest for that time.
+
+	The capturing of output is switched on and off for each phase of each test, so the output of the tests on the pool
+	is kept separate by replacing sys.stdout and sys.stderr again after each switch, and added to the report of the
+	call of each test. Output that is written directly to the file descriptors is captured by pytest as usual, so it
+	ends up in the report of whichever test pytest reads it for.
+	"""
+
+	def __init__(self, executor, items):
+		""" Create a new instance for the given tests, which are run in the given order. """
+		self.executor = executor
+		self.items = items
+		# The position of the next test to start
+		self.position = 0
+		# The reports of each test, which are logged once all tests are done
+		self.reports = {}
+		# The buffers of the output of the tests on the pool, if output is captured
+		capturemanager = items[0].config.pluginmanager.getplugin('capturemanager')
+		self.capturing = capturemanager is not None and capturemanager.is_globally_capturing()
+		self.local = threading.local()
+		self.output = {}
+
+	def run(self, nextitem):
+		""" Run all tests in the batch, and log their reports in the usual order. """
+		try:
+			while self.position < len(self.items):
+				self._run_next(nextitem)
+		finally:
+			self._restore_output()
+		for item in self.items:
+			item.ihook.pytest_runtest_logstart(nodeid = item.nodeid, location = item.location)
+			for report in self.reports.get(item, ()):
+				item.ihook.pytest_runtest_logreport(report = report)
+			item.ihook.pytest_runtest_logfinish(nodeid = item.nodeid, location = item.location)
+
+	def _run_next(self, nextitem):
+		""" Run the next test in the batch through the protocol hook. """
+		item = self.items[self.position]
+		self.position += 1
+		item.ihook.pytest_runtest_protocol(item = item, nextitem = nextitem)
+
+	def _replace_output(self):
+		""" Replace sys.stdout and sys.stderr, if output is captured and they were switched since. """
+		if not self.capturing:
+			return
+		for name in ('stdout', 'stderr'):
+			if not isinstance(getattr(sys, name), ThreadOutput):
+				setattr(sys, name, ThreadOutput(name, self.local))
+
+	def _restore_output(self):
+		""" Restore the streams that sys.stdout and sys.stderr replaced. """
+		for name in ('stdout', 'stderr'):
+			stream = getattr(sys, name)
+			if isinstance(stream, ThreadOutput):
+				setattr(sys, name, stream.stream)
+
+	def _call_and_report(self, item, when, **kwargs):
+		""" Run a phase of a test, and replace the output streams that the capturing switched back afterwards. """
+		try:
+			return _call_and_report(item, when, **kwargs)
+		finally:
+			self._replace_output()
+
+	def _call_function(self, item):
+		""" Call the function of a test like pytest does, writing its output to its buffers, on the executor. """
+		self.local.output = self.output[item]
+		try:
+			item.obj(**{name: item.funcargs[name] for name in item._fixtureinfo.argnames})
+		finally:
+			self.local.output = None
+
+	@pytest.hookimpl(tryfirst = True)
+	def pytest_runtest_protocol(self, item, nextitem):  # noqa: D102
+		if item not in self.items or item in self.reports:
+			return None
+		if nextitem not in self.items and (item.session.shouldfail or item.session.shouldstop):
+			nextitem = None
+		reports = self.reports[item] = [self._call_and_report(item, 'setup')]
+		if reports[0].passed:
+			reports.append(self._call_and_report(item, 'call'))
+		reports.append(self._call_and_report(item, 'teardown', nextitem = nextitem))
+		return True
+
+	# Replace the output streams again once the capturing has been switched on for a phase
+	@pytest.hookimpl(hookwrapper = True, trylast = True)
+	def pytest_runtest_setup(self, item):  # noqa: D102
+		self._replace_output()
+		yield
+
+	@pytest.hookimpl(hookwrapper = True, trylast = True)
+	def pytest_runtest_call(self, item):  # noqa: D102
+		self._replace_output()
+		yield
+
+	@pytest.hookimpl(hookwrapper = True, trylast = True)
+	def pytest_runtest_teardown(self, item):  # noqa: D102
+		self._replace_output()
+		yield
+
+	@pytest.hookimpl(tryfirst = True)
+	def pytest_pyfunc_call(self, pyfuncitem):  # noqa: D102
+		if pyfuncitem not in self.reports:
+			return None
+		self.output[pyfuncitem] = {'stdout': io.StringIO(), 'stderr': io.StringIO()}
+		future = self.executor.submit(self._call_function, pyfuncitem)
+		# Run the protocol of the next tests nested in the call of this one, while this test runs. Tests that are not
+		# called (such as when they are skipped) don't start the tests after them, so these are started here as well.
+		restore = _detach(pyfuncitem)
+		try:
+			while self.position < len(self.items):
+				self._run_next(pyfuncitem)
+		finally:
+			restore()
+		try:
+			future.result()
+		finally:
+			for name, output in self.output[pyfuncitem].items():
+				if output.getvalue():
+					pyfuncitem.add_report_section('call', name, output.getvalue())
+		return True
+
+
+def run_tests(session, manager, workers):
+	""" Run all tests of a session, running batches of tests concurrently on the given number of threads. """
+	items = session.items
+	position = 0
+	with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+		for batch in get_batches(manager, items, workers):
+			position += len(batch)
+			nextitem = items[position] if position < len(items) else None
+			if len(batch) == 1:
+				batch[0].config.hook.pytest_runtest_protocol(item = batch[0], nextitem = nextitem)
+			else:
+				plugin = Batch(executor, batch)
+				session.config.pluginmanager.register(plugin)
+				try:
+					plugin.run(nextitem)
+				finally:
+					session.config.pluginmanager.unregister(plugin)
+			if session.shouldfail:
+				raise session.Failed(session.shouldfail)
+			if session.shouldstop:
+				raise session.Interrupted(session.shouldstop)
+	return True
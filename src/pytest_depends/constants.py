@@ -8,3 +8,13 @@ MARKER_KWARG_ID = 'name'
 
 # The name of the keyword argument for the marker that specifies the tests to depend on
 MARKER_KWARG_DEPENDENCIES = 'on'
+
+# The name of the keyword argument for the marker that gives an estimate of the duration of the test
+MARKER_KWARG_COST = 'cost'
+
+# The name of the keyword argument for the marker that marks a test as safe to run concurrently with other tests
+MARKER_KWARG_CONCURRENT = 'concurrent'
+
+# The prefixes of dependency names that are patterns matching multiple names, rather than a name to match exactly
+PATTERN_PREFIX_GLOB = 'glob:'
+PATTERN_PREFIX_REGEX = 're:'
@@ -0,0 +1,377 @@
+"""
+A module that provides support for running tests in parallel using pytest-xdist.
+
+Each worker has its own manager, and the controller process doesn't collect the tests, so it knows nothing about their
+dependencies. Information is exchanged through a directory that the controller passes to the workers when they are
+started. The workers write the dependency graph of their tests to it, so the controller can schedule the tests. The
+controller appends the results of all tests to a file in it, so the workers know the results of tests that ran on other
+workers.
+
+This requires the workers to share a filesystem with the controller, which is always the case for local workers.
+"""
+
+import array
+import heapq
+import json
+import os
+import shutil
+import tempfile
+
+from xdist.scheduler import LoadScheduling
+
+from pytest_depends.graph import Graph
+from pytest_depends.graph import NODE_TYPECODE
+
+
+# The keys of the workerinput dict that are used to pass the shared directory and whether to write the graph
+WORKERINPUT_DIRECTORY = 'depends_directory'
+WORKERINPUT_SCHEDULING = 'depends_scheduling'
+
+# The name of the file in the shared directory that contains the results
+RESULTS_FILE = 'results.ndjson'
+
+# The name of the file in the shared directory that the workers create if their tests use dependencies
+USED_FILE = 'used'
+
+# The steps of a test, of which the last one marks the completion of a test
+STEPS = ['setup', 'call', 'teardown']
+
+
+def _get_graph_path(directory, workerid):
+	""" Get the path of the file containing the dependency graph of the tests collected by a worker. """
+	return os.path.join(directory, f'graph-{workerid}.json')
+
+
+def configure_worker(config, manager):
+	""" Set up the exchange of information with the controller for the manager of a worker. """
+	directory = config.workerinput.get(WORKERINPUT_DIRECTORY)
+	if directory is None:
+		return
+	open(os.path.join(directory, USED_FILE), 'a').close()
+	manager.shared_results = SharedResults(os.path.join(directory, RESULTS_FILE))
+	if config.workerinput.get(WORKERINPUT_SCHEDULING):
+		write_graph(directory, config.workerinput['workerid'], manager)
+
+
+def write_graph(directory, workerid, manager):
+	""" Write the dependency graph of the tests collected by a worker, so the controller can schedule them. """
+	data = {'nodeids': [item.nodeid for item in manager.items], **manager.get_graph_data()}
+	path = _get_graph_path(directory, workerid)
+	with open(f'{path}.tmp', 'w') as f:
+		json.dump(data, f)
+	os.replace(f'{path}.tmp', path)
+
+
+def read_graph(directory, workerid):
+	""" Read the tests and their dependency graph as written by a worker, or None if it did not write them. """
+	try:
+		with open(_get_graph_path(directory, workerid), 'r') as f:
+			data = json.load(f)
+	except (IOError, ValueError):
+		return None
+	graph = Graph(array.array(NODE_TYPECODE, data['offsets']), array.array(NODE_TYPECODE, data['targets']))
+	return data['nodeids'], graph
+
+
+class SharedResults(object):
+	"""
+	The results of the tests as written by the controller, which is read by the workers.
+
+	The controller collects the results of all steps of a test, and appends a single line with all of them to the file
+	once the test has completed. The workers only read the file when they need a result that they don't know yet, and
+	then read everything that was added since the last time in one go.
+	"""
+
+	def __init__(self, path):
+		""" Create a new instance for the file with the given path. """
+		self.path = path
+		self.offset = 0
+
+	def update(self, manager):
+		""" Register the results that were added since the last update on a manager, returning whether there were any. """
+		try:
+			with open(self.path, 'rb') as f:
+				f.seek(self.offset)
+				data = f.read()
+		except IOError:
+			return False
+
+		# Ignore a line that is still being written
+		data = data[:data.rfind(b'\n') + 1]
+		self.offset += len(data)
+		for line in data.splitlines():
+			nodeid, outcomes = json.loads(line.decode('utf-8'))
+			for when, outcome in outcomes.items():
+				manager.register_shared_result(nodeid, when, outcome)
+		return bool(data)
+
+
+class DependencyScheduling(LoadScheduling):
+	"""
+	Schedule each test once the tests it depends on have completed.
+
+	The tests are handed out in the order in which they were sorted by this plugin, but a test is only ready to be sent to
+	a worker once all of its dependencies have completed, so the worker finds their results in the shared results.
+	Completing a test releases the tests that depend on it. A test of which all remaining dependencies are pending on the
+	same worker can be sent to that worker as well, as each worker runs its tests in order.
+
+	A worker only starts a test once it has received the next one (or is shut down), as it needs to know the next test to
+	tear down the fixtures correctly. If no worker is running a test and no test can be sent, one of the workers that hold
+	back a test is shut down to run it, so the remaining tests can continue on the other workers.
+	"""
+
+	def __init__(self, config, log, directory):
+		""" Create a new instance, using the information written to the shared directory by the workers. """
+		super(DependencyScheduling, self).__init__(config, log)
+		self.directory = directory
+		self.graph_data = None
+		# The graph of the dependencies, with the node of each test in the collection (or None if it is not known), and
+		# the index in the collection of each node
+		self.graph = None
+		self.dependents = None
+		self.tests = None
+		self.indices = None
+		# The number of dependencies of each node that have not completed yet, and whether each node has completed
+		self.waiting = None
+		self.completed = None
+		# The worker that each test that has been sent but not completed yet is pending on
+		self.assigned = {}
+		# The indices of the tests that are ready to be sent, and the number of tests that have not been sent yet
+		self.ready = []
+		self.unsent = 0
+
+	@property
+	def tests_finished(self):
+		""" Whether all tests have been sent, and the workers only hold back their last test, if any. """
+		if not self.collection_is_completed or self.unsent:
+			return False
+		return all(len(pending) < 2 for pending in self.node2pending.values())
+
+	@property
+	def has_pending(self):
+		""" Whether there are tests that have not been sent yet, or that are pending on a worker. """
+		return bool(self.unsent) or any(self.node2pending.values())
+
+	def add_node_collection(self, node, collection):
+		""" Add the collection of a node, reading the dependency graph of the tests if it is not known yet. """
+		if self.graph_data is None:
+			self.graph_data = read_graph(self.directory, node.workerinput['workerid'])
+		super(DependencyScheduling, self).add_node_collection(node, collection)
+
+	def schedule(self):
+		""" Send the tests that are ready to the workers, after setting up the graph when this is first called. """
+		assert self.collection_is_completed
+		if self.collection is None:
+			if not self._check_nodes_have_same_collection():
+				self.log('**Different tests collected, aborting run**')
+				return
+			self.collection = next(iter(self.node2collection.values()))
+			self._setup_graph()
+		self._schedule_all()
+
+	def _setup_graph(self):
+		""" Find the tests of the collection in the graph, and the tests that are ready from the start. """
+		nodeids, self.graph = self.graph_data or ([], Graph.from_lists([]))
+		self.dependents = self.graph.reversed()
+		nodes = {nodeid: node for node, nodeid in enumerate(nodeids)}
+		self.tests = [nodes.get(nodeid) for nodeid in self.collection]
+		self.indices = {node: index for index, node in enumerate(self.tests) if node is not None}
+		self.waiting = [len(self.graph[node]) for node in range(len(self.graph))]
+		self.completed = bytearray(len(self.graph))
+		self.unsent = len(self.collection)
+
+		# Tests that are not in the collection never run, so they don't need to be waited for. Neither do groups that
+		# don't have any members.
+		self.ready = [index for index, node in enumerate(self.tests) if node is None or not self.waiting[node]]
+		for node in range(len(self.graph)):
+			if self.completed[node]:
+				continue
+			if (node < len(nodeids) and node not in self.indices) or (node >= len(nodeids) and not len(self.graph[node])):
+				self._complete(node)
+		heapq.heapify(self.ready)
+
+	def _complete(self, node):
+		""" Mark a node as completed, making the tests that no longer wait for any other tests ready. """
+		stack = [node]
+		while stack:
+			node = stack.pop()
+			self.completed[node] = True
+			for dependent in self.dependents[node]:
+				self.waiting[dependent] -= 1
+				if self.waiting[dependent]:
+					continue
+				if dependent in self.indices:
+					# Tests that were sent along with their dependencies are already pending on that worker
+					if dependent not in self.assigned:
+						heapq.heappush(self.ready, self.indices[dependent])
+				elif not self.completed[dependent]:
+					stack.append(dependent)
+
+	def _get_chain_worker(self, node):
+		""" Get the worker that all remaining dependencies of a node are pending on, or None if there is no such worker. """
+		worker = None
+		stack = [node]
+		seen = set()
+		while stack:
+			for dependency in self.graph[stack.pop()]:
+				if self.completed[dependency] or dependency in seen:
+					continue
+				seen.add(dependency)
+				if dependency not in self.indices:
+					# A group, of which the members that have not completed yet need to be pending on the worker
+					stack.append(dependency)
+				elif dependency not in self.assigned or (worker is not None and self.assigned[dependency] is not worker):
+					return None
+				else:
+					worker = self.assigned[dependency]
+		return worker
+
+	def _get_chain_tests(self, worker):
+		""" Get the indices of the tests that only wait for tests that are pending on a worker, in order. """
+		stack = [self.tests[index] for index in self.node2pending[worker] if self.tests[index] is not None]
+		seen = set(stack)
+		chain = []
+		while stack:
+			for dependent in self.dependents[stack.pop()]:
+				if dependent in seen:
+					continue
+				seen.add(dependent)
+				if dependent not in self.indices:
+					stack.append(dependent)
+				elif self.waiting[dependent] and dependent not in self.assigned:
+					if self._get_chain_worker(dependent) is worker:
+						chain.append(self.indices[dependent])
+		return sorted(chain)
+
+	def _send(self, worker, indices):
+		""" Send tests to a worker. """
+		for index in indices:
+			if self.tests[index] is not None:
+				self.assigned[self.tests[index]] = worker
+		self.unsent -= len(indices)
+		self.node2pending[worker].extend(indices)
+		worker.send_runtest_some(indices)
+
+	def check_schedule(self, node, duration = 0):
+		""" Send tests that are ready to a worker if it runs low on tests, or shut it down if all tests have been sent. """
+		if node.shutting_down:
+			return
+		if not self.unsent:
+			node.shutdown()
+			return
+
+		# Keep at least two tests pending, as a worker holds back its last test, and send more if many tests are ready
+		count = max(2, len(self.ready) // len(self.node2pending) // 2) - len(self.node2pending[node])
+		while count > 0:
+			indices = [heapq.heappop(self.ready) for _ in range(min(count, len(self.ready)))]
+			if not indices:
+				indices = self._get_chain_tests(node)[:count]
+				if not indices:
+					break
+			self._send(node, indices)
+			count -= len(indices)
+
+	def _schedule_all(self, first = None):
+		""" Send tests to all workers, starting with the given one, and make sure the remaining tests can be sent. """
+		workers = sorted(self.node2pending, key = lambda worker: worker is not first)
+		for worker in workers:
+			self.check_schedule(worker)
+
+		# If none of the workers is running a test, the remaining tests wait for tests that are held back on different
+		# workers, so shut one of these down to run its test
+		running = any(
+			len(pending) >= 2 or (pending and worker.shutting_down) for worker, pending in self.node2pending.items()
+		)
+		if self.unsent and not running:
+			holding = [worker for worker in workers if self.node2pending[worker]]
+			if holding:
+				holding[0].shutdown()
+
+	def mark_test_complete(self, node, item_index, duration = 0):
+		""" Mark a test as completed by a worker, and send the tests that are ready now. """
+		self.node2pending[node].remove(item_index)
+		test = self.tests[item_index]
+		if test is not None:
+			self.assigned.pop(test, None)
+			self._complete(test)
+		self._schedule_all(node)
+
+	def mark_test_pending(self, item):
+		""" Send a test again, for instance after the worker that was running it crashed. """
+		heapq.heappush(self.ready, self.collection.index(item))
+		self.unsent += 1
+		self._schedule_all()
+
+	def remove_node(self, node):
+		""" Remove a worker, sending its pending tests to the other workers if it crashed. """
+		pending = self.node2pending.pop(node)
+		if not pending:
+			return None
+
+		# The first test is the one that crashed, which completed as far as the tests that depend on it are concerned
+		crashed = pending.pop(0)
+		for index in [crashed] + pending:
+			test = self.tests[index]
+			if test is not None:
+				self.assigned.pop(test, None)
+		if self.tests[crashed] is not None:
+			self._complete(self.tests[crashed])
+		for index in pending:
+			if self.tests[index] is None or not self.waiting[self.tests[index]]:
+				heapq.heappush(self.ready, index)
+		self.unsent += len(pending)
+		self._schedule_all()
+		return self.collection[crashed]
+
+
+class ControllerPlugin(object):
+	""" The hooks for the controller process of pytest-xdist. """
+
+	def __init__(self, scheduling):
+		""" Create a new instance, optionally scheduling the tests based on their dependencies. """
+		self.scheduling = scheduling
+		self.directory = None
+		self.results_file = None
+		# Whether the tests use dependencies at all, which is checked once the first result comes in
+		self.used = None
+		# The outcomes of the steps of the tests that have started but not completed yet
+		self.outcomes = {}
+
+	def _setup_directory(self):
+		""" Create the shared directory, if this has not been done yet. """
+		if self.directory is None:
+			self.directory = tempfile.mkdtemp(prefix = 'pytest-depends-')
+
+	def pytest_configure_node(self, node):  # noqa: D102
+		self._setup_directory()
+		node.workerinput[WORKERINPUT_DIRECTORY] = self.directory
+		node.workerinput[WORKERINPUT_SCHEDULING] = bool(self.scheduling)
+
+	def pytest_xdist_make_scheduler(self, config, log):  # noqa: D102
+		if self.scheduling:
+			self._setup_directory()
+			return DependencyScheduling(config, log, self.directory)
+
+	def pytest_runtest_logreport(self, report):  # noqa: D102
+		if self.directory is None or report.when not in STEPS:
+			return
+		# All workers have collected their tests before any of them runs a test, so they have created the file by now if
+		# the tests use dependencies. If they don't, there is no need to share the results.
+		if self.used is None:
+			self.used = os.path.exists(os.path.join(self.directory, USED_FILE))
+			if self.used:
+				self.results_file = open(os.path.join(self.directory, RESULTS_FILE), 'ab')
+		if not self.used:
+			return
+		outcomes = self.outcomes.setdefault(report.nodeid, {})
+		outcomes[report.when] = report.outcome
+		if report.when == STEPS[-1]:
+			del self.outcomes[report.nodeid]
+			self.results_file.write(json.dumps([report.nodeid, outcomes]).encode('utf-8') + b'\n')
+			self.results_file.flush()
+
+	def pytest_unconfigure(self):  # noqa: D102
+		if self.results_file is not None:
+			self.results_file.close()
+		if self.directory is not None:
+			shutil.rmtree(self.directory, ignore_errors = True)
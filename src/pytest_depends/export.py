@@ -0,0 +1,121 @@
+"""
+A module to export the resolved dependency graph in machine-readable formats.
+
+The graph is written while iterating over the data of the manager, one record at a time, so exporting does not need a
+copy of the graph in memory, even for very large test suites. The format is chosen based on the extension of the file.
+"""
+
+import itertools
+import json
+import os
+
+
+# The kinds of records of the graph, in the order in which they are produced, with the key they are stored under in JSON
+SECTIONS = {
+	'test': 'tests',
+	'group': 'groups',
+	'edge': 'edges',
+	'unresolved': 'unresolved',
+}
+
+
+def encode(kind, record, typed = False):
+	"""
+	Encode a record as JSON, optionally including its kind as the type.
+
+	Edges make up most of the records of large graphs, and only contain integers, so these are formatted directly, which
+	is a lot faster than the json module.
+
+	>>> encode('edge', {'source': 1, 'target': 0}, True)
+	'{"type": "edge", "source": 1, "target": 0}'
+	"""
+	if kind == 'edge':
+		prefix = '"type": "edge", ' if typed else ''
+		return f'{{{prefix}"source": {record["source"]}, "target": {record["target"]}}}'
+	return json.dumps({'type': kind, **record} if typed else record)
+
+
+def write_json(records, f):
+	""" Write the records as a single JSON object, with a list of records per kind. """
+	f.write('{')
+	kinds = iter(SECTIONS)
+	current = None
+	separator = ''
+	# Finish with a record of no kind, which closes the remaining lists
+	for kind, record in itertools.chain(records, [(None, None)]):
+		# Close the list of the previous kind, and open the lists up to this kind, including those without records
+		while kind != current:
+			if current is not None:
+				f.write('\n\t]')
+			started = current is not None
+			current = next(kinds, None)
+			if current is not None:
+				f.write(f'{"," if started else ""}\n\t{json.dumps(SECTIONS[current])}: [')
+				separator = ''
+		if record is not None:
+			f.write(f'{separator}\n\t\t{encode(kind, record)}')
+			separator = ','
+	f.write('\n}\n')
+
+
+def write_ndjson(records, f):
+	""" Write the records as newline-delimited JSON, with one object per line and the kind in its type field. """
+	for kind, record in records:
+		f.write(f'{encode(kind, record, True)}\n')
+
+
+def _quote(text):
+	"""
+	Quote a string for the DOT language, which uses the same escapes as JSON for the characters that need them.
+
+	>>> _quote('test_a.py::test_foo[é]')
+	'"test_a.py::test_foo[é]"'
+	"""
+	return json.dumps(text, ensure_ascii = False)
+
+
+def write_dot(records, f):
+	""" Write the records as a graph in the DOT language of Graphviz, with the edges pointing to the dependencies. """
+	f.write('digraph dependencies {\n')
+	for kind, record in records:
+		if kind == 'test':
+			f.write(f'\t{record["id"]} [label={_quote(record["nodeid"])}];\n')
+		elif kind == 'group':
+			f.write(f'\t{record["id"]} [label={_quote(record["name"])}, shape=box];\n')
+		elif kind == 'edge':
+			f.write(f'\t{record["source"]} -> {record["target"]};\n')
+		else:
+			# Prefix the identifiers of unresolved names, so these don't clash with the numbers of the other nodes
+			node = _quote(f'unresolved:{record["name"]}')
+			f.write(f'\t{node} [label={_quote(record["name"])}, style=dashed, color=red];\n')
+			f.write(f'\t{record["test"]} -> {node} [style=dashed, color=red];\n')
+	f.write('}\n')
+
+
+# The supported formats, by the extension of the file
+WRITERS = {
+	'.json': write_json,
+	'.ndjson': write_ndjson,
+	'.jsonl': write_ndjson,
+	'.dot': write_dot,
+	'.gv': write_dot,
+}
+
+
+def get_writer(path):
+	""" Get the function that writes the records in the format that matches the extension of a file. """
+	extension = os.path.splitext(path)[1].lower()
+	if extension not in WRITERS:
+		raise ValueError(f'Unsupported format for {path}, use one of the extensions {", ".join(WRITERS)}')
+	return WRITERS[extension]
+
+
+def export(manager, path):
+	""" Write the resolved dependency graph of a manager to a file, in the format that matches its extension. """
+	writer = get_writer(path)
+	try:
+		f = open(path, 'w', encoding = 'utf-8')
+	except OSError as e:
+		raise ValueError(f'Could not write the dependency graph to {path}: {e.strerror}')
+	with f:
+		writer(manager.iter_graph(), f)
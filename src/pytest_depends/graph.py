@@ -0,0 +1,497 @@
+"""
+Graph algorithms used to order tests.
+
+The graphs are described by the number of nodes, which are identified by the integers 0 up to that number, and the
+dependencies of each of these nodes. This can be any sequence of sequences, such as a list of lists or a Graph.
+"""
+
+import array
+import collections
+import heapq
+
+
+# The typecode of the arrays used to store node identifiers
+NODE_TYPECODE = 'i'
+
+
+def zeros(count):
+	"""
+	Create an array for node identifiers of the given length, filled with zeros.
+
+	>>> zeros(3)
+	array('i', [0, 0, 0])
+	"""
+	return array.array(NODE_TYPECODE, bytes(array.array(NODE_TYPECODE).itemsize * count))
+
+
+class CycleError(ValueError):
+	""" The dependencies contain a cycle, so there is no order in which all of them are satisfied. """
+
+	def __init__(self, cycle):
+		""" Create a new instance for the given cycle, which starts and ends with the same node. """
+		super(CycleError, self).__init__(f'Dependency cycle: {" -> ".join(str(node) for node in cycle)}')
+		self.cycle = cycle
+
+
+class Graph(object):
+	"""
+	A directed graph stored in the compressed sparse row format.
+
+	The targets of the edges of all nodes are stored in a single array, with a second array containing the offset in the
+	first array at which the edges of each node start. This is a lot more compact than a separate container per node.
+
+	>>> graph = Graph.from_lists([[1, 2], [], [1]])
+	>>> len(graph), graph.edge_count
+	(3, 3)
+	>>> list(graph[0]), list(graph[1]), list(graph[2])
+	([1, 2], [], [1])
+	>>> [list(targets) for targets in graph.reversed()]
+	[[], [0, 2], [0]]
+	"""
+
+	def __init__(self, offsets, targets):
+		""" Create a new instance from the offsets (one per node + a final one) and the edge targets. """
+		self.offsets = offsets
+		self.targets = targets
+
+	@classmethod
+	def from_lists(cls, lists):
+		""" Create a new instance from a sequence containing the targets of the edges of each node. """
+		offsets = array.array(NODE_TYPECODE, [0])
+		targets = array.array(NODE_TYPECODE)
+		for node_targets in lists:
+			targets.extend(node_targets)
+			offsets.append(len(targets))
+		return cls(offsets, targets)
+
+	def __len__(self):
+		""" Get the number of nodes. """
+		return len(self.offsets) - 1
+
+	def __getitem__(self, node):
+		""" Get the targets of the edges of a node. """
+		return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+	@property
+	def edge_count(self):
+		""" The number of edges. """
+		return len(self.targets)
+
+	def reversed(self):
+		""" Get a graph with the direction of all edges reversed, with the targets of each node in ascending order. """
+		counts = zeros(len(self) + 1)
+		for target in self.targets:
+			counts[target + 1] += 1
+		for node in range(len(self)):
+			counts[node + 1] += counts[node]
+		offsets = array.array(NODE_TYPECODE, counts)
+		targets = zeros(len(self.targets))
+		for node in range(len(self)):
+			for target in self[node]:
+				targets[counts[target]] = node
+				counts[target] += 1
+		return Graph(offsets, targets)
+
+
+def topological_sort(dependencies):
+	"""
+	Sort the nodes so that each node comes after all of its dependencies.
+
+	The original order of the nodes is kept wherever the dependencies allow it: a node is only moved when it is needed
+	by a node that comes before it, in which case it is moved to right before the first such node. The dependencies of
+	a node are placed in the order in which they are given, so pass them in ascending order to retain the original
+	order for them as well.
+
+	This runs in O(nodes + edges) time.
+
+	>>> topological_sort([[], [], []])
+	[0, 1, 2]
+	>>> topological_sort([[2], [], []])
+	[2, 0, 1]
+	>>> topological_sort([[1], [0]])
+	Traceback (most recent call last):
+	...
+	pytest_depends.graph.CycleError: Dependency cycle: 0 -> 1 -> 0
+	"""
+	# The state of each node, 0 for unvisited, 1 for visiting (ie on the stack) and 2 for done
+	state = bytearray(len(dependencies))
+	order = []
+	for root in range(len(dependencies)):
+		if state[root]:
+			continue
+		state[root] = 1
+		stack = [(root, iter(dependencies[root]))]
+		while stack:
+			node, remaining = stack[-1]
+			for dependency in remaining:
+				if state[dependency] == 0:
+					state[dependency] = 1
+					stack.append((dependency, iter(dependencies[dependency])))
+					break
+				elif state[dependency] == 1:
+					path = [entry[0] for entry in stack]
+					raise CycleError(path[path.index(dependency):] + [dependency])
+			else:
+				stack.pop()
+				state[node] = 2
+				order.append(node)
+	return order
+
+
+def connected_components(graph):
+	"""
+	Get the weakly connected components of a graph, ie the groups of nodes that are connected by any path of edges.
+
+	The components are numbered in the order of their first node, and the result contains the number of the component
+	of each node.
+
+	>>> connected_components(Graph.from_lists([[], [3], [0], [], []]))
+	array('i', [0, 1, 0, 1, 2])
+	"""
+	# Use a union-find structure to merge the components of the nodes of each edge
+	parents = array.array(NODE_TYPECODE, range(len(graph)))
+
+	def find(node):
+		while parents[node] != node:
+			parents[node] = parents[parents[node]]
+			node = parents[node]
+		return node
+
+	for node in range(len(graph)):
+		for target in graph[node]:
+			root, target_root = find(node), find(target)
+			if root != target_root:
+				parents[max(root, target_root)] = min(root, target_root)
+
+	# Number the components, which have the first node as root because of the merging by lowest node
+	components = zeros(len(graph))
+	count = 0
+	for node in range(len(graph)):
+		root = find(node)
+		if root == node:
+			components[node] = count
+			count += 1
+		else:
+			components[node] = components[root]
+	return components
+
+
+def get_path_weights(graph, order, weights):
+	"""
+	Get the weight of the heaviest path from each node through the nodes that depend on it.
+
+	This is the total weight of the longest chain of nodes that can only start once the node has finished, including the
+	node itself. The order must be a topological order of the graph, such as the one from topological_sort.
+
+	>>> graph = Graph.from_lists([[], [0], [0], [2]])
+	>>> get_path_weights(graph, [0, 1, 2, 3], [1.0, 5.0, 1.0, 2.0])
+	[6.0, 5.0, 3.0, 2.0]
+	"""
+	path_weights = list(weights)
+	for node in reversed(order):
+		for dependency in graph[node]:
+			path_weights[dependency] = max(path_weights[dependency], weights[dependency] + path_weights[node])
+	return path_weights
+
+
+def _peek(heap, placed):
+	""" Get the first node of a heap that has not been placed yet, dropping the placed nodes before it, or None. """
+	while heap and placed[heap[0]]:
+		heapq.heappop(heap)
+	return heap[0] if heap else None
+
+
+def _next_scoped(current, ready, complete, placed):
+	""" Get the next node for scope_sort, given the scope of the previous node, or None if no node is ready. """
+	for length in range(len(current), -1, -1):
+		prefix = current[:length]
+		# Prefer finishing a scope when leaving the current one
+		if length < len(current) or not length:
+			heap = complete.get(prefix)
+			while heap:
+				node = _peek(ready[heap[0][1]], placed)
+				if node is not None:
+					return node
+				heapq.heappop(heap)
+		node = _peek(ready.get(prefix), placed)
+		if node is not None:
+			return node
+	return None
+
+
+def scope_sort(graph, scopes):
+	"""
+	Sort the nodes so that each node comes after all of its dependencies, keeping the nodes of the same scope together.
+
+	The scope of each node is a tuple of keys from the outermost to the innermost scope, or None for nodes that should be
+	placed as soon as all of their dependencies have been placed, without changing the current scope. Whenever there is
+	a choice, the next node is one in the same scope as the previous node. When that scope has no nodes left that are
+	ready, the next node is taken from the innermost scope around it that does, preferring a scope of which all nodes
+	are ready, as that scope can then be finished without having to return to it later. Ties are broken by the original
+	order. The graph must be a Graph. This runs in O((nodes + edges) * depth * log(nodes)) time, where depth is the
+	number of keys in a scope.
+
+	>>> scope_sort(Graph.from_lists([[], [2], [], []]), [('a',), ('a',), ('b',), ('b',)])
+	[2, 3, 0, 1]
+	>>> scope_sort(Graph.from_lists([[], [2], [], [1]]), [('a',), ('a',), ('b',), ('b',)])
+	[0, 2, 1, 3]
+	"""
+	dependents = graph.reversed()
+	remaining = [len(graph[node]) for node in range(len(graph))]
+	placed = bytearray(len(graph))
+	# A heap of the nodes that are ready for each scope, including the outer ones, which may contain nodes that have
+	# been placed already through another scope
+	ready = collections.defaultdict(list)
+	# The number of nodes of each scope that are not ready yet, and a heap of the scopes of which all nodes are ready for
+	# each scope around them, by their first node
+	waiting = collections.Counter(scope for scope in scopes if scope is not None)
+	complete = collections.defaultdict(list)
+	unscoped = []
+	new = [node for node in range(len(graph)) if not remaining[node]]
+	current = ()
+	order = []
+	while True:
+		for node in new:
+			scope = scopes[node]
+			if scope is None:
+				unscoped.append(node)
+				continue
+			for length in range(len(scope) + 1):
+				heapq.heappush(ready[scope[:length]], node)
+			waiting[scope] -= 1
+			if not waiting[scope]:
+				for length in range(len(scope)):
+					heapq.heappush(complete[scope[:length]], (_peek(ready[scope], placed), scope))
+		new = []
+
+		node = unscoped.pop() if unscoped else _next_scoped(current, ready, complete, placed)
+		if node is None:
+			break
+
+		if scopes[node] is not None:
+			current = scopes[node]
+		placed[node] = 1
+		order.append(node)
+		for dependent in dependents[node]:
+			remaining[dependent] -= 1
+			if not remaining[dependent]:
+				new.append(dependent)
+	if len(order) < len(graph):
+		# There is a cycle somewhere, let topological_sort find and report it
+		topological_sort(graph)
+	return order
+
+
+def count_scope_switches(scopes):
+	"""
+	Count the number of times that a scope is left when going through the given scopes in order.
+
+	Each scope is a tuple of keys from the outermost to the innermost scope, so moving to another class in the same module
+	counts as a single switch, while moving to another module counts as two switches if the previous test was in a
+	class. A scope that is left and entered again later is counted every time.
+
+	>>> count_scope_switches([('a', 'a::A'), ('a', 'a::A'), ('a',), ('b',), ('a',)])
+	3
+	"""
+	switches = 0
+	for previous, scope in zip(scopes, scopes[1:]):
+		common = 0
+		while common < min(len(previous), len(scope)) and previous[common] == scope[common]:
+			common += 1
+		switches += len(previous) - common
+	return switches
+
+
+class ReachabilityIndex(object):
+	"""
+	An index of which nodes can be reached from each node, in both directions, for quick queries of transitive edges.
+
+	The nodes that can be reached from a node are stored as a bitset, using an integer. Each node only reaches nodes in
+	its own connected component, so the bits are numbered per component, which keeps the bitsets small when the graph
+	consists of many small components. Only the nodes that are marked as counted get a bit, so other nodes (such as
+	nodes used to group others) are passed through but not reported. Building the index takes
+	O(nodes * edges / wordsize) time, after which checking whether a node reaches another takes constant time, and
+	counting the nodes reached from a node takes time linear in the size of its component.
+
+	The bitsets of a component take memory quadratic in its size, so components with more than BITSET_LIMIT counted
+	nodes don't get any. The nodes that a node in such a component reaches are searched for when needed instead, keeping
+	the results of the last SEARCH_CACHE_SIZE searches. The first count for such a node counts the nodes reached from
+	all these nodes at once, using bitsets of at most BITSET_LIMIT bits at a time.
+
+	>>> index = ReachabilityIndex(Graph.from_lists([[], [0], [1], []]), [0, 1, 2, 3])
+	>>> index.reaches(2, 0), index.reaches(0, 2), index.reaches(2, 3)
+	(True, False, False)
+	>>> index.get_reachable(2), index.get_reverse_reachable(0)
+	([0, 1], [1, 2])
+	>>> index.count_reachable(2), index.count_reverse_reachable(0)
+	(2, 2)
+	"""
+
+	# The maximum number of counted nodes in a component for which the bitsets are stored
+	BITSET_LIMIT = 4096
+
+	# The number of searches in components without bitsets of which the results are kept
+	SEARCH_CACHE_SIZE = 256
+
+	def __init__(self, graph, order, counted = None):
+		"""
+		Create a new instance for a graph, given a topological order of it, such as the one from topological_sort.
+
+		Counted contains whether each node should be reported, which defaults to all of them.
+		"""
+		if counted is None:
+			counted = [True] * len(graph)
+		components = connected_components(graph)
+
+		# Number the counted nodes per component, in topological order
+		self.bits = [-1] * len(graph)
+		self.nodes = [[] for _ in range(max(components, default = -1) + 1)]
+		self.components = components
+		for node in order:
+			if counted[node]:
+				self.bits[node] = len(self.nodes[components[node]])
+				self.nodes[components[node]].append(node)
+		self.large = [len(nodes) > self.BITSET_LIMIT for nodes in self.nodes]
+
+		# Merge the bitsets of the targets of each node into it, and of each node into the nodes pointing to it
+		self.reachable = [0] * len(graph)
+		for node in order:
+			if not self.large[components[node]]:
+				for target in graph[node]:
+					self.reachable[node] |= self._get_bitset(target, self.reachable)
+		self.reverse_reachable = [0] * len(graph)
+		for node in reversed(order):
+			if not self.large[components[node]]:
+				bitset = self._get_bitset(node, self.reverse_reachable)
+				for target in graph[node]:
+					self.reverse_reachable[target] |= bitset
+
+		# The data to search the large components with, if there are any
+		self.graph = graph
+		self.order = order
+		self.reversed_graph = graph.reversed() if any(self.large) else None
+		self.positions = {}
+		if self.reversed_graph is not None:
+			self.positions = {node: position for position, node in enumerate(order) if self.large[components[node]]}
+		self.searches = {}
+		self.counts = {}
+
+	def _get_bitset(self, node, bitsets):
+		""" Get the bitset of a node, including the node itself if it is counted. """
+		if self.bits[node] < 0:
+			return bitsets[node]
+		return bitsets[node] | (1 << self.bits[node])
+
+	def _get_nodes(self, node, bitset):
+		""" Get the nodes in a bitset of a node, in topological order. """
+		nodes = self.nodes[self.components[node]]
+		return [nodes[bit] for bit, value in enumerate(reversed(bin(bitset)[2:])) if value == '1']
+
+	def _search(self, node, reverse):
+		""" Get the counted nodes that can be reached from a node in a large component, in topological order. """
+		key = (node, reverse)
+		if key not in self.searches:
+			graph = self.reversed_graph if reverse else self.graph
+			seen = {node}
+			stack = [node]
+			while stack:
+				for target in graph[stack.pop()]:
+					if target not in seen:
+						seen.add(target)
+						stack.append(target)
+			found = sorted((target for target in seen if target != node and self.bits[target] >= 0), key = self.positions.get)
+			if len(self.searches) >= self.SEARCH_CACHE_SIZE:
+				del self.searches[next(iter(self.searches))]
+			self.searches[key] = (found, set(found))
+		return self.searches[key]
+
+	def _count(self, node, reverse):
+		""" Get the number of counted nodes that can be reached from a node in a large component. """
+		if reverse not in self.counts:
+			self.counts[reverse] = self._count_large(reverse)
+		return self.counts[reverse][node]
+
+	def _count_large(self, reverse):
+		""" Count the counted nodes that can be reached from each node in the large components. """
+		graph = self.reversed_graph if reverse else self.graph
+		order = reversed(self.order) if reverse else self.order
+		# Each node comes after the nodes it points to in this order
+		order = [node for node in order if self.large[self.components[node]]]
+		counts = zeros(len(graph))
+		low = 0
+		while order:
+			# Only look at the bits from low up to high in this pass, leaving out the components that don't have these
+			high = low + self.BITSET_LIMIT
+			order = [node for node in order if len(self.nodes[self.components[node]]) > low]
+			bitsets = {}
+			for node in order:
+				bitset = 0
+				for target in graph[node]:
+					bitset |= bitsets[target]
+					if low <= self.bits[target] < high:
+						bitset |= 1 << (self.bits[target] - low)
+				bitsets[node] = bitset
+				counts[node] += bin(bitset).count('1')
+			low = high
+		return counts
+
+	def reaches(self, node, target):
+		""" Whether there is a path from a node to a counted target node. """
+		if self.components[node] != self.components[target] or self.bits[target] < 0:
+			return False
+		if self.large[self.components[node]]:
+			return target in self._search(node, False)[1]
+		return bool(self.reachable[node] >> self.bits[target] & 1)
+
+	def get_reachable(self, node):
+		""" Get the counted nodes that can be reached from a node, in topological order. """
+		if self.large[self.components[node]]:
+			return list(self._search(node, False)[0])
+		return self._get_nodes(node, self.reachable[node])
+
+	def get_reverse_reachable(self, node):
+		""" Get the counted nodes from which a node can be reached, in topological order. """
+		if self.large[self.components[node]]:
+			return list(self._search(node, True)[0])
+		return self._get_nodes(node, self.reverse_reachable[node])
+
+	def count_reachable(self, node):
+		""" Get the number of counted nodes that can be reached from a node. """
+		if self.large[self.components[node]]:
+			return self._count(node, False)
+		return bin(self.reachable[node]).count('1')
+
+	def count_reverse_reachable(self, node):
+		""" Get the number of counted nodes from which a node can be reached. """
+		if self.large[self.components[node]]:
+			return self._count(node, True)
+		return bin(self.reverse_reachable[node]).count('1')
+
+
+def priority_sort(graph, priorities):
+	"""
+	Sort the nodes so that each node comes after all of its dependencies, picking the node with the highest priority.
+
+	Whenever there are multiple nodes of which all dependencies have been placed, the one with the highest priority is
+	placed first, with ties broken by the original order. The graph must be a Graph. This runs in
+	O((nodes + edges) * log(nodes)) time.
+
+	>>> priority_sort(Graph.from_lists([[], [0], []]), [1, 1, 2])
+	[2, 0, 1]
+	"""
+	dependents = graph.reversed()
+	remaining = [len(graph[node]) for node in range(len(graph))]
+	ready = [(-priorities[node], node) for node in range(len(graph)) if not remaining[node]]
+	heapq.heapify(ready)
+	order = []
+	while ready:
+		_, node = heapq.heappop(ready)
+		order.append(node)
+		for dependent in dependents[node]:
+			remaining[dependent] -= 1
+			if not remaining[dependent]:
+				heapq.heappush(ready, (-priorities[dependent], dependent))
+	if len(order) < len(graph):
+		# There is a cycle somewhere, let topological_sort find and report it
+		topological_sort(graph)
+	return order
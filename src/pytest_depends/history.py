@@ -0,0 +1,159 @@
+"""
+A module to record information about test runs in the pytest cache, for use in later runs.
+
+The information is recorded from the reports of the tests, which works both for regular runs and on the controller of
+pytest-xdist, where the reports of all workers end up. It is merged into the cache once the test session has finished.
+"""
+
+import glob
+import hashlib
+import os
+
+from pytest_depends.cache import get_file_fingerprint
+from pytest_depends.util import clean_nodeid
+
+
+# The key under which the durations of the tests are stored
+DURATIONS_KEY = 'depends/durations'
+
+# The key under which the number of runs and failures of the tests are stored
+OUTCOMES_KEY = 'depends/outcomes'
+
+# The key under which the tests that failed in their last run are stored, with the fingerprint of their file at the time
+FAILED_KEY = 'depends/failed'
+
+# The key under which the tests that passed in their last run are stored, with the fingerprint of their inputs then
+PASSED_KEY = 'depends/passed'
+
+
+def _load(config, key):
+	""" Get the data stored under a key in the cache, or an empty dict if there is none. """
+	cache = getattr(config, 'cache', None)
+	if cache is None:
+		return {}
+	return cache.get(key, {})
+
+
+def load_durations(config):
+	""" Get a mapping from node ids to the duration of the last run of the test, which is empty if there is none. """
+	return _load(config, DURATIONS_KEY)
+
+
+def load_failure_rates(config):
+	"""
+	Get a mapping from node ids to the estimated chance that the test fails, based on the previous runs.
+
+	The estimate starts at 0.5 for tests that never ran, and moves towards the fraction of failed runs as more runs are
+	recorded.
+	"""
+	return {nodeid: (failures + 1) / (runs + 2) for nodeid, (runs, failures) in _load(config, OUTCOMES_KEY).items()}
+
+
+def get_test_file_fingerprint(config, nodeid):
+	""" Get the fingerprint of the file that defines the test with the given node id. """
+	return get_file_fingerprint(os.path.join(str(config.rootdir), nodeid.split('::')[0]))
+
+
+def load_failed(config):
+	"""
+	Get the node ids of the tests that failed in their last run, and that are still defined by the same file.
+
+	Tests of which the file has changed since may have been fixed, so these are not included.
+	"""
+	return {
+		nodeid
+		for nodeid, fingerprint in _load(config, FAILED_KEY).items()
+		if fingerprint == get_test_file_fingerprint(config, nodeid)
+	}
+
+
+def get_inputs_fingerprint(config):
+	"""
+	Get the fingerprint of the extra inputs of the tests that are configured using the reuse_passed_inputs option.
+
+	These are glob patterns relative to the root directory, such as build/* or migrations/**/*.sql.
+	"""
+	digest = hashlib.sha1()
+	for pattern in config.getini('reuse_passed_inputs'):
+		for path in sorted(glob.glob(os.path.join(str(config.rootdir), pattern), recursive = True)):
+			digest.update(f'{path}\0{get_file_fingerprint(path)}\0'.encode('utf-8'))
+	return digest.hexdigest()
+
+
+def load_passed(config):
+	"""
+	Get the node ids of the tests that passed in their last run, and of which none of the inputs have changed since.
+
+	The inputs are the file that defines the test and the extra inputs that are configured.
+	"""
+	inputs = get_inputs_fingerprint(config)
+	return {
+		nodeid
+		for nodeid, fingerprint in _load(config, PASSED_KEY).items()
+		if fingerprint == f'{get_test_file_fingerprint(config, nodeid)}:{inputs}'
+	}
+
+
+class HistoryRecorder(object):
+	""" The hooks that record the durations and outcomes of the tests. """
+
+	def __init__(self, config, record_passed = False):
+		"""
+		Create a new instance that stores the recorded information in the cache of the given config.
+
+		The tests that passed are only recorded if requested, as this needs the fingerprints of their inputs.
+		"""
+		self.config = config
+		self.record_passed = record_passed
+		self.durations = {}
+		# The tests that failed and that were skipped in any of their steps
+		self.failed = set()
+		self.skipped = set()
+
+	def pytest_runtest_logreport(self, report):  # noqa: D102
+		nodeid = clean_nodeid(report.nodeid)
+		self.durations[nodeid] = self.durations.get(nodeid, 0.0) + report.duration
+		if report.failed:
+			self.failed.add(nodeid)
+		elif report.skipped:
+			self.skipped.add(nodeid)
+
+	def pytest_sessionfinish(self):  # noqa: D102
+		cache = getattr(self.config, 'cache', None)
+		if cache is None or not self.durations:
+			return
+		# Tests that were skipped didn't really run, so their durations would replace the real ones with almost nothing
+		durations = load_durations(self.config)
+		durations.update(
+			(nodeid, duration)
+			for nodeid, duration in self.durations.items()
+			if nodeid not in self.skipped or nodeid in self.failed
+		)
+		cache.set(DURATIONS_KEY, durations)
+
+		# For the same reason, they don't say anything about how likely they are to fail
+		outcomes = _load(self.config, OUTCOMES_KEY)
+		for nodeid in self.durations:
+			if nodeid in self.skipped and nodeid not in self.failed:
+				continue
+			runs, failures = outcomes.get(nodeid, (0, 0))
+			outcomes[nodeid] = [runs + 1, failures + (nodeid in self.failed)]
+		cache.set(OUTCOMES_KEY, outcomes)
+
+		failed = _load(self.config, FAILED_KEY)
+		for nodeid in self.durations:
+			if nodeid in self.failed:
+				failed[nodeid] = get_test_file_fingerprint(self.config, nodeid)
+			else:
+				failed.pop(nodeid, None)
+		cache.set(FAILED_KEY, failed)
+
+		if self.record_passed:
+			inputs = get_inputs_fingerprint(self.config)
+			passed = _load(self.config, PASSED_KEY)
+			for nodeid in self.durations:
+				if nodeid in self.failed or nodeid in self.skipped:
+					passed.pop(nodeid, None)
+				else:
+					passed[nodeid] = f'{get_test_file_fingerprint(self.config, nodeid)}:{inputs}'
+			cache.set(PASSED_KEY, passed)
@@ -1,5 +1,3 @@
-# -*- coding: future_fstrings -*-
-
 """
 A module to manage dependencies between pytest tests.
 
@@ -7,30 +5,103 @@ This module provides the methods implementing the main logic. These are used in
 __init__.py.
 """
 
+import array
 import collections
-
-import colorama
-import networkx
-
-from pytest_depends.constants import MARKER_NAME
-from pytest_depends.constants import MARKER_KWARG_DEPENDENCIES
-from pytest_depends.util import as_list
+import collections.abc
+import itertools
+
+from pytest_depends.graph import count_scope_switches
+from pytest_depends.graph import CycleError
+from pytest_depends.graph import get_path_weights
+from pytest_depends.graph import Graph
+from pytest_depends.graph import NODE_TYPECODE
+from pytest_depends.graph import priority_sort
+from pytest_depends.graph import ReachabilityIndex
+from pytest_depends.graph import scope_sort
+from pytest_depends.graph import topological_sort
+from pytest_depends.graph import zeros
+from pytest_depends.patterns import is_pattern
+from pytest_depends.patterns import PatternIndex
+from pytest_depends.profiling import NullContext
 from pytest_depends.util import clean_nodeid
 from pytest_depends.util import get_absolute_nodeid
-from pytest_depends.util import get_markers
-from pytest_depends.util import get_names
+from pytest_depends.util import get_nodeid_names
+from pytest_depends.util import get_nodeid_scope
+from pytest_depends.util import MarkerCache
 
 
-class TestResult(object):
-	""" Keeps track of the results of a single test. """
+# A result of a step of a test that was not reported in this process, such as one that ran in another process or in a
+# previous run, with the attributes of a report that are used here
+SharedResult = collections.namedtuple('SharedResult', ['when', 'outcome'])
+
+
+class ResultStore(object):
+	"""
+	The results of all steps of a number of tests, stored in compact arrays.
+
+	Each outcome is stored as a small integer code, with a byte for each step of each test, and whether each test
+	succeeded or failed is kept up to date as results come in, so these don't need to be derived from the outcomes.
+	"""
 
 	STEPS = ['setup', 'call', 'teardown']
 	GOOD_OUTCOMES = ['passed']
 
-	def __init__(self, nodeid):
-		""" Create a new instance for a test with a given node id. """
+	# The code for a step that has not been run yet, which is followed by the codes of the known outcomes
+	NOT_RUN = 0
+	OUTCOMES = ['passed', 'failed', 'skipped']
+
+	def __init__(self, count):
+		""" Create a new instance for the given number of tests. """
+		self.outcomes = [None] + self.OUTCOMES
+		self.codes = {outcome: code for code, outcome in enumerate(self.outcomes)}
+		self.good_codes = {self.codes[outcome] for outcome in self.GOOD_OUTCOMES}
+		self.step_indices = {step: index for index, step in enumerate(self.STEPS)}
+		self.steps = bytearray(count * len(self.STEPS))
+		self.success = bytearray(count)
+		self.failed = bytearray(count)
+
+	def _get_code(self, outcome):
+		""" Get the code of an outcome, adding it to the known outcomes if needed. """
+		code = self.codes.get(outcome)
+		if code is None:
+			code = self.codes[outcome] = len(self.outcomes)
+			self.outcomes.append(outcome)
+		return code
+
+	def register(self, index, when, outcome):
+		""" Register the outcome of a step of the test with the given index. """
+		offset = index * len(self.STEPS)
+		self.steps[offset + self.step_indices[when]] = self._get_code(outcome)
+		codes = self.steps[offset:offset + len(self.STEPS)]
+		self.success[index] = all(code in self.good_codes for code in codes)
+		self.failed[index] = any(code != self.NOT_RUN and code not in self.good_codes for code in codes)
+
+	def get_outcomes(self, index):
+		""" Get a dict with the outcomes of the steps of the test with the given index that have been run. """
+		offset = index * len(self.STEPS)
+		return {
+			step: self.outcomes[code]
+			for step, code in zip(self.STEPS, self.steps[offset:offset + len(self.STEPS)])
+			if code != self.NOT_RUN
+		}
+
+
+class TestResult(object):
+	""" Keeps track of the results of a single test, as a view on a ResultStore. """
+
+	STEPS = ResultStore.STEPS
+	GOOD_OUTCOMES = ResultStore.GOOD_OUTCOMES
+
+	def __init__(self, nodeid, store = None, index = 0):
+		""" Create a new instance for a test with a given node id, with its own store unless one is given. """
 		self.nodeid = nodeid
-		self.results = {}
+		self._store = ResultStore(1) if store is None else store
+		self._index = index
+
+	@property
+	def results(self):  # noqa: D401
+		""" A dict with the outcomes of the steps that have been run. """
+		return self._store.get_outcomes(self._index)
 
 	def register_result(self, result):
 		""" Register a result of this test. """
@@ -39,49 +110,260 @@ class TestResult(object):
 		if result.when in self.results:
 			pass # bypass xdist internal error
 			# raise AttributeError(f'Received multiple results for step {result.when} of test {self.nodeid}')
-		self.results[result.when] = result.outcome
+		self._store.register(self._index, result.when, result.outcome)
 
 	@property
 	def success(self):
 		""" Whether the entire test was successful. """
-		return all(self.results.get(step, None) in self.GOOD_OUTCOMES for step in self.STEPS)
+		return bool(self._store.success[self._index])
+
+	@property
+	def failed(self):
+		""" Whether any step of the test that has been run was not successful. """
+		return bool(self._store.failed[self._index])
+
+
+class _Results(collections.abc.Mapping):
+	""" A read-only mapping from node ids to the results of the tests, as a view on the data of the manager. """
+
+	def __init__(self, manager):
+		self._manager = manager
+
+	def __getitem__(self, nodeid):
+		return TestResult(nodeid, self._manager._results, self._manager._indices[nodeid])
+
+	def __iter__(self):
+		return iter(self._manager._indices)
+
+	def __len__(self):
+		return len(self._manager._indices)
 
 
 class TestDependencies(object):
-	""" Information about the resolved dependencies of a single test. """
-
-	def __init__(self, item, manager):
-		""" Create a new instance for a given test. """
-		self.nodeid = clean_nodeid(item.nodeid)
-		self.dependencies = set()
-		self.unresolved = set()
-
-		markers = get_markers(item, MARKER_NAME)
-		dependencies = [dep for marker in markers for dep in as_list(marker.kwargs.get(MARKER_KWARG_DEPENDENCIES, []))]
-		for dependency in dependencies:
-			# If the name is not known, try to make it absolute (ie file::[class::]method)
-			if dependency not in manager.name_to_nodeids:
-				absolute_dependency = get_absolute_nodeid(dependency, self.nodeid)
-				if absolute_dependency in manager.name_to_nodeids:
-					dependency = absolute_dependency
-
-			# Add all items matching the name
-			if dependency in manager.name_to_nodeids:
-				for nodeid in manager.name_to_nodeids[dependency]:
-					self.dependencies.add(nodeid)
-			else:
-				self.unresolved.add(dependency)
+	""" Information about the resolved dependencies of a single test, as a view on the data of the manager. """
+
+	def __init__(self, manager, index):
+		""" Create a new instance for the test with a given index. """
+		self._manager = manager
+		self._index = index
+
+	@property
+	def nodeid(self):  # noqa: D401
+		""" The node id of the test. """
+		return self._manager._nodeids[self._index]
+
+	@property
+	def dependencies(self):  # noqa: D401
+		""" The node ids of the tests this test depends on. """
+		manager = self._manager
+		return {
+			manager._nodeids[member]
+			for dependency in manager._graph[self._index]
+			for member in manager._get_members(dependency)
+		}
+
+	@property
+	def unresolved(self):  # noqa: D401
+		""" The dependency names that could not be resolved, apart from those of tests that passed before. """
+		manager = self._manager
+		return set(manager._unresolved.get(self._index, ())) - manager._reused_names.get(self._index, set())
+
+	@property
+	def ambiguous(self):  # noqa: D401
+		"""
+		The dependency names that could refer to another node as a relative name.
+
+		This is a mapping from these names to the name of that other node.
+		"""
+		manager = self._manager
+		return {name: manager._get_node_name(node) for name, node in manager._ambiguous.get(self._index, ())}
+
+
+class _NameToNodeids(collections.abc.Mapping):
+	""" A read-only mapping from names to the matching node ids, as a view on the data of the manager. """
+
+	def __init__(self, manager):
+		self._manager = manager
+
+	def __getitem__(self, name):
+		nodeids = self._manager._nodeids
+		return [nodeids[index] for index in self._manager._get_members(self._manager._names[name])]
+
+	def __iter__(self):
+		return iter(self._manager._names)
+
+	def __len__(self):
+		return len(self._manager._names)
+
+
+class _NodeidToItem(collections.abc.Mapping):
+	""" A read-only mapping from node ids to test items, as a view on the data of the manager. """
+
+	def __init__(self, manager):
+		self._manager = manager
+
+	def __getitem__(self, nodeid):
+		return self._manager._items[self._manager._indices[nodeid]]
+
+	def __iter__(self):
+		return iter(self._manager._indices)
+
+	def __len__(self):
+		return len(self._manager._indices)
+
+
+class _Dependencies(collections.abc.Mapping):
+	""" A read-only mapping from node ids to the dependencies of the tests, as a view on the data of the manager. """
+
+	def __init__(self, manager):
+		self._manager = manager
+
+	def __getitem__(self, nodeid):
+		return TestDependencies(self._manager, self._manager._indices[nodeid])
+
+	def __iter__(self):
+		return iter(self._manager._indices)
+
+	def __len__(self):
+		return len(self._manager._indices)
+
+
+class _PatternGroup(object):
+	"""
+	The tests that a dependency pattern matches, as a tree of group nodes that is shared by all tests using the pattern.
+
+	A test that uses a pattern doesn't depend on itself or on the groups that contain it, so each test can depend on
+	slightly different tests. Rather than a group of all remaining tests for each of these, the matching tests are split
+	in halves recursively, and each test depends on the few parts of this tree that cover the tests it depends on.
+	"""
+
+	def __init__(self, manager, pattern, nodes, groups, group_members):
+		"""
+		Create a new instance for a pattern that matches the names of the given nodes.
+
+		New group nodes are added to the given groups and their members to group_members, as in the items setter of the
+		DependencyManager.
+		"""
+		self._manager = manager
+		self._pattern = pattern
+		self._groups = groups
+		self._group_members = group_members
+		self.nodes = nodes
+		# The number of matching nodes that each test is a member of, so the tests that are only matched through the
+		# excluded nodes can be found without looking at the other nodes
+		self._counts = collections.Counter()
+		for node in nodes:
+			self._counts.update(self._get_members(node))
+		self._members = sorted(self._counts)
+		self._positions = {member: position for position, member in enumerate(self._members)}
+		# The group nodes of the parts of the tree, by their range of positions in the members
+		self._parts = {}
+
+	def resolve(self, excluded):
+		""" Get the node for the pattern for a test that matches the given nodes itself, or None if nothing remains. """
+		removed = collections.Counter()
+		for node in excluded:
+			removed.update(self._get_members(node))
+		positions = sorted(self._positions[member] for member, count in removed.items() if count == self._counts[member])
+		nodes = []
+		start = 0
+		for position in positions + [len(self._members)]:
+			if start < position:
+				self._cover(0, len(self._members), start, position, nodes)
+			start = position + 1
+		if not nodes:
+			return None
+		if len(nodes) == 1:
+			return nodes[0]
+		return self._add_group(tuple(nodes))
+
+	def _get_members(self, node):
+		""" Get the members of a matching node, which is a test or a group of a name. """
+		if node < len(self._manager._nodeids):
+			return (node,)
+		return self._group_members[node - len(self._manager._nodeids)]
+
+	def _cover(self, low, high, start, stop, nodes):
+		""" Add the nodes of the parts within the part from low to high that together cover the range start to stop. """
+		if stop <= low or high <= start:
+			return
+		if start <= low and high <= stop:
+			nodes.append(self._get_part(low, high))
+			return
+		middle = (low + high) // 2
+		self._cover(low, middle, start, stop, nodes)
+		self._cover(middle, high, start, stop, nodes)
+
+	def _get_part(self, low, high):
+		""" Get the node of the part of the tree with the members from position low up to high. """
+		if high - low == 1:
+			return self._members[low]
+		if (low, high) not in self._parts:
+			middle = (low + high) // 2
+			self._parts[low, high] = self._add_group((self._get_part(low, middle), self._get_part(middle, high)))
+		return self._parts[low, high]
+
+	def _add_group(self, nodes):
+		""" Get the group node that depends on the given nodes, adding it to the groups if there is no such group yet. """
+		if nodes not in self._groups:
+			self._groups[nodes] = len(self._manager._nodeids) + len(self._groups)
+			self._group_members.append(nodes)
+			self._manager._group_names.append(self._pattern)
+		return self._groups[nodes]
 
 
 class DependencyManager(object):
-	""" Keep track of tests, their names and their dependencies. """
+	"""
+	Keep track of tests, their names and their dependencies.
+
+	Internally, the tests and the names are stored as nodes of a single compact graph. Each test is identified by its
+	index in the list of items. Each name that matches multiple tests (such as the name of a file) is a group node, which
+	is stored after the tests and depends on all matching tests. A test that depends on such a name gets a single edge to
+	the group, rather than an edge to each matching test. The tests that a pattern matches are a tree of groups instead,
+	see _PatternGroup. The mappings using node ids are only created at the edges of the API, as views on this data.
+	"""
+
+	# The maximum number of failed dependencies of a test that are named when summarizing them
+	SUMMARY_LIMIT = 3
 
 	def __init__(self):
 		""" Create a new DependencyManager. """
 		self.options = {}
+		# The Profiler that measures the phases of the manager, if profiling is enabled
+		self.profiler = None
+		# A source of results of tests that ran in other processes, with an update method that registers any new results
+		# on this manager and returns whether there were any
+		self.shared_results = None
 		self._items = None
-		self._name_to_nodeids = None
-		self._nodeid_to_item = None
+		# The node ids of the tests, and a mapping back to their index
+		self._nodeids = None
+		self._indices = None
+		# A mapping from names to the matching node, and a name for each group node
+		self._names = None
+		self._group_names = None
+		# A graph from each node to the nodes it depends on, and the reverse of this graph
+		self._graph = None
+		self._dependents = None
+		# The number of dependencies of each node that did not succeed (yet)
+		self._unsatisfied = None
+		# The number of dependencies of each node that failed, and the first few tests that caused these failures
+		self._failed_counts = None
+		self._failed_causes = None
+		# A mapping from test indices to the dependency names of that test that could not be resolved
+		self._unresolved = None
+		# A mapping from test indices to the dependency names of that test that could not be resolved, but that refer to
+		# tests that passed in a previous run and are thus not missing
+		self._reused_names = {}
+		# A mapping from test indices to the dependency names of that test that are ambiguous, with the node that the
+		# name would have referred to as a relative name
+		self._ambiguous = None
+		# A mapping from test indices to the estimated duration of that test given on the marker, if any
+		self._costs = None
+		# The indices of the tests in the order in which they should run
+		self._order = None
+		# The index of the tests that depend on each other transitively, which is created when first needed
+		self._reachability = None
+		# The results of the tests, by index
 		self._results = None
 
 	@property
@@ -93,57 +375,233 @@ class DependencyManager(object):
 
 	@items.setter
 	def items(self, items):
+		self._set_items(items)
+
+		# Parse the markers of all tests, sharing the work for markers of collectors such as modules and classes
+		with self.measure('markers'):
+			cache = MarkerCache()
+			markers = [cache.get(item) for item in items]
+			del cache
+
+		# Add the mappings from all names to the test indices
+		with self.measure('name_mapping'):
+			name_members = collections.defaultdict(list)
+			for index, nodeid in enumerate(self._nodeids):
+				names = get_nodeid_names(nodeid)
+				names.update(markers[index].names)
+				for name in names:
+					name_members[name].append(index)
+
+			# Turn the names that match multiple tests into group nodes, sharing a single group between names that match
+			# the same tests
+			self._names = {}
+			self._group_names = []
+			groups = {}
+			for name, members in name_members.items():
+				if len(members) == 1:
+					self._names[name] = members[0]
+					continue
+				members = tuple(members)
+				if members not in groups:
+					groups[members] = len(items) + len(groups)
+					self._group_names.append(name)
+				self._names[name] = groups[members]
+			del name_members
+
+		# Process the dependencies of the tests
+		# This uses the mappings created in the previous loop, and can thus not be merged into that loop
+		with self.measure('resolution'):
+			dependencies = []
+			lookups = 0
+			self._unresolved = {}
+			self._ambiguous = {}
+			self._costs = {}
+			# The resolved names, by name and scope, as all tests in the same scope resolve a name to the same node
+			# Patterns are not relative, but exclude the test itself, so these are stored by the pattern and the nodes
+			# of the test itself that the pattern matches
+			resolved_names = {}
+			# The index of all names to match patterns against, which is created when first needed, and the group of the
+			# tests that each pattern matches
+			pattern_index = None
+			pattern_groups = {}
+			# The nodes that each group node depends on, which are the members for the groups of names
+			group_members = list(groups)
+			for index, item_markers in enumerate(markers):
+				if item_markers.cost is not None:
+					self._costs[index] = item_markers.cost
+				nodeid = self._nodeids[index]
+				scope = nodeid.rsplit('::', 1)[0]
+				resolved = set()
+				# The nodes of the names of the test itself, which are the test and the groups that contain it
+				own_nodes = None
+				for dependency in item_markers.dependencies:
+					lookups += 1
+					if is_pattern(dependency):
+						if dependency not in pattern_groups:
+							if pattern_index is None:
+								pattern_index = PatternIndex(self._names)
+							nodes = {self._names[name] for name in pattern_index.match(dependency)}
+							pattern_groups[dependency] = _PatternGroup(self, dependency, nodes, groups, group_members)
+						if own_nodes is None:
+							names = get_nodeid_names(nodeid)
+							names.update(item_markers.names)
+							own_nodes = {self._names[name] for name in names}
+							own_nodes.add(index)
+						# Leave out the test itself and the groups that contain it, as it would depend on itself otherwise
+						excluded = tuple(sorted(own_nodes & pattern_groups[dependency].nodes))
+						key = (dependency, excluded)
+						if key not in resolved_names:
+							resolved_names[key] = (pattern_groups[dependency].resolve(excluded), None)
+					else:
+						key = (dependency, scope)
+						if key not in resolved_names:
+							resolved_names[key] = self._resolve_with_alternative(dependency, nodeid)
+					node, alternative = resolved_names[key]
+					if node is None:
+						self._unresolved.setdefault(index, []).append(dependency)
+					else:
+						resolved.add(node)
+					if alternative is not None:
+						self._ambiguous.setdefault(index, []).append([dependency, alternative])
+				dependencies.append(sorted(resolved))
+			dependencies.extend(groups)
+			self._graph = Graph.from_lists(dependencies)
+			self._prepare()
+
+		if self.profiler is not None:
+			self.profiler.count('lookups', lookups)
+			self.profiler.count('unique_lookups', len(resolved_names))
+			self._count_graph()
+
+	def _set_items(self, items):
+		""" Store the items and the data derived directly from them. """
 		if self._items is not None:
 			raise AttributeError('The items attribute has already been set')
-		self._items = items
-
-		self._name_to_nodeids = collections.defaultdict(list)
-		self._nodeid_to_item = {}
-		self._results = {}
-		self._dependencies = {}
-
-		for item in items:
-			nodeid = clean_nodeid(item.nodeid)
-			# Add the mapping from nodeid to the test item
-			self._nodeid_to_item[nodeid] = item
-			# Add the mappings from all names to the node id
-			for name in get_names(item):
-				self._name_to_nodeids[name].append(nodeid)
-			# Create the object that will contain the results of this test
-			self._results[nodeid] = TestResult(clean_nodeid(item.nodeid))
-
-		# Don't allow using unknown keys on the name_to_nodeids mapping
-		self._name_to_nodeids.default_factory = None
-
-		for item in items:
-			nodeid = clean_nodeid(item.nodeid)
-			# Process the dependencies of this test
-			# This uses the mappings created in the previous loop, and can thus not be merged into that loop
-			self._dependencies[nodeid] = TestDependencies(item, self)
+		self._items = list(items)
+
+		self._nodeids = [clean_nodeid(item.nodeid) for item in items]
+		self._indices = {nodeid: index for index, nodeid in enumerate(self._nodeids)}
+		self._results = ResultStore(len(self._nodeids))
+
+	def _prepare(self):
+		""" Prepare the data structures used while running the tests, once the graph is known. """
+		self._dependents = self._graph.reversed()
+		self._unsatisfied = zeros(len(self._graph))
+		for node in range(len(self._graph)):
+			self._unsatisfied[node] = self._graph.offsets[node + 1] - self._graph.offsets[node]
+		self._failed_counts = {}
+		self._failed_causes = {}
+		self._reachability = None
+
+	def measure(self, name):
+		""" Measure the time spent in a phase using the profiler, if profiling is enabled. """
+		return NullContext() if self.profiler is None else self.profiler.measure(name)
+
+	def _count_graph(self):
+		""" Add the size of the graph to the counts of the profiler. """
+		self.profiler.count('tests', len(self._nodeids))
+		self.profiler.count('groups', len(self._group_names))
+		self.profiler.count('names', len(self._names))
+		self.profiler.count('edges', self._graph.edge_count)
+		self.profiler.count('unresolved_names', sum(len(names) for names in self._unresolved.values()))
+
+	def dump(self):
+		"""
+		Get the resolved names and dependencies as a json-serializable dict.
+
+		This can be passed to load for the same items (in the same order) to skip resolving everything again.
+		"""
+		return {
+			'names': self._names,
+			'group_names': self._group_names,
+			'offsets': self._graph.offsets.tolist(),
+			'targets': self._graph.targets.tolist(),
+			'unresolved': [[index, names] for index, names in self._unresolved.items()],
+			'ambiguous': [[index, names] for index, names in self._ambiguous.items()],
+			'costs': [[index, cost] for index, cost in self._costs.items()],
+			'order': None if self._order is None else self._order.tolist(),
+		}
+
+	def load(self, items, data):
+		""" Set the items, using the resolved names and dependencies from a previous call to dump for these items. """
+		self._set_items(items)
+		self._names = data['names']
+		self._group_names = data['group_names']
+		self._graph = Graph(array.array(NODE_TYPECODE, data['offsets']), array.array(NODE_TYPECODE, data['targets']))
+		self._unresolved = {index: names for index, names in data['unresolved']}
+		self._ambiguous = {index: names for index, names in data['ambiguous']}
+		self._costs = {index: cost for index, cost in data['costs']}
+		if data['order'] is not None:
+			self._order = array.array(NODE_TYPECODE, data['order'])
+		self._prepare()
+
+		if self.profiler is not None:
+			self._count_graph()
+
+	def _get_members(self, node):
+		"""
+		Get the indices of the tests that a node consists of, which is just the node itself for tests.
+
+		The groups of patterns can depend on other groups, so these are followed until all members are found.
+		"""
+		if node < len(self._nodeids):
+			return (node,)
+		members = set()
+		stack = [node]
+		while stack:
+			for dependency in self._graph[stack.pop()]:
+				if dependency < len(self._nodeids):
+					members.add(dependency)
+				else:
+					stack.append(dependency)
+		return sorted(members)
+
+	def _get_node_name(self, node):
+		""" Get a human-readable name of a node. """
+		if node < len(self._nodeids):
+			return self._nodeids[node]
+		return self._group_names[node - len(self._nodeids)]
+
+	def _resolve_with_alternative(self, name, nodeid):
+		"""
+		Get the node for a dependency name of a test, and the node it would refer to as a relative name if that differs.
+
+		A name is first looked up as is, and only made absolute if that fails, so the second node is the one that loses
+		out when a name is ambiguous. This is None if the name is not ambiguous.
+		"""
+		node = self._names.get(name)
+		# Try to make the name absolute (ie file::[class::]method)
+		absolute = get_absolute_nodeid(name, nodeid)
+		if absolute == name:
+			return node, None
+		absolute_node = self._names.get(absolute)
+		if node is None:
+			return absolute_node, None
+		return node, None if absolute_node == node else absolute_node
 
 	@property
 	def name_to_nodeids(self):  # noqa: D401
 		""" A mapping from names to matching node id(s). """
 		assert self.items is not None
-		return self._name_to_nodeids
+		return _NameToNodeids(self)
 
 	@property
 	def nodeid_to_item(self):  # noqa: D401
 		""" A mapping from node ids to test items. """
 		assert self.items is not None
-		return self._nodeid_to_item
+		return _NodeidToItem(self)
 
 	@property
 	def results(self):  # noqa: D401
 		""" The results of the tests. """
 		assert self.items is not None
-		return self._results
+		return _Results(self)
 
 	@property
 	def dependencies(self):  # noqa: D401
 		""" The dependencies of the tests. """
 		assert self.items is not None
-		return self._dependencies
+		return _Dependencies(self)
 
 	def print_name_map(self, verbose = False):
 		""" Print a human-readable version of the name -> test mapping. """
@@ -166,8 +624,12 @@ class DependencyManager(object):
 	def print_processed_dependencies(self, colors = False):
 		""" Print a human-readable list of the processed dependencies. """
 		missing = 'MISSING'
+		ambiguous = 'AMBIGUOUS'
 		if colors:
+			import colorama
+
 			missing = f'{colorama.Fore.RED}{missing}{colorama.Fore.RESET}'
+			ambiguous = f'{colorama.Fore.YELLOW}{ambiguous}{colorama.Fore.RESET}'
 			colorama.init()
 		try:
 			print('Dependencies:')
@@ -177,6 +639,8 @@ class DependencyManager(object):
 					descriptions.append(dependency)
 				for dependency in info.unresolved:
 					descriptions.append(f'{dependency} ({missing})')
+				for dependency, alternative in info.ambiguous.items():
+					descriptions.append(f'{dependency} ({ambiguous}, not {alternative})')
 				if descriptions:
 					print(f'  {nodeid} depends on')
 					for description in sorted(descriptions):
@@ -185,41 +649,275 @@ class DependencyManager(object):
 			if colors:
 				colorama.deinit()
 
+	def iter_graph(self):
+		"""
+		Iterate over the resolved dependency graph as (kind, record) pairs, with a json-serializable dict as record.
+
+		This yields all tests, then all groups, then all edges and finally all names that could not be resolved, so the
+		kinds are never interleaved. Tests and groups are identified by their node in the graph, and each edge goes from a
+		node to a node it depends on. The records are created one at a time from the internal data, so the graph can be
+		written out without building a copy of it in memory.
+		"""
+		for index, nodeid in enumerate(self._nodeids):
+			record = {'id': index, 'nodeid': nodeid}
+			if index in self._costs:
+				record['cost'] = self._costs[index]
+			yield 'test', record
+		for offset, name in enumerate(self._group_names):
+			yield 'group', {'id': len(self._nodeids) + offset, 'name': name}
+		offsets = self._graph.offsets
+		targets = self._graph.targets
+		for node in range(len(self._graph)):
+			for position in range(offsets[node], offsets[node + 1]):
+				yield 'edge', {'source': node, 'target': targets[position]}
+		for index, names in self._unresolved.items():
+			for name in names:
+				yield 'unresolved', {'test': index, 'name': name}
+
 	@property
 	def sorted_items(self):
-		""" Get a sorted list of tests where all tests are sorted after their dependencies. """
-		# Build a directed graph for sorting
-		dag = networkx.DiGraph()
+		"""
+		Get a sorted list of tests where all tests are sorted after their dependencies.
+
+		The collection order is kept for all tests that don't need to be moved to satisfy a dependency.
+		"""
+		if self._order is None:
+			order = self._get_topological_order()
+			self._order = array.array(NODE_TYPECODE, (node for node in order if node < len(self.items)))
+		return [self.items[index] for index in self._order]
+
+	def _get_topological_order(self):
+		""" Get the nodes in the order of topological_sort, reporting cycles using the names of the nodes. """
+		try:
+			return topological_sort(self._graph)
+		except CycleError as e:
+			raise CycleError([self._get_node_name(node) for node in e.cycle])
+
+	def sort_by_critical_path(self, durations):
+		"""
+		Get a sorted list of tests where all tests are sorted after their dependencies, starting the longest chains first.
+
+		Each test is weighted by its duration from the given mapping of node ids to (historical) durations. For tests that
+		are not in this mapping, the cost given on the marker is used, or the median of the known durations if there is
+		none. Whenever there is a choice, the test with the heaviest chain of tests depending on it is placed first, so
+		the chain that determines the total duration of a parallel run starts as early as possible.
+		"""
+		known = sorted(durations[nodeid] for nodeid in self._nodeids if nodeid in durations)
+		default = known[len(known) // 2] if known else 1.0
+		weights = [
+			durations.get(nodeid, self._costs.get(index, default))
+			for index, nodeid in enumerate(self._nodeids)
+		]
+		weights.extend([0.0] * (len(self._graph) - len(self._nodeids)))
+
+		path_weights = get_path_weights(self._graph, self._get_topological_order(), weights)
+		order = priority_sort(self._graph, path_weights)
+		return [self.items[node] for node in order if node < len(self.items)]
+
+	def sort_by_scope(self):
+		"""
+		Get a sorted list of tests where all tests are sorted after their dependencies, keeping scopes together.
+
+		The scopes of a test are its directories, its file and its classes, which are also the scopes of the fixtures it can
+		use. Whenever there is a choice, the next test is one in the same scope as the previous test, so the fixtures of
+		such a scope are not torn down and set up again more often than the dependencies require. The collection order is
+		kept otherwise.
+		"""
+		# Check for cycles first, to report them using the names of the nodes
+		self._get_topological_order()
+		scopes = [get_nodeid_scope(nodeid) for nodeid in self._nodeids]
+		scopes.extend([None] * (len(self._graph) - len(self._nodeids)))
+		order = scope_sort(self._graph, scopes)
+		return [self.items[node] for node in order if node < len(self.items)]
+
+	def count_scope_switches(self, items):
+		""" Count the number of times a scope (a directory, file or class) is left when running the tests in order. """
+		return count_scope_switches([get_nodeid_scope(item.nodeid) for item in items])
+
+	@property
+	def reachability(self):
+		"""
+		The ReachabilityIndex of the dependency graph, in which only the tests are counted.
+
+		This is created when first needed, and may raise a CycleError if the dependencies contain a cycle.
+		"""
+		if self._reachability is None:
+			counted = [node < len(self._nodeids) for node in range(len(self._graph))]
+			self._reachability = ReachabilityIndex(self._graph, self._get_topological_order(), counted)
+		return self._reachability
+
+	def sort_by_impact(self, failure_rates):
+		"""
+		Get a sorted list of tests where all tests are sorted after their dependencies, running the most critical first.
+
+		Each test is scored by the number of tests that depend on it (directly or indirectly), weighted by its failure
+		rate from the given mapping of node ids to (historical) failure rates, or 0.5 for tests that are not in this
+		mapping. Whenever there is a choice, the test with the highest score is placed first, where dependencies inherit
+		the score of the tests that depend on them. This way, a failure that causes many other tests to be skipped is
+		found as early as possible.
+		"""
+		order = self._get_topological_order()
+		priorities = [
+			(self.reachability.count_reverse_reachable(node) + 1) * failure_rates.get(self._nodeids[node], 0.5)
+			if node < len(self._nodeids) else 0.0
+			for node in range(len(self._graph))
+		]
+		for node in reversed(order):
+			for dependency in self._graph[node]:
+				priorities[dependency] = max(priorities[dependency], priorities[node])
+
+		order = priority_sort(self._graph, priorities)
+		return [self.items[node] for node in order if node < len(self.items)]
+
+	def get_all_dependencies(self, items):
+		""" Get the tests that any of the given tests depend on (directly or indirectly), in collection order. """
+		nodes = set()
+		for item in items:
+			nodes.update(self.reachability.get_reachable(self._indices[clean_nodeid(item.nodeid)]))
+		return [self.items[node] for node in sorted(nodes)]
+
+	def get_dependents(self, items):
+		""" Get the tests that depend on any of the given tests (directly or indirectly), in collection order. """
+		nodes = set()
+		for item in items:
+			nodes.update(self.reachability.get_reverse_reachable(self._indices[clean_nodeid(item.nodeid)]))
+		return [self.items[node] for node in sorted(nodes)]
+
+	def depends_on(self, item, other):
+		""" Whether a test depends on another test, directly or indirectly. """
+		index = self._indices[clean_nodeid(item.nodeid)]
+		return self.reachability.reaches(index, self._indices[clean_nodeid(other.nodeid)])
 
-		# Insert all items as nodes, to prevent items that have no dependencies and are not dependencies themselves from
-		# being lost
-		dag.add_nodes_from(self.items)
+	def count_dependents(self, item):
+		""" Get the number of tests that depend on a test, directly or indirectly. """
+		return self.reachability.count_reverse_reachable(self._indices[clean_nodeid(item.nodeid)])
 
-		# Insert edges for all the dependencies
-		for item in self.items:
-			nodeid = clean_nodeid(item.nodeid)
-			for dependency in self.dependencies[nodeid].dependencies:
-				dag.add_edge(self.nodeid_to_item[dependency], item)
+	def get_graph_data(self):
+		"""
+		Get the graph of the dependencies as a json-serializable dict, in the compressed sparse row format.
 
-		# Return the sorted list
-		return networkx.topological_sort(dag)
+		The first nodes are the tests, in the same order as the items, and the remaining nodes are groups, which depend on
+		their members.
+		"""
+		return {'offsets': self._graph.offsets.tolist(), 'targets': self._graph.targets.tolist()}
 
 	def register_result(self, item, result):
 		""" Register a result of a test. """
+		self._register_result(clean_nodeid(item.nodeid), result)
+
+	def register_shared_result(self, nodeid, when, outcome):
+		""" Register a result of a test that ran in another process, ignoring tests that are not known here. """
+		nodeid = clean_nodeid(nodeid)
+		if nodeid in self._indices:
+			self._register_result(nodeid, SharedResult(when, outcome))
+
+	def register_reused_result(self, item):
+		""" Register a test as passed without running it, because it passed in a previous run. """
 		nodeid = clean_nodeid(item.nodeid)
-		self.results[nodeid].register_result(result)
+		for when in ResultStore.STEPS:
+			self._register_result(nodeid, SharedResult(when, 'passed'))
+
+	def register_reused_names(self, items, nodeids):
+		"""
+		Count the dependencies of tests that could not be resolved as passed, if they refer to one of the given node ids.
+
+		This is for dependencies that were not collected, but passed in a previous run. Returns the node ids that the
+		dependencies refer to.
+		"""
+		reused = set()
+		for item in items:
+			index = self._indices[clean_nodeid(item.nodeid)]
+			for name in self._unresolved.get(index, ()):
+				for nodeid in (name, get_absolute_nodeid(name, self._nodeids[index])):
+					if nodeid in nodeids:
+						self._reused_names.setdefault(index, set()).add(name)
+						reused.add(nodeid)
+						break
+		return reused
+
+	def has_succeeded(self, item):
+		""" Whether all steps of a test succeeded. """
+		return bool(self._results.success[self._indices[clean_nodeid(item.nodeid)]])
+
+	def _register_result(self, nodeid, result):
+		""" Register a result of the test with the given node id. """
+		if result.when not in ResultStore.STEPS:
+			raise ValueError(f'Received result for unknown step {result.when} of test {nodeid}')
+		index = self._indices[nodeid]
+		results = self._results
+		succeeded = results.success[index]
+		failed = results.failed[index]
+		results.register(index, result.when, result.outcome)
+
+		# Push the state change of this test to its dependents, once
+		if results.success[index] and not succeeded:
+			self._propagate_success(index)
+		elif results.failed[index] and not failed:
+			for dependent in self._dependents[index]:
+				self._propagate_failure(dependent, index)
+
+	def _propagate_success(self, node):
+		""" Update the dependents of a node that has succeeded, including groups that succeed because of this. """
+		for dependent in self._dependents[node]:
+			self._unsatisfied[dependent] -= 1
+			if dependent >= len(self._nodeids) and not self._unsatisfied[dependent]:
+				self._propagate_success(dependent)
+
+	def _propagate_failure(self, node, cause):
+		""" Update a node of which a dependency failed because of the test with the given index. """
+		count = self._failed_counts.get(node, 0)
+		self._failed_counts[node] = count + 1
+		if count < self.SUMMARY_LIMIT:
+			self._failed_causes.setdefault(node, []).append(cause)
+
+		# The first failure of a member of a group means that the group failed, so tell its dependents about this
+		if count == 0 and node >= len(self._nodeids):
+			for dependent in self._dependents[node]:
+				self._propagate_failure(dependent, cause)
 
 	def get_failed(self, item):
 		""" Get a list of unfulfilled dependencies for a test. """
-		nodeid = clean_nodeid(item.nodeid)
-		failed = []
-		for dependency in self.dependencies[nodeid].dependencies:
-			result = self.results[dependency]
-			if not result.success:
-				failed.append(dependency)
-		return failed
+		failed = {}
+		stack = list(reversed(self._graph[self._indices[clean_nodeid(item.nodeid)]]))
+		while stack:
+			dependency = stack.pop()
+			if dependency < len(self._nodeids):
+				if not self._results.success[dependency]:
+					failed[self._nodeids[dependency]] = None
+			# Skip dependencies that succeeded (including whole groups) without looking at the individual members
+			elif self._unsatisfied[dependency]:
+				stack.extend(reversed(self._graph[dependency]))
+		return list(failed)
+
+	def _is_pending(self, node):
+		""" Whether a node has neither succeeded nor failed yet. """
+		if node < len(self._nodeids):
+			return not self._results.success[node] and not self._results.failed[node]
+		return self._unsatisfied[node] > 0 and node not in self._failed_counts
+
+	def get_failed_summary(self, item):
+		"""
+		Get a short description of the unfulfilled dependencies for a test, or None if there are none.
+
+		This names at most SUMMARY_LIMIT of the dependencies, which are the ones that failed if there are any.
+		"""
+		index = self._indices[clean_nodeid(item.nodeid)]
+		unsatisfied = self._unsatisfied[index]
+		if not unsatisfied:
+			return None
+
+		# Name the tests that caused dependencies to fail, followed by dependencies that have not finished yet
+		names = [self._nodeids[cause] for cause in self._failed_causes.get(index, ())]
+		if len(names) < self.SUMMARY_LIMIT and self._failed_counts.get(index, 0) < unsatisfied:
+			pending = (dependency for dependency in self._graph[index] if self._is_pending(dependency))
+			names.extend(self._get_node_name(node) for node in itertools.islice(pending, self.SUMMARY_LIMIT - len(names)))
+		names = list(collections.OrderedDict.fromkeys(names))
+
+		summary = ', '.join(names)
+		if unsatisfied > len(names):
+			summary += f' and {unsatisfied - len(names)} more'
+		return summary
 
 	def get_missing(self, item):
 		""" Get a list of missing dependencies for a test. """
-		nodeid = clean_nodeid(item.nodeid)
-		return self.dependencies[nodeid].unresolved
+		return self.dependencies[clean_nodeid(item.nodeid)].unresolved
@@ -0,0 +1,121 @@
+"""
+A module to match patterns against the names of tests.
+
+Dependency names that start with glob: or re: are patterns, which match all names that match the glob pattern or the
+regular expression. Rather than checking each pattern against each name, the names are kept in sorted order, so only
+the names that start with the literal prefix of a pattern need to be checked.
+"""
+
+import bisect
+import fnmatch
+import re
+
+from pytest_depends.constants import PATTERN_PREFIX_GLOB
+from pytest_depends.constants import PATTERN_PREFIX_REGEX
+
+
+# The characters that have a special meaning in glob patterns and regular expressions
+GLOB_SPECIAL = re.compile(r'[*?\[]')
+REGEX_SPECIAL = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
+
+def is_pattern(name):
+	"""
+	Whether a dependency name is a pattern.
+
+	>>> is_pattern('glob:test_*.py'), is_pattern('re:test_.*'), is_pattern('test_file.py')
+	(True, True, False)
+	"""
+	return name.startswith(PATTERN_PREFIX_GLOB) or name.startswith(PATTERN_PREFIX_REGEX)
+
+
+def _has_top_level_alternative(regex):
+	""" Whether a regular expression contains a | that is not inside a group. """
+	depth = 0
+	escaped = False
+	in_class = False
+	for char in regex:
+		if escaped:
+			escaped = False
+		elif char == '\\':
+			escaped = True
+		elif in_class:
+			in_class = char != ']'
+		elif char == '[':
+			in_class = True
+		elif char == '(':
+			depth += 1
+		elif char == ')':
+			depth -= 1
+		elif char == '|' and depth == 0:
+			return True
+	return False
+
+
+def get_literal_prefix(pattern):
+	"""
+	Get the part at the start of a pattern that any name that matches it must start with.
+
+	>>> get_literal_prefix('glob:test_*.py')
+	'test_'
+	>>> get_literal_prefix('re:test_(a|b)')
+	'test_'
+	>>> get_literal_prefix('re:test_ab?')
+	'test_a'
+	>>> get_literal_prefix('re:test_a|other')
+	''
+	"""
+	if pattern.startswith(PATTERN_PREFIX_GLOB):
+		pattern = pattern[len(PATTERN_PREFIX_GLOB):]
+		match = GLOB_SPECIAL.search(pattern)
+		return pattern if match is None else pattern[:match.start()]
+
+	pattern = pattern[len(PATTERN_PREFIX_REGEX):]
+	# An alternative of the entire expression can start with anything, so there is no common prefix
+	if _has_top_level_alternative(pattern):
+		return ''
+	match = REGEX_SPECIAL.search(pattern)
+	if match is None:
+		return pattern
+	# A quantifier applies to the character before it, which is then no longer required
+	if match.group() in '*?{':
+		return pattern[:match.start() - 1]
+	return pattern[:match.start()]
+
+
+def compile_pattern(pattern):
+	""" Get a function that checks whether a name matches the entire pattern. """
+	if pattern.startswith(PATTERN_PREFIX_GLOB):
+		regex = fnmatch.translate(pattern[len(PATTERN_PREFIX_GLOB):])
+	else:
+		regex = f'(?:{pattern[len(PATTERN_PREFIX_REGEX):]})\\Z'
+	return re.compile(regex, re.DOTALL).match
+
+
+class PatternIndex(object):
+	r"""
+	An index of names to match patterns against.
+
+	>>> index = PatternIndex(['test_a.py', 'test_a.py::test_foo', 'test_b.py::test_foo', 'other.py'])
+	>>> index.match('glob:test_*.py::test_foo')
+	['test_a.py::test_foo', 'test_b.py::test_foo']
+	>>> index.match(r're:test_a\.py(::.*)?')
+	['test_a.py', 'test_a.py::test_foo']
+	"""
+
+	def __init__(self, names):
+		""" Create a new instance for the given names. """
+		self.names = sorted(names)
+
+	def match(self, pattern):
+		""" Get the names that match a pattern, in sorted order. """
+		prefix = get_literal_prefix(pattern)
+		matches = compile_pattern(pattern)
+		start = bisect.bisect_left(self.names, prefix)
+		result = []
+		for name in self.names[start:]:
+			if not name.startswith(prefix):
+				break
+			if matches(name):
+				result.append(name)
+		return result
@@ -0,0 +1,72 @@
+"""
+A module to measure the overhead of this plugin.
+
+The time spent in each phase of the plugin is measured, and some counts of the processed data are kept. These are shown
+in the terminal summary and written to a JSON file at the end of the test session.
+"""
+
+import contextlib
+import json
+import time
+
+
+class NullContext(object):
+	""" A context manager that does nothing, to use in place of a measurement when profiling is disabled. """
+
+	def __enter__(self):
+		""" Do nothing. """
+
+	def __exit__(self, *args):
+		""" Do nothing. """
+
+
+class Profiler(object):
+	""" Measures the time spent in the phases of this plugin, and counts the processed data. """
+
+	def __init__(self, path):
+		""" Create a new instance that writes the results to the file with the given path. """
+		self.path = path
+		# A mapping from phase names to the number of times they ran and the total time they took
+		self.timings = {}
+		self.counts = {}
+		# The reason why the results could not be written, if they couldn't
+		self.error = None
+
+	@contextlib.contextmanager
+	def measure(self, name):
+		""" Measure the time spent in a phase, for use as a context manager. """
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			calls, seconds = self.timings.get(name, (0, 0.0))
+			self.timings[name] = (calls + 1, seconds + time.perf_counter() - start)
+
+	def count(self, name, value = 1):
+		""" Increase a count by the given value. """
+		self.counts[name] = self.counts.get(name, 0) + value
+
+	def as_dict(self):
+		""" Get the results as a json-serializable dict. """
+		return {
+			'timings': {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in self.timings.items()},
+			'counts': dict(self.counts),
+		}
+
+	def pytest_terminal_summary(self, terminalreporter):  # noqa: D102
+		terminalreporter.write_sep('-', 'pytest-depends overhead')
+		for name, (calls, seconds) in self.timings.items():
+			terminalreporter.write_line(f'{seconds:10.4f}s {calls:8} calls  {name}')
+		for name, value in self.counts.items():
+			terminalreporter.write_line(f'{value:20}  {name}')
+		if self.error is None:
+			terminalreporter.write_line(f'Written to {self.path}')
+		else:
+			terminalreporter.write_line(f'Could not write to {self.path}: {self.error}', red = True)
+
+	def pytest_sessionfinish(self):  # noqa: D102
+		try:
+			with open(self.path, 'w') as f:
+				json.dump(self.as_dict(), f, indent = '\t')
+		except OSError as e:
+			self.error = e.strerror
@@ -0,0 +1,237 @@
+"""
+A module to select which of the collected tests to run, based on their dependencies.
+
+Tests that are not selected are removed from the list of tests and reported as deselected, just like pytest does for
+the -k and -m flags.
+"""
+
+import glob
+import os
+
+import pytest
+
+from pytest_depends.cache import get_item_path
+from pytest_depends.util import clean_nodeid
+
+
+def summarize(names, limit):
+	"""
+	Get a short description of a list of names, naming at most the given number of them.
+
+	>>> summarize(['a', 'b', 'c'], 2)
+	'a, b and 1 more'
+	"""
+	summary = ', '.join(names[:limit])
+	if len(names) > limit:
+		summary += f' and {len(names) - limit} more'
+	return summary
+
+
+def report(config, message, **markup):
+	""" Write a line to the terminal, below the collection progress, unless the terminal output is disabled. """
+	terminalreporter = config.pluginmanager.get_plugin('terminalreporter')
+	if terminalreporter is not None:
+		terminalreporter.write_line(message, **markup)
+
+
+def deselect(config, items, deselected):
+	""" Remove the deselected tests from the list of tests in place, and report them as deselected. """
+	nodeids = {item.nodeid for item in items}
+	deselected = [item for item in deselected if item.nodeid in nodeids]
+	if not deselected:
+		return
+	nodeids = {item.nodeid for item in deselected}
+	items[:] = [item for item in items if item.nodeid not in nodeids]
+	config.hook.pytest_deselected(items = deselected)
+
+
+def select(config, manager, collected, items):
+	"""
+	Select the tests from the full collection that are needed by the selected tests, or that need them, as requested.
+
+	The list of selected tests is replaced in place by these tests and the selected tests themselves, in the order of the
+	full collection. Dependencies that already succeeded (using the result of a previous run) are not added.
+	"""
+	selected = {item.nodeid for item in items}
+	extra = []
+	if manager.options['with_dependencies']:
+		extra.extend(item for item in manager.get_all_dependencies(items) if not manager.has_succeeded(item))
+	if manager.options['with_dependents']:
+		extra.extend(manager.get_dependents(items))
+	selected.update(item.nodeid for item in extra)
+	items[:] = [item for item in collected if item.nodeid in selected]
+
+
+def deselect_blocked(config, manager, items):
+	"""
+	Deselect the tests that depend on a test that failed in the previous run, and of which the file has not changed.
+
+	The failed tests themselves are still run, so they are recorded as passed again once they have been fixed.
+	"""
+	from pytest_depends.history import load_failed
+
+	failed = load_failed(config)
+	if not failed:
+		return
+	roots = [item for item in manager.items if clean_nodeid(item.nodeid) in failed]
+	blocked = manager.get_dependents(roots)
+	if blocked:
+		names = summarize([clean_nodeid(item.nodeid) for item in roots], manager.SUMMARY_LIMIT)
+		report(config, f'Deselected {len(blocked)} tests that depend on tests that failed in the previous run: {names}')
+	deselect(config, items, blocked)
+
+
+def reuse_passed(config, manager, items):
+	"""
+	Register the dependencies of the selected tests that are not selected themselves as passed, if they passed before.
+
+	This only applies to tests that passed in their last run, and of which none of the inputs have changed since.
+	Dependencies that were not collected at all (such as when passing a single node id to pytest) are counted as passed
+	as well if they refer to such a test by its node id.
+	"""
+	from pytest_depends.history import load_passed
+
+	passed = load_passed(config)
+	if not passed:
+		return
+	selected = {item.nodeid for item in items}
+	reused = [
+		item
+		for item in manager.get_all_dependencies(items)
+		if item.nodeid not in selected and clean_nodeid(item.nodeid) in passed
+	]
+	for item in reused:
+		manager.register_reused_result(item)
+	reused = [clean_nodeid(item.nodeid) for item in reused]
+	reused.extend(sorted(manager.register_reused_names(items, passed)))
+	if reused:
+		names = summarize(reused, manager.SUMMARY_LIMIT)
+		report(config, f'Reused the results of {len(reused)} dependencies that passed in the previous run: {names}')
+
+
+def select_changed(config, manager, items, changed):
+	"""
+	Deselect the tests that cannot be affected by changes to the given paths.
+
+	The tests that remain are those affected by the changes directly, and the tests that depend on these. The tests that
+	these need are added by selecting the dependencies of the selected tests, which the caller should enable.
+
+	If any of the changed paths does not belong to the tests, such as the code under test, it is not known which tests
+	are affected by it, so all tests are kept instead, and the files are reported.
+	"""
+	from pytest_depends.changes import ChangeMatcher
+
+	matcher = ChangeMatcher(changed)
+	unmapped = matcher.get_unmapped(manager.items)
+	if unmapped:
+		names = summarize([os.path.relpath(path, str(config.rootdir)) for path in unmapped], manager.SUMMARY_LIMIT)
+		message = f'Running all tests, as {len(unmapped)} changed files do not belong to any test: {names}'
+		report(config, message, yellow = True)
+		return
+	roots = [item for item in manager.items if matcher.is_affected(item)]
+	affected = {item.nodeid for item in roots}
+	affected.update(item.nodeid for item in manager.get_dependents(roots))
+	deselected = [item for item in items if item.nodeid not in affected]
+	report(config, f'Selected {len(items) - len(deselected)} tests affected by {len(changed)} changed files')
+	deselect(config, items, deselected)
+
+
+def _split_arg(arg):
+	"""
+	Split a test argument into its absolute path and the names of the nodes in that file, if any.
+
+	>>> _split_arg('tests/test_a.py::TestClass::test_foo')[1]
+	('TestClass', 'test_foo')
+	"""
+	path, *names = arg.split('::')
+	return os.path.normcase(os.path.abspath(path)), tuple(names)
+
+
+class Selection(object):
+	"""
+	The hooks that keep track of the tests that are deselected, for the options that add tests to a selection.
+
+	Pytest only collects the tests that are given as arguments, so the tests that these depend on (or that depend on
+	them) are not known if only some tests are given. Instead, all tests are collected, and the tests that don't match the
+	arguments are deselected afterwards. Tests that are deselected, both by this plugin and by others (such as for -k),
+	are held back until it is known which of them are selected again, so only the others are reported as deselected.
+	"""
+
+	def __init__(self, config):
+		""" Create a new instance for the given config. """
+		self.config = config
+		# The arguments, by their absolute path and node names, if all tests are collected instead
+		self.args = None
+		# The tests that were deselected so far, while they are being held back
+		self.held = None
+
+	def collect_all(self):
+		"""
+		Collect all tests instead of just those given as arguments, as if pytest was run without arguments.
+
+		This is only done for arguments that are paths (or node ids) of tests that exist, to leave any errors about them
+		to pytest.
+		"""
+		config = self.config
+		if config.getoption('pyargs', False):
+			return
+		# The controller of pytest-xdist passes the arguments on to the workers, which collect the tests themselves
+		if config.getoption('dist', 'no') != 'no' and not hasattr(config, 'workerinput'):
+			return
+		args = {_split_arg(arg): arg for arg in config.args}
+		if not all(os.path.exists(path) for path, names in args):
+			return
+		rootdir = str(config.rootdir)
+		paths = [
+			path
+			for pattern in config.getini('testpaths')
+			for path in sorted(glob.glob(os.path.join(rootdir, pattern)))
+		] or [rootdir]
+		if sorted(os.path.normcase(path) for path in paths) == sorted(path for path, names in args if not names):
+			return
+		self.args = args
+		config.args[:] = paths
+
+	def _get_arg(self, item):
+		""" Get the first argument that a test matches, or None if it doesn't match any. """
+		path = os.path.normcase(os.path.abspath(get_item_path(item)))
+		names = clean_nodeid(item.nodeid).split('::')[1:]
+		for (arg_path, arg_names), arg in self.args.items():
+			if path != arg_path and not path.startswith(os.path.join(arg_path, '')):
+				continue
+			# A test with parameters is also selected by its name without them
+			if len(arg_names) <= len(names) and all(
+				arg_name in (name, name.split('[')[0]) for arg_name, name in zip(arg_names, names)
+			):
+				return arg
+		return None
+
+	def hold(self):
+		""" Start holding back the tests that are deselected. """
+		self.held = []
+
+	def select_args(self, items):
+		""" Deselect the tests that don't match the arguments, if all tests were collected instead. """
+		if self.args is None:
+			return
+		args = {item: self._get_arg(item) for item in items}
+		# Report node ids that don't match any test like pytest does, as these would otherwise not run anything
+		missing = [arg for (path, names), arg in self.args.items() if names and arg not in args.values()]
+		if missing:
+			raise pytest.UsageError(f'not found: {", ".join(missing)}')
+		deselect(self.config, items, [item for item, arg in args.items() if arg is None])
+
+	def release(self, items):
+		""" Stop holding back deselected tests, and report those that are not part of the given selection anymore. """
+		held, self.held = self.held, None
+		selected = {item.nodeid for item in items}
+		deselected = [item for item in held if item.nodeid not in selected]
+		if deselected:
+			self.config.hook.pytest_deselected(items = deselected)
+
+	@pytest.hookimpl(tryfirst = True)
+	def pytest_deselected(self, items):  # noqa: D102
+		# Take the tests out of the list, so the other plugins don't see them until they are released
+		if self.held is not None and isinstance(items, list):
+			self.held.extend(items)
+			items[:] = []
@@ -1,20 +1,21 @@
-# -*- coding: future_fstrings -*-
-
 """ Utility functions to process the identifiers of tests. """
 
+import collections
 import re
 
-from pytest_depends.constants import MARKER_NAME
+from pytest_depends.constants import MARKER_KWARG_CONCURRENT
+from pytest_depends.constants import MARKER_KWARG_COST
+from pytest_depends.constants import MARKER_KWARG_DEPENDENCIES
 from pytest_depends.constants import MARKER_KWARG_ID
+from pytest_depends.constants import MARKER_NAME
 
 
-try:
-	basestring
-except NameError:
-	basestring = str
+REGEX_PARAMETERS = re.compile(r'\[.+\]$')
 
+# The information from the depends markers of a node: the custom names, the dependency names and the cost
+DependsMarkers = collections.namedtuple('DependsMarkers', ['names', 'dependencies', 'cost'])
 
-REGEX_PARAMETERS = re.compile(r'\[.+\]$')
+NO_MARKERS = DependsMarkers((), (), None)
 
 
 def clean_nodeid(nodeid):
@@ -67,21 +68,17 @@ def get_absolute_nodeid(nodeid, scope):
 	return clean_nodeid(nodeid)
 
 
-def get_names(item):
+def get_nodeid_names(nodeid):
 	"""
-	Get all names for a test.
-
-	This will use the following methods to determine the name of the test:
-		- If given, the custom name(s) passed to the keyword argument name on the marker
-		- The full node id of the test
-		- The node id of the test with any parameters removed, if it had any
-		- All 'scope' parts of the node id. For example, for a test test_file.py::TestClass::test, this would be
-		test_file.py and test_file.py::TestClass
+	Get the names for a test that are derived from its node id, which are all names except the custom ones.
+
+	>>> sorted(get_nodeid_names('test_file.py::TestClass::test[1]'))
+	['test_file.py', 'test_file.py::TestClass', 'test_file.py::TestClass::test', 'test_file.py::TestClass::test[1]']
 	"""
 	names = set()
 
 	# Node id
-	nodeid = clean_nodeid(item.nodeid)
+	nodeid = clean_nodeid(nodeid)
 	names.add(nodeid)
 
 	# Node id without parameter
@@ -93,14 +90,87 @@ def get_names(item):
 		nodeid = nodeid.rsplit('::', 1)[0]
 		names.add(nodeid)
 
-	# Custom name
-	markers = get_markers(item, MARKER_NAME)
+	return names
+
+
+def get_nodeid_scope(nodeid):
+	"""
+	Get the scopes that a test is in, from the outermost to the innermost: its directories, its file and its classes.
+
+	>>> get_nodeid_scope('tests/api/test_file.py::TestClass::test[1]')
+	('tests', 'tests/api', 'tests/api/test_file.py', 'tests/api/test_file.py::TestClass')
+	"""
+	parts = strip_nodeid_parameters(clean_nodeid(nodeid)).split('::')
+	directories = parts[0].split('/')
+	scope = ['/'.join(directories[:length]) for length in range(1, len(directories) + 1)]
+	for length in range(2, len(parts)):
+		scope.append('::'.join(parts[:length]))
+	return tuple(scope)
+
+
+def is_concurrent(item):
+	""" Whether a test is marked as safe to run concurrently with other tests using the keyword argument concurrent. """
+	for marker in get_markers(item, MARKER_NAME):
+		if MARKER_KWARG_CONCURRENT in marker.kwargs:
+			return bool(marker.kwargs[MARKER_KWARG_CONCURRENT])
+	return False
+
+
+def parse_markers(markers):
+	""" Get the DependsMarkers from the given markers, which should be ordered from the closest to the farthest. """
+	names = []
+	dependencies = []
+	cost = None
 	for marker in markers:
-		if MARKER_KWARG_ID in marker.kwargs:
-			for name in as_list(marker.kwargs[MARKER_KWARG_ID]):
-				names.add(name)
+		if marker.name != MARKER_NAME:
+			continue
+		names.extend(as_list(marker.kwargs.get(MARKER_KWARG_ID, [])))
+		dependencies.extend(as_list(marker.kwargs.get(MARKER_KWARG_DEPENDENCIES, [])))
+		if cost is None and MARKER_KWARG_COST in marker.kwargs:
+			cost = float(marker.kwargs[MARKER_KWARG_COST])
+	if not names and not dependencies and cost is None:
+		return NO_MARKERS
+	return DependsMarkers(tuple(names), tuple(dependencies), cost)
+
+
+class MarkerCache(object):
+	"""
+	Parses the depends markers of the tests, parsing the markers of each collector (such as a module or class) once.
 
-	return names
+	The markers of a test include those of all of its parents, which are shared by all tests in the same scope. Rather
+	than walking all of these for each test, the parsed markers of each parent are cached, and combined with the markers
+	of the test itself.
+	"""
+
+	def __init__(self):
+		""" Create a new, empty instance. """
+		self._nodes = {}
+
+	def _get_node(self, node):
+		""" Get the DependsMarkers of a collector, including those of its parents. """
+		if node is None:
+			return NO_MARKERS
+		key = id(node)
+		if key not in self._nodes:
+			self._nodes[key] = self._combine(parse_markers(node.own_markers), self._get_node(node.parent))
+		return self._nodes[key]
+
+	@staticmethod
+	def _combine(own, inherited):
+		""" Combine the DependsMarkers of a node with those of its parents, the node taking precedence. """
+		if inherited is NO_MARKERS:
+			return own
+		if own is NO_MARKERS:
+			return inherited
+		cost = own.cost if own.cost is not None else inherited.cost
+		return DependsMarkers(own.names + inherited.names, own.dependencies + inherited.dependencies, cost)
+
+	def get(self, item):
+		""" Get the DependsMarkers of a test, including those of its parents. """
+		# Fall back to walking all markers for items that don't look like pytest nodes
+		if not hasattr(item, 'own_markers') or not hasattr(item, 'parent'):
+			return parse_markers(item.iter_markers())
+		return self._combine(parse_markers(item.own_markers), self._get_node(item.parent))
 
 
 def get_markers(item, name):
@@ -121,4 +191,4 @@ def as_list(lst):
 	>>> as_list('foo')
 	['foo']
 	"""
-	return [lst] if isinstance(lst, basestring) else lst
+	return [lst] if isinstance(lst, str) else lst
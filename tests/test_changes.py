@@ -0,0 +1,53 @@
+import os
+
+import pytest_depends.changes as testmodule
+
+
+class FakeItem(object):
+	def __init__(self, path):
+		self.path = path
+
+
+class TestChangeMatcher(object):
+	ROOT = os.path.abspath('project')
+
+	def is_affected(self, changed, path):
+		matcher = testmodule.ChangeMatcher([os.path.join(self.ROOT, name) for name in changed])
+		return matcher.is_affected(FakeItem(os.path.join(self.ROOT, path)))
+
+	def test_changed_file(self):
+		assert self.is_affected(['tests/test_a.py'], 'tests/test_a.py')
+
+	def test_other_file(self):
+		assert not self.is_affected(['tests/test_b.py'], 'tests/test_a.py')
+
+	def test_changed_directory(self):
+		assert self.is_affected(['tests'], 'tests/api/test_a.py')
+
+	def test_changed_conftest(self):
+		assert self.is_affected(['conftest.py'], 'tests/api/test_a.py')
+
+	def test_conftest_in_other_directory(self):
+		assert not self.is_affected(['tests/db/conftest.py'], 'tests/api/test_a.py')
+
+
+class TestGetUnmapped(object):
+	ROOT = os.path.abspath('project')
+
+	def get_unmapped(self, changed, paths):
+		matcher = testmodule.ChangeMatcher([os.path.join(self.ROOT, name) for name in changed])
+		unmapped = matcher.get_unmapped([FakeItem(os.path.join(self.ROOT, path)) for path in paths])
+		return [os.path.relpath(path, self.ROOT) for path in unmapped]
+
+	def test_test_files(self):
+		assert self.get_unmapped(['tests/test_a.py', 'tests/test_b.py'], ['tests/test_a.py']) == ['tests/test_b.py']
+
+	def test_directories(self):
+		assert self.get_unmapped(['tests', 'tests/api', 'tests/db'], ['tests/api/test_a.py']) == ['tests/db']
+
+	def test_conftest(self):
+		changed = ['conftest.py', 'tests/conftest.py', 'tests/db/conftest.py']
+		assert self.get_unmapped(changed, ['tests/api/test_a.py']) == ['tests/db/conftest.py']
+
+	def test_other_files(self):
+		assert self.get_unmapped(['src/app.py', 'README.md'], ['tests/test_a.py']) == ['README.md', 'src/app.py']
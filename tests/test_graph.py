@@ -0,0 +1,165 @@
+import random
+
+import pytest
+
+import pytest_depends.graph as testmodule
+
+
+class TestGraph(object):
+	def test_from_lists(self):
+		graph = testmodule.Graph.from_lists([[1, 2], [], [0]])
+		assert len(graph) == 3
+		assert graph.edge_count == 3
+		assert [list(graph[node]) for node in range(3)] == [[1, 2], [], [0]]
+
+	def test_empty(self):
+		graph = testmodule.Graph.from_lists([])
+		assert len(graph) == 0
+		assert graph.edge_count == 0
+
+	def test_reversed(self):
+		graph = testmodule.Graph.from_lists([[2, 1], [2], []]).reversed()
+		assert [list(graph[node]) for node in range(3)] == [[], [0], [0, 1]]
+
+
+class TestTopologicalSort(object):
+	def test_no_dependencies(self):
+		assert testmodule.topological_sort([[], [], []]) == [0, 1, 2]
+
+	def test_dependency_moved_forward(self):
+		assert testmodule.topological_sort([[], [3], [], []]) == [0, 3, 1, 2]
+
+	def test_dependencies_keep_given_order(self):
+		assert testmodule.topological_sort([[2, 1], [], []]) == [2, 1, 0]
+
+	def test_chain(self):
+		assert testmodule.topological_sort([[1], [2], [3], []]) == [3, 2, 1, 0]
+
+	def test_shared_dependency(self):
+		assert testmodule.topological_sort([[2], [2], []]) == [2, 0, 1]
+
+	def test_cycle(self):
+		with pytest.raises(testmodule.CycleError) as excinfo:
+			testmodule.topological_sort([[], [2], [3], [1]])
+		assert excinfo.value.cycle == [1, 2, 3, 1]
+
+	def test_graph(self):
+		assert testmodule.topological_sort(testmodule.Graph.from_lists([[1], [], []])) == [1, 0, 2]
+
+	def test_self_dependency(self):
+		with pytest.raises(testmodule.CycleError) as excinfo:
+			testmodule.topological_sort([[0]])
+		assert excinfo.value.cycle == [0, 0]
+
+
+class TestPathWeights(object):
+	def test_chain(self):
+		graph = testmodule.Graph.from_lists([[], [0], [1]])
+		assert testmodule.get_path_weights(graph, [0, 1, 2], [1.0, 2.0, 3.0]) == [6.0, 5.0, 3.0]
+
+	def test_heaviest_branch(self):
+		graph = testmodule.Graph.from_lists([[], [0], [0]])
+		assert testmodule.get_path_weights(graph, [0, 1, 2], [1.0, 2.0, 3.0]) == [4.0, 2.0, 3.0]
+
+
+class TestReachabilityIndex(object):
+	def test_chain(self):
+		index = testmodule.ReachabilityIndex(testmodule.Graph.from_lists([[], [0], [1]]), [0, 1, 2])
+		assert index.get_reachable(2) == [0, 1]
+		assert index.get_reverse_reachable(0) == [1, 2]
+		assert index.reaches(2, 0)
+		assert not index.reaches(0, 2)
+
+	def test_shared_dependents_counted_once(self):
+		index = testmodule.ReachabilityIndex(testmodule.Graph.from_lists([[], [0], [0], [1, 2]]), [0, 1, 2, 3])
+		assert [index.count_reverse_reachable(node) for node in range(4)] == [3, 1, 1, 0]
+		assert [index.count_reachable(node) for node in range(4)] == [0, 1, 1, 3]
+
+	def test_components(self):
+		index = testmodule.ReachabilityIndex(testmodule.Graph.from_lists([[], [], [0], [1]]), [0, 1, 2, 3])
+		assert index.get_reachable(2) == [0]
+		assert index.get_reachable(3) == [1]
+		assert not index.reaches(2, 1)
+		assert not index.reaches(3, 0)
+
+	def test_not_counted(self):
+		graph = testmodule.Graph.from_lists([[], [0], [1]])
+		index = testmodule.ReachabilityIndex(graph, [0, 1, 2], [True, False, True])
+		assert index.get_reachable(2) == [0]
+		assert index.count_reverse_reachable(0) == 1
+		assert not index.reaches(2, 1)
+
+	def test_large_component(self, monkeypatch):
+		generator = random.Random(0)
+		lists = [sorted(generator.sample(range(node), min(node, 3))) for node in range(50)] + [[], [50]]
+		graph = testmodule.Graph.from_lists(lists)
+		order = testmodule.topological_sort(graph)
+		counted = [node % 7 != 3 for node in range(len(lists))]
+		expected = testmodule.ReachabilityIndex(graph, order, counted)
+		monkeypatch.setattr(testmodule.ReachabilityIndex, 'BITSET_LIMIT', 8)
+		monkeypatch.setattr(testmodule.ReachabilityIndex, 'SEARCH_CACHE_SIZE', 4)
+		index = testmodule.ReachabilityIndex(graph, order, counted)
+		assert index.large[index.components[0]] and not index.large[index.components[50]]
+		for node in range(len(lists)):
+			assert index.get_reachable(node) == expected.get_reachable(node)
+			assert index.get_reverse_reachable(node) == expected.get_reverse_reachable(node)
+			assert index.count_reachable(node) == expected.count_reachable(node)
+			assert index.count_reverse_reachable(node) == expected.count_reverse_reachable(node)
+			assert [index.reaches(node, target) for target in range(len(lists))] == [
+				expected.reaches(node, target) for target in range(len(lists))
+			]
+		assert len(index.searches) == 4
+
+
+class TestPrioritySort(object):
+	def test_equal_priorities(self):
+		graph = testmodule.Graph.from_lists([[], [], []])
+		assert testmodule.priority_sort(graph, [0, 0, 0]) == [0, 1, 2]
+
+	def test_highest_first(self):
+		graph = testmodule.Graph.from_lists([[], [], []])
+		assert testmodule.priority_sort(graph, [1, 3, 2]) == [1, 2, 0]
+
+	def test_dependencies_first(self):
+		graph = testmodule.Graph.from_lists([[], [2], []])
+		assert testmodule.priority_sort(graph, [0, 3, 1]) == [2, 1, 0]
+
+	def test_cycle(self):
+		with pytest.raises(testmodule.CycleError) as excinfo:
+			testmodule.priority_sort(testmodule.Graph.from_lists([[1], [0], []]), [0, 0, 0])
+		assert excinfo.value.cycle == [0, 1, 0]
+
+
+class TestScopeSort(object):
+	def test_keeps_order(self):
+		graph = testmodule.Graph.from_lists([[], [], []])
+		assert testmodule.scope_sort(graph, [('a',), ('b',), ('a',)]) == [0, 2, 1]
+
+	def test_finishes_complete_scope_first(self):
+		graph = testmodule.Graph.from_lists([[], [2], [], []])
+		assert testmodule.scope_sort(graph, [('a',), ('a',), ('b',), ('b',)]) == [2, 3, 0, 1]
+
+	def test_nested_scopes(self):
+		graph = testmodule.Graph.from_lists([[], [], [], []])
+		scopes = [('a', 'a::A'), ('a', 'a::B'), ('b',), ('a', 'a::A')]
+		assert testmodule.scope_sort(graph, scopes) == [0, 3, 1, 2]
+
+	def test_unscoped_nodes(self):
+		graph = testmodule.Graph.from_lists([[], [3], [], [0, 2]])
+		assert testmodule.scope_sort(graph, [('a',), ('a',), ('b',), None]) == [2, 0, 3, 1]
+
+	def test_cycle(self):
+		with pytest.raises(testmodule.CycleError) as excinfo:
+			testmodule.scope_sort(testmodule.Graph.from_lists([[1], [0], []]), [('a',), ('a',), ('a',)])
+		assert excinfo.value.cycle == [0, 1, 0]
+
+
+class TestCountScopeSwitches(object):
+	def test_same_scope(self):
+		assert testmodule.count_scope_switches([('a',), ('a',)]) == 0
+
+	def test_nested_scopes(self):
+		assert testmodule.count_scope_switches([('a', 'a::A'), ('a', 'a::B'), ('b',)]) == 3
+
+	def test_empty(self):
+		assert testmodule.count_scope_switches([]) == 0
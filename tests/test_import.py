@@ -0,0 +1,75 @@
+import json
+import subprocess
+import sys
+
+
+# The modules that should only be imported once it is clear the plugin is used, which is all but the constants
+LAZY_MODULES = [
+	'colorama',
+	'pytest_depends.cache',
+	'pytest_depends.changes',
+	'pytest_depends.concurrency',
+	'pytest_depends.distributed',
+	'pytest_depends.export',
+	'pytest_depends.graph',
+	'pytest_depends.history',
+	'pytest_depends.main',
+	'pytest_depends.patterns',
+	'pytest_depends.profiling',
+	'pytest_depends.selection',
+	'pytest_depends.util',
+]
+
+
+def run_python(code):
+	""" Run python code in a fresh interpreter and return the json printed by it. """
+	output = subprocess.check_output([sys.executable, '-c', code])
+	return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+class TestImport(object):
+	def test_lazy_modules(self):
+		loaded = run_python(
+			'import json, sys; import pytest_depends; '
+			f'print(json.dumps([name for name in {LAZY_MODULES!r} if name in sys.modules]))'
+		)
+		assert loaded == []
+
+	def test_unused_plugin(self, testdir):
+		testdir.makeconftest(f"""
+			import sys
+			def pytest_sessionfinish():
+				print('LOADED', ' '.join(name for name in {LAZY_MODULES!r} if name in sys.modules))
+		""")
+		testdir.makepyfile("""
+			def test_foo():
+				pass
+		""")
+		result = testdir.runpytest_subprocess('-s')
+		result.stdout.fnmatch_lines([
+			'*LOADED ',
+		])
+		assert result.ret == 0
+
+	def test_used_plugin(self, testdir):
+		testdir.makeconftest(f"""
+			import sys
+			def pytest_sessionfinish():
+				print('LOADED', ' '.join(name for name in {LAZY_MODULES!r} if name in sys.modules))
+		""")
+		testdir.makepyfile("""
+			import pytest
+			def test_foo():
+				pass
+			@pytest.mark.depends(on=['test_foo'])
+			def test_bar():
+				pass
+		""")
+		result = testdir.runpytest_subprocess('-s')
+		result.stdout.fnmatch_lines([
+			(
+				'*LOADED pytest_depends.graph pytest_depends.main pytest_depends.patterns pytest_depends.profiling '
+				'pytest_depends.util'
+			),
+		])
+		assert result.ret == 0
@@ -1,3 +1,12 @@
+import json
+import re
+import subprocess
+
+import pytest
+
+import pytest_depends.main as testmodule
+
+
 class TestOrder(object):
 	def test_simple(self, testdir):
 		testdir.makepyfile("""
@@ -50,6 +59,462 @@ class TestOrder(object):
 		])
 		assert result.ret == 0
 
+	def test_file(self, testdir):
+		testdir.makepyfile(
+			test_a="""
+				import pytest
+				@pytest.mark.depends(on=['test_b.py'])
+				def test_foo():
+					pass
+			""",
+			test_b="""
+				def test_bar():
+					pass
+				def test_baz():
+					pass
+			""",
+		)
+		result = testdir.runpytest('-v')
+		result.stdout.fnmatch_lines([
+			'*::test_bar PASSED*',
+			'*::test_baz PASSED*',
+			'*::test_foo PASSED*',
+		])
+		assert result.ret == 0
+
+	def test_keeps_collection_order(self, testdir):
+		testdir.makepyfile("""
+			import pytest
+			def test_a():
+				pass
+			@pytest.mark.depends(on=['test_d'])
+			def test_b():
+				pass
+			def test_c():
+				pass
+			def test_d():
+				pass
+		""")
+		result = testdir.runpytest('-v')
+		result.stdout.fnmatch_lines([
+			'*::test_a PASSED*',
+			'*::test_d PASSED*',
+			'*::test_b PASSED*',
+			'*::test_c PASSED*',
+		])
+		assert result.ret == 0
+
+	def test_cycle(self, testdir):
+		testdir.makepyfile("""
+			import pytest
+			@pytest.mark.depends(on=['test_bar'])
+			def test_foo():
+				pass
+			@pytest.mark.depends(on=['test_foo'])
+			def test_bar():
+				pass
+		""")
+		result = testdir.runpytest('-v')
+		result.stderr.fnmatch_lines([
+			'*Dependency cycle: *::test_foo -> *::test_bar -> *::test_foo',
+		])
+		assert result.ret == pytest.ExitCode.USAGE_ERROR
+
+	def test_critical_path_cost(self, testdir):
+		testdir.makepyfile("""
+			import pytest
+			@pytest.mark.depends(cost=1)
+			def test_a():
+				pass
+			@pytest.mark.depends(on=['test_a'], cost=1)
+			def test_b():
+				pass
+			@pytest.mark.depends(cost=10)
+			def test_c():
+				pass
+		""")
+		result = testdir.runpytest('-v', '--dependency-order=critical-path')
+		result.stdout.fnmatch_lines([
+			'*::test_c PASSED*',
+			'*::test_a PASSED*',
+			'*::test_b PASSED*',
+		])
+		assert result.ret == 0
+
+	def test_critical_path_history(self, testdir):
+		testdir.makepyfile("""
+			import time
+			import pytest
+			def test_a():
+				pass
+			@pytest.mark.depends(on=['test_a'])
+			def test_b():
+				pass
+			def test_slow():
+				time.sleep(0.2)
+		""")
+		result = testdir.runpytest('-v', '--dependency-order=critical-path')
+		result.stdout.fnmatch_lines([
+			'*::test_a PASSED*',
+			'*::test_b PASSED*',
+			'*::test_slow PASSED*',
+		])
+		assert result.ret == 0
+
+		result = testdir.runpytest('-v', '--dependency-order=critical-path')
+		result.stdout.fnmatch_lines([
+			'*::test_slow PASSED*',
+			'*::test_a PASSED*',
+			'*::test_b PASSED*',
+		])
+		assert result.ret == 0
+
+	def test_critical_path_history_skipped(self, testdir):
+		testdir.makepyfile("""
+			import os
+			import time
+			import pytest
+			def test_a():
+				time.sleep(0.05)
+			@pytest.mark.depends(on=['test_a'])
+			def test_b():
+				pass
+			@pytest.mark.skipif('os.path.exists("skip")')
+			def test_slow():
+				time.sleep(0.2)
+		""")
+		result = testdir.runpytest('-v', '--dependency-order=critical-path')
+		assert result.ret == 0
+
+		# Skipping the slow test doesn't replace its duration
+		testdir.makefile('', skip = '')
+		result = testdir.runpytest('-v', '--dependency-order=critical-path')
+		result.stdout.fnmatch_lines([
+			'*::test_slow SKIPPED*',
+		])
+		assert result.ret == 0
+
+		testdir.tmpdir.join('skip').remove()
+		result = testdir.runpytest('-v', '--dependency-order=critical-path')
+		result.stdout.fnmatch_lines([
+			'*::test_slow PASSED*',
+			'*::test_a PASSED*',
+			'*::test_b PASSED*',
+		])
+		assert result.ret == 0
+
+	def test_scope(self, testdir):
+		testdir.makepyfile(
+			test_a="""
+				import pytest
+				def test_foo():
+					pass
+				@pytest.mark.depends(on=['test_b.py::test_foo'])
+				def test_bar():
+					pass
+				def test_baz():
+					pass
+			""",
+			test_b="""
+				def test_foo():
+					pass
+				def test_bar():
+					pass
+			""",
+		)
+		result = testdir.runpytest('-v', '--dependency-order=scope')
+		result.stdout.fnmatch_lines([
+			'*Ordered the tests by scope: 1 scope switches',
+			'*test_b.py::test_foo PASSED*',
+			'*test_b.py::test_bar PASSED*',
+			'*test_a.py::test_foo PASSED*',
+			'*test_a.py::test_bar PASSED*',
+			'*test_a.py::test_baz PASSED*',
+		])
+		assert result.ret == 0
+
+	def test_scope_profile(self, testdir):
+		testdir.makepyfile(
+			test_a="""
+				import pytest
+				def test_foo():
+					pass
+				@pytest.mark.depends(on=['test_b.py::test_foo'])
+				def test_bar():
+					pass
+				def test_baz():
+					pass
+			""",
+			test_b="""
+				def test_foo():
+					pass
+				def test_bar():
+					pass
+			""",
+		)
+		result = testdir.runpytest('-v', '--dependency-order=scope', '--dependency-profile')
+		result.stdout.fnmatch_lines([
+			'* 1  scope_switches',
+			'* 3  collection_order_scope_switches',
+		])
+		assert result.ret == 0
+
+	def test_fail_fast(self, testdir):
+		testdir.makepyfile("""
+			import pytest
+			def test_a():
+				pass
+			def test_b():
+				pass
+			@pytest.mark.depends(on=['test_b'])
+			def test_c():
+				pass
+			@pytest.mark.depends(on=['test_c'])
+			def test_d():
+				pass
+			@pytest.mark.depends(on=['test_a'])
+			def test_e():
+				pass
+		""")
+		result = testdir.runpytest('-v', '--dependency-order=fail-fast')
+		result.stdout.fnmatch_lines([
+			'*::test_b PASSED*',
+			'*::test_a PASSED*',
+			'*::test_c PASSED*',
+			'*::test_d PASSED*',
+			'*::test_e PASSED*',
+		])
+		assert result.ret == 0
+
+	def test_fail_fast_history(self, testdir):
+		testdir.makepyfile("""
+			import os
+			import pytest
+			def test_a():
+				pass
+			@pytest.mark.depends(on=['test_a'])
+			def test_b():
+				pass
+			def test_c():
+				assert not os.environ.get('FAIL_C')
+			@pytest.mark.depends(on=['test_c'])
+			def test_d():
+				pass
+		""")
+		testdir.monkeypatch.setenv('FAIL_C', '1')
+		result = testdir.runpytest('-v', '--dependency-order=fail-fast')
+		result.stdout.fnmatch_lines([
+			'*::test_a PASSED*',
+			'*::test_c FAILED*',
+		])
+
+		result = testdir.runpytest('-v', '--dependency-order=fail-fast')
+		result.stdout.fnmatch_lines([
+			'*::test_c FAILED*',
+			'*::test_a PASSED*',
+		])
+
+
+class TestCollectorMarkers(object):
+	def test_class_dependencies(self, testdir):
+		testdir.makepyfile("""
+			import pytest
+			@pytest.mark.depends(on=['bar'])
+			class TestClass(object):
+				def test_foo(self):
+					pass
+				@pytest.mark.depends(on=['baz'])
+				def test_qux(self):
+					pass
+			@pytest.mark.depends(name='bar')
+			def test_bar():
+				assert 1 == 2
+			@pytest.mark.depends(name='baz')
+			def test_baz():
+				pass
+		""")
+		result = testdir.runpytest('-v')
+		result.stdout.fnmatch_lines([
+			'*::test_bar FAILED*',
+			'*::TestClass::test_foo SKIPPED*',
+			'*::test_baz PASSED*',
+			'*::TestClass::test_qux SKIPPED*',
+		])
+		assert result.ret != 0
+
+	def test_module_names(self, testdir):
+		testdir.makepyfile(
+			test_a="""
+				import pytest
+				pytestmark = pytest.mark.depends(name='module_a', cost=5)
+				def test_foo():
+					pass
+				@pytest.mark.depends(name='foo')
+				def test_bar():
+					pass
+			""",
+			test_b="""
+				import pytest
+				@pytest.mark.depends(on=['module_a', 'foo'])
+				def test_baz():
+					pass
+			""",
+		)
+		result = testdir.runpytest('-v', '--list-processed-dependencies')
+		result.stdout.fnmatch_lines([
+			'*test_b.py::test_baz*',
+			'*test_a.py::test_bar*',
+			'*test_a.py::test_foo*',
+		])
+		assert result.ret == 0
+
+
+class TestPatterns(object):
+	def test_glob(self, testdir):
+		testdir.makepyfile(
+			test_api="""
+				import pytest
+				def test_create_user():
+					assert 1 == 2
+				def test_create_group():
+					pass
+				def test_delete_user():
+					pass
+			""",
+			test_b="""
+				import pytest
+				@pytest.mark.depends(on=['glob:test_api.py::test_create_*'])
+				def test_list():
+					pass
+				@pytest.mark.depends(on=['glob:test_api.py::test_delete_*'])
+				def test_count():
+					pass
+			""",
+		)
+		result = testdir.runpytest('-v')
+		result.stdout.fnmatch_lines_random([
+			'*::test_create_user FAILED*',
+			'*::test_list SKIPPED*',
+			'*::test_count PASSED*',
+		])
+		assert result.ret != 0
+
+	def test_regex(self, testdir):
+		testdir.makepyfile("""
+			import pytest
+			@pytest.mark.depends(on=['re:.*::test_(bar|baz)'])
+			def test_foo():
+				pass
+			def test_bar():
+				pass
+			def test_baz():
+				pass
+			def test_qux():
+				pass
+		""")
+		result = testdir.runpytest('-v')
+		result.stdout.fnmatch_lines([
+			'*::test_bar PASSED*',
+			'*::test_baz PASSED*',
+			'*::test_foo PASSED*',
+			'*::test_qux PASSED*',
+		])
+		assert result.ret == 0
+
+	def test_siblings(self, testdir):
+		testdir.makepyfile(
+			test_a="""
+				import pytest
+				@pytest.mark.depends(on=['glob:test_a.py::*'])
+				def test_foo():
+					pass
+				def test_bar():
+					pass
+				def test_baz():
+					pass
+			""",
+		)
+		result = testdir.runpytest('-v')
+		result.stdout.fnmatch_lines([
+			'*::test_bar PASSED*',
+			'*::test_baz PASSED*',
+			'*::test_foo PASSED*',
+		])
+		assert result.ret == 0
+
+	def test_enclosing_groups(self, testdir):
+		testdir.makepyfile(
+			test_a="""
+				import pytest
+				pytestmark = pytest.mark.depends(on=['glob:test_*.py'])
+				def test_foo():
+					pass
+				def test_bar():
+					pass
+			""",
+			test_b="""
+				def test_foo():
+					assert 1 == 2
+			""",
+		)
+		result = testdir.runpytest('-v')
+		result.stdout.fnmatch_lines([
+			'test_b.py::test_foo FAILED*',
+			'test_a.py::test_foo SKIPPED*',
+			'test_a.py::test_bar SKIPPED*',
+		])
+		assert result.ret != 0
+
+	def test_custom_names(self, testdir):
+		testdir.makepyfile("""
+			import pytest
+			@pytest.mark.depends(on=['glob:setup_*'])
+			def test_foo():
+				pass
+			@pytest.mark.depends(name='setup_a')
+			def test_bar():
+				pass
+			@pytest.mark.depends(name='setup_b')
+			def test_baz():
+				assert 1 == 2
+		""")
+		result = testdir.runpytest('-v')
+		result.stdout.fnmatch_lines([
+			'*::test_bar PASSED*',
+			'*::test_baz FAILED*',
+			'*::test_foo SKIPPED*',
+		])
+		assert result.ret != 0
+
+	def test_no_match(self, testdir):
+		testdir.makepyfile("""
+			import pytest
+			@pytest.mark.depends(on=['glob:test_missing_*'])
+			def test_foo():
+				pass
+		""")
+		result = testdir.runpytest('-v', '--list-processed-dependencies')
+		result.stdout.fnmatch_lines([
+			'*glob:test_missing_* (MISSING)*',
+			'*::test_foo SKIPPED*',
+		])
+
+	def test_shared_group(self):
+		class Item(object):
+			def __init__(self, nodeid):
+				self.nodeid = nodeid
+
+			def iter_markers(self):
+				return iter([pytest.mark.depends(on=['glob:test_*.py']).mark])
+
+		items = [Item(f'test_{module}.py::test_{index}') for module in range(16) for index in range(16)]
+		manager = testmodule.DependencyManager()
+		manager.items = items
+		assert manager.dependencies[items[0].nodeid].dependencies == {item.nodeid for item in items[16:]}
+		assert manager.dependencies[items[-1].nodeid].dependencies == {item.nodeid for item in items[:-16]}
+		# A group of the other tests for each file would take 16 * 240 edges, rather than a few edges per test
+		assert manager._graph.edge_count < 5 * len(items)
+
 
 class TestDependencySkip(object):
 	def test_simple_run(self, testdir):
@@ -174,6 +639,106 @@ class TestDependencySkip(object):
 		])
 		assert result.ret != 0
 
+	def test_file_fail(self, testdir):
+		testdir.makepyfile(
+			test_a="""
+				import pytest
+				@pytest.mark.depends(on=['test_b.py'])
+				def test_foo():
+					pass
+				@pytest.mark.depends(on=['test_b.py'])
+				def test_qux():
+					pass
+			""",
+			test_b="""
+				def test_bar():
+					pass
+				def test_baz():
+					assert 1 == 2
+			""",
+		)
+		result = testdir.runpytest('-v')
+		result.stdout.fnmatch_lines_random([
+			'*::test_bar PASSED*',
+			'*::test_baz FAILED*',
+			'*::test_foo SKIPPED*',
+			'*::test_qux SKIPPED*',
+		])
+		assert result.ret != 0
+
+	def test_skip_reason(self, testdir):
+		testdir.makepyfile("""
+			import pytest
+			def test_bar():
+				assert 1 == 2
+			@pytest.mark.depends(on=['test_bar'])
+			def test_foo():
+				pass
+		""")
+		result = testdir.runpytest('-v', '-rs')
+		result.stdout.fnmatch_lines([
+			'SKIPPED * test_skip_reason.py::test_foo depends on test_skip_reason.py::test_bar',
+		])
+		assert result.ret != 0
+
+	def test_skip_reason_summarized(self, testdir):
+		testdir.makepyfile("""
+			import pytest
+			@pytest.mark.parametrize('num', range(5))
+			def test_bar(num):
+				assert num > 3
+			def test_baz():
+				assert 1 == 2
+			@pytest.mark.depends(on=['test_bar[0]', 'test_bar[1]', 'test_bar[2]', 'test_bar[3]', 'test_baz'])
+			def test_foo():
+				pass
+		""")
+		result = testdir.runpytest('-v', '-rs')
+		result.stdout.fnmatch_lines([
+			'SKIPPED * *::test_foo depends on *::test_bar[[]0], *::test_bar[[]1], *::test_bar[[]2] and 2 more',
+		])
+		assert result.ret != 0
+
+	def test_transitive_skip(self, testdir):
+		testdir.makepyfile("""
+			import pytest
+			def test_bar():
+				assert 1 == 2
+			@pytest.mark.depends(on=['test_bar'])
+			def test_foo():
+				pass
+			@pytest.mark.depends(on=['test_foo'])
+			def test_baz():
+				pass
+		""")
+		result = testdir.runpytest('-v')
+		result.stdout.fnmatch_lines_random([
+			'*::test_bar FAILED*',
+			'*::test_foo SKIPPED*',
+			'*::test_baz SKIPPED*',
+		])
+		assert result.ret != 0
+
+	def test_fixtures_not_created(self, testdir):
+		testdir.makepyfile("""
+			import pytest
+			@pytest.fixture(scope='module')
+			def expensive():
+				raise Exception('Fixture created')
+			def test_bar():
+				assert 1 == 2
+			@pytest.mark.depends(on=['test_bar'])
+			def test_foo(expensive):
+				pass
+		""")
+		result = testdir.runpytest('-v')
+		result.stdout.fnmatch_lines_random([
+			'*::test_bar FAILED*',
+			'*::test_foo SKIPPED*',
+		])
+		result.stdout.no_fnmatch_line('*Fixture created*')
+		assert result.ret != 0
+
 	def test_missing_run(self, testdir):
 		testdir.makepyfile("""
 			import pytest
@@ -410,20 +975,1030 @@ class TestListProcessedDependencies(object):
 		])
 		assert result.ret == 0
 
-	def test_on_string(self, testdir):
+	def test_ambiguous(self, testdir):
 		testdir.makepyfile("""
 			import pytest
-			def test_foo():
+			@pytest.mark.depends(name='test_bar')
+			def test_baz():
 				pass
-			@pytest.mark.depends(on='test_foo')
 			def test_bar():
 				pass
+			@pytest.mark.depends(on=['test_bar'])
+			def test_foo():
+				pass
 		""")
 		result = testdir.runpytest('--list-processed-dependencies')
 		result.stdout.fnmatch_lines([
 			'Dependencies:',
-			'*::test_bar*',
-			'  *test_foo',
+			'*::test_foo*',
+			'  *::test_baz',
+			'  *test_bar (AMBIGUOUS, not *::test_bar)',
 			'collected *',
 		])
 		assert result.ret == 0
+
+	def test_on_string(self, testdir):
+		testdir.makepyfile("""
+			import pytest
+			def test_foo():
+				pass
+			@pytest.mark.depends(on='test_foo')
+			def test_bar():
+				pass
+		""")
+		result = testdir.runpytest('--list-processed-dependencies')
+		result.stdout.fnmatch_lines([
+			'Dependencies:',
+			'*::test_bar*',
+			'  *test_foo',
+			'collected *',
+		])
+		assert result.ret == 0
+
+
+class TestCacheDependencyGraph(object):
+	CONFTEST = """
+		import os
+		import pytest_depends.main
+		if os.environ.get('FAIL_RESOLVE'):
+			def get_nodeid_names(nodeid):
+				raise Exception('Resolving names again')
+			pytest_depends.main.get_nodeid_names = get_nodeid_names
+	"""
+
+	def test_reused(self, testdir, monkeypatch):
+		testdir.makeconftest(self.CONFTEST)
+		testdir.makepyfile("""
+			import pytest
+			@pytest.mark.depends(on=['test_bar'])
+			def test_foo():
+				pass
+			def test_bar():
+				pass
+		""")
+		result = testdir.runpytest_subprocess('-v', '--cache-dependency-graph')
+		assert result.ret == 0
+
+		monkeypatch.setenv('FAIL_RESOLVE', '1')
+		result = testdir.runpytest_subprocess('-v', '--cache-dependency-graph')
+		result.stdout.fnmatch_lines([
+			'*::test_bar PASSED*',
+			'*::test_foo PASSED*',
+		])
+		assert result.ret == 0
+
+	def test_not_reused_without_flag(self, testdir, monkeypatch):
+		testdir.makeconftest(self.CONFTEST)
+		testdir.makepyfile("""
+			import pytest
+			@pytest.mark.depends(on=['test_bar'])
+			def test_foo():
+				pass
+			def test_bar():
+				pass
+		""")
+		result = testdir.runpytest_subprocess('-v', '--cache-dependency-graph')
+		assert result.ret == 0
+
+		monkeypatch.setenv('FAIL_RESOLVE', '1')
+		result = testdir.runpytest_subprocess('-v')
+		assert result.ret != 0
+
+	def test_changed_file(self, testdir):
+		testdir.makepyfile(test_changed_file="""
+			import pytest
+			@pytest.mark.depends(on=['test_bar'])
+			def test_foo():
+				pass
+			def test_bar():
+				pass
+		""")
+		result = testdir.runpytest('-v', '--cache-dependency-graph')
+		assert result.ret == 0
+
+		testdir.makepyfile(test_changed_file="""
+			import pytest
+			def test_foo():
+				pass
+			@pytest.mark.depends(on=['test_foo'])
+			def test_bar():
+				pass
+		""")
+		result = testdir.runpytest('-v', '--cache-dependency-graph')
+		result.stdout.fnmatch_lines([
+			'*::test_foo PASSED*',
+			'*::test_bar PASSED*',
+		])
+		assert result.ret == 0
+
+
+class TestXdist(object):
+	def test_dependency_scheduling(self, testdir):
+		pytest.importorskip('xdist')
+		testdir.makepyfile(
+			test_a="""
+				import pytest
+				@pytest.mark.depends(on=['test_b.py::test_bar'])
+				def test_foo():
+					pass
+				def test_qux():
+					pass
+			""",
+			test_b="""
+				import pytest
+				def test_bar():
+					pass
+				@pytest.mark.depends(on=['test_a.py::test_foo'])
+				def test_baz():
+					pass
+			""",
+		)
+		result = testdir.runpytest_subprocess('-v', '-n', '2', '--dependency-scheduling')
+		result.stdout.fnmatch_lines([
+			'*PASSED test_b.py::test_bar*',
+			'*PASSED test_a.py::test_foo*',
+			'*PASSED test_b.py::test_baz*',
+		])
+		result.stdout.fnmatch_lines_random([
+			'*PASSED test_a.py::test_qux*',
+		])
+		assert result.ret == 0
+
+	def test_dependency_scheduling_shared_dependency(self, testdir):
+		pytest.importorskip('xdist')
+		testdir.makepyfile(
+			test_a="""
+				import pytest
+				def test_root():
+					pass
+				@pytest.mark.depends(on=['test_root'])
+				@pytest.mark.parametrize('value', range(4))
+				def test_foo(value):
+					pass
+			""",
+		)
+		result = testdir.runpytest_subprocess('-v', '-n', '2', '--dependency-scheduling')
+		workers = {}
+		for line in result.stdout.lines:
+			match = re.match(r'\[(gw\d+)\] .* PASSED (\S+)', line)
+			if match:
+				workers[match.group(2)] = match.group(1)
+		assert len(workers) == 5
+		# The tests that depend on the same test are not all sent to the worker that ran that test
+		assert len({worker for nodeid, worker in workers.items() if 'test_foo' in nodeid}) == 2
+		assert result.ret == 0
+
+	def test_shared_results(self, testdir):
+		pytest.importorskip('xdist')
+		testdir.makepyfile(
+			test_a="""
+				import os
+				import pytest
+				import time
+				from pytest_depends.distributed import RESULTS_FILE, WORKERINPUT_DIRECTORY
+				def test_wait(request):
+					# Wait until the results of the other module have been shared
+					path = os.path.join(request.config.workerinput[WORKERINPUT_DIRECTORY], RESULTS_FILE)
+					for _ in range(1000):
+						if os.path.exists(path) and b'test_baz' in open(path, 'rb').read():
+							break
+						time.sleep(0.01)
+				@pytest.mark.depends(on=['test_b.py::test_bar'])
+				def test_foo():
+					pass
+				@pytest.mark.depends(on=['test_b.py::test_baz'])
+				def test_qux():
+					pass
+			""",
+			test_b="""
+				def test_bar():
+					pass
+				def test_baz():
+					assert 1 == 2
+			""",
+		)
+		result = testdir.runpytest_subprocess('-v', '-n', '2', '--dist', 'loadscope')
+		result.stdout.fnmatch_lines_random([
+			'*PASSED test_a.py::test_foo*',
+			'*SKIPPED test_a.py::test_qux*',
+		])
+		assert result.ret != 0
+
+	def test_unused_shared_results(self, testdir):
+		pytest.importorskip('xdist')
+		testdir.makeconftest("""
+			def pytest_sessionfinish(session):
+				if not hasattr(session.config, 'workerinput'):
+					plugin = session.config.pluginmanager.get_plugin('depends-controller')
+					print('RESULTS FILE', plugin.results_file)
+		""")
+		testdir.makepyfile("""
+			def test_foo():
+				pass
+			def test_bar():
+				pass
+		""")
+		result = testdir.runpytest_subprocess('-s', '-n', '2')
+		result.stdout.fnmatch_lines([
+			'*RESULTS FILE None*',
+		])
+		assert result.ret == 0
+
+
+class TestDeselectBlockedTests(object):
+	def test_deselected(self, testdir):
+		testdir.makepyfile(
+			test_a="""
+				def test_foo():
+					assert 1 == 2
+			""",
+			test_b="""
+				import pytest
+				@pytest.mark.depends(on=['test_a.py::test_foo'])
+				def test_bar():
+					pass
+				@pytest.mark.depends(on=['test_bar'])
+				def test_baz():
+					pass
+				def test_qux():
+					pass
+			""",
+		)
+		result = testdir.runpytest('-v', '--deselect-blocked-tests')
+		result.assert_outcomes(failed = 1, passed = 1, skipped = 2)
+
+		result = testdir.runpytest('-v', '--deselect-blocked-tests')
+		result.stdout.fnmatch_lines([
+			'*Deselected 2 tests that depend on tests that failed in the previous run: test_a.py::test_foo',
+		])
+		result.assert_outcomes(failed = 1, passed = 1, deselected = 2)
+
+	def test_changed_file(self, testdir):
+		testdir.makepyfile(test_a="""
+			def test_foo():
+				assert 1 == 2
+		""")
+		testdir.makepyfile(test_b="""
+			import pytest
+			@pytest.mark.depends(on=['test_a.py::test_foo'])
+			def test_bar():
+				pass
+		""")
+		result = testdir.runpytest('-v', '--deselect-blocked-tests')
+		result.assert_outcomes(failed = 1, skipped = 1)
+
+		testdir.makepyfile(test_a="""
+			def test_foo():
+				pass
+		""")
+		result = testdir.runpytest('-v', '--deselect-blocked-tests')
+		result.assert_outcomes(passed = 2)
+
+	def test_not_deselected_without_flag(self, testdir):
+		testdir.makepyfile("""
+			import pytest
+			def test_foo():
+				assert 1 == 2
+			@pytest.mark.depends(on=['test_foo'])
+			def test_bar():
+				pass
+		""")
+		result = testdir.runpytest('-v', '--deselect-blocked-tests')
+		result.assert_outcomes(failed = 1, skipped = 1)
+
+		result = testdir.runpytest('-v')
+		result.assert_outcomes(failed = 1, skipped = 1)
+
+
+class TestReusePassedDependencies(object):
+	SOURCE = """
+		import pytest
+		def test_build():
+			pass
+		@pytest.mark.depends(on=['test_build'])
+		def test_migrate():
+			pass
+		@pytest.mark.depends(on=['test_migrate'])
+		def test_slow():
+			pass
+	"""
+
+	def test_reused(self, testdir):
+		testdir.makepyfile(test_reuse=self.SOURCE)
+		result = testdir.runpytest('-v', '--reuse-passed-dependencies')
+		result.assert_outcomes(passed = 3)
+
+		result = testdir.runpytest('-v', '--reuse-passed-dependencies', '-k', 'test_slow')
+		result.stdout.fnmatch_lines([
+			'*Reused the results of 2 dependencies that passed in the previous run: *test_build, *test_migrate',
+		])
+		result.assert_outcomes(passed = 1, deselected = 2)
+
+	def test_node_id(self, testdir):
+		testdir.makepyfile(test_reuse=self.SOURCE)
+		result = testdir.runpytest('-v', '--reuse-passed-dependencies')
+		result.assert_outcomes(passed = 3)
+
+		result = testdir.runpytest('-v', '--reuse-passed-dependencies', 'test_reuse.py::test_slow')
+		result.stdout.fnmatch_lines([
+			'*Reused the results of 1 dependencies that passed in the previous run: test_reuse.py::test_migrate',
+		])
+		result.assert_outcomes(passed = 1)
+
+	def test_node_id_not_passed(self, testdir):
+		testdir.makepyfile(test_reuse=self.SOURCE)
+		result = testdir.runpytest('-v', '--reuse-passed-dependencies', 'test_reuse.py::test_slow')
+		result.assert_outcomes(skipped = 1)
+
+	def test_not_added_as_dependencies(self, testdir):
+		testdir.makepyfile(test_reuse=self.SOURCE)
+		result = testdir.runpytest('-v', '--reuse-passed-dependencies')
+		result.assert_outcomes(passed = 3)
+
+		result = testdir.runpytest('-v', '--reuse-passed-dependencies', '--with-dependencies', '-k', 'test_slow')
+		result.assert_outcomes(passed = 1, deselected = 2)
+
+	def test_changed_file(self, testdir):
+		testdir.makepyfile(test_reuse=self.SOURCE)
+		result = testdir.runpytest('-v', '--reuse-passed-dependencies')
+		result.assert_outcomes(passed = 3)
+
+		testdir.makepyfile(test_reuse=self.SOURCE.rstrip() + '\n\t\tdef test_other():\n\t\t\tpass\n')
+		result = testdir.runpytest('-v', '--reuse-passed-dependencies', '-k', 'test_slow')
+		result.assert_outcomes(skipped = 1, deselected = 3)
+
+	def test_changed_input(self, testdir):
+		testdir.makeini("""
+			[pytest]
+			reuse_passed_inputs = build/*
+		""")
+		testdir.mkdir('build').join('artifact').write('1')
+		testdir.makepyfile(test_reuse=self.SOURCE)
+		result = testdir.runpytest('-v', '--reuse-passed-dependencies')
+		result.assert_outcomes(passed = 3)
+
+		testdir.tmpdir.join('build', 'artifact').write('12')
+		result = testdir.runpytest('-v', '--reuse-passed-dependencies', '-k', 'test_slow')
+		result.assert_outcomes(skipped = 1, deselected = 2)
+
+	def test_failed_not_reused(self, testdir):
+		source = self.SOURCE.replace('def test_build():\n\t\t\tpass', 'def test_build():\n\t\t\tassert 1 == 2')
+		testdir.makepyfile(test_reuse=source)
+		result = testdir.runpytest('-v', '--reuse-passed-dependencies')
+		result.assert_outcomes(failed = 1, skipped = 2)
+
+		result = testdir.runpytest('-v', '--reuse-passed-dependencies', '-k', 'test_slow')
+		result.assert_outcomes(skipped = 1, deselected = 2)
+
+	def test_selected_tests_run(self, testdir):
+		testdir.makepyfile(test_reuse=self.SOURCE)
+		result = testdir.runpytest('-v', '--reuse-passed-dependencies')
+		result.assert_outcomes(passed = 3)
+
+		result = testdir.runpytest('-v', '--reuse-passed-dependencies')
+		result.stdout.no_fnmatch_line('*Reused the results*')
+		result.assert_outcomes(passed = 3)
+
+
+class TestWithDependencies(object):
+	FILE = """
+		import pytest
+		def test_a():
+			pass
+		@pytest.mark.depends(on=['test_a'])
+		def test_b():
+			pass
+		@pytest.mark.depends(on=['test_b'])
+		def test_c():
+			pass
+		@pytest.mark.depends(on=['test_c'])
+		def test_d():
+			pass
+		def test_e():
+			pass
+	"""
+
+	def test_dependencies(self, testdir):
+		testdir.makepyfile(self.FILE)
+		result = testdir.runpytest('-v', '-k', 'test_c', '--with-dependencies')
+		result.stdout.fnmatch_lines([
+			'*collected 5 items / 2 deselected / 3 selected',
+			'*::test_a PASSED*',
+			'*::test_b PASSED*',
+			'*::test_c PASSED*',
+		])
+		result.assert_outcomes(passed = 3, deselected = 2)
+
+	def test_dependents(self, testdir):
+		testdir.makepyfile(self.FILE)
+		result = testdir.runpytest('-v', '-k', 'test_b', '--with-dependents')
+		result.stdout.fnmatch_lines([
+			'*::test_b SKIPPED*',
+			'*::test_c SKIPPED*',
+			'*::test_d SKIPPED*',
+		])
+		result.assert_outcomes(skipped = 3, deselected = 2)
+
+	def test_dependencies_and_dependents(self, testdir):
+		testdir.makepyfile(self.FILE)
+		result = testdir.runpytest('-v', '-k', 'test_b', '--with-dependencies', '--with-dependents')
+		result.assert_outcomes(passed = 4, deselected = 1)
+
+	def test_without_flag(self, testdir):
+		testdir.makepyfile(self.FILE)
+		result = testdir.runpytest('-v', '-k', 'test_c')
+		result.assert_outcomes(skipped = 1, deselected = 4)
+
+	def test_node_id(self, testdir):
+		testdir.makepyfile(self.FILE)
+		testdir.makepyfile(test_other="""
+			def test_other():
+				pass
+		""")
+		result = testdir.runpytest('-v', 'test_node_id.py::test_c', '--with-dependencies')
+		result.stdout.fnmatch_lines([
+			'*collected 6 items / 3 deselected / 3 selected',
+			'*::test_a PASSED*',
+			'*::test_b PASSED*',
+			'*::test_c PASSED*',
+		])
+		result.assert_outcomes(passed = 3, deselected = 3)
+
+	def test_other_file(self, testdir):
+		testdir.makepyfile(
+			test_a="""
+				def test_foo():
+					pass
+				def test_bar():
+					pass
+			""",
+			test_b="""
+				import pytest
+				@pytest.mark.depends(on=['test_a.py::test_foo'])
+				def test_baz():
+					pass
+			""",
+		)
+		result = testdir.runpytest('-v', 'test_b.py', '--with-dependencies')
+		result.stdout.fnmatch_lines([
+			'test_a.py::test_foo PASSED*',
+			'test_b.py::test_baz PASSED*',
+		])
+		result.assert_outcomes(passed = 2, deselected = 1)
+
+	def test_node_id_not_found(self, testdir):
+		testdir.makepyfile(self.FILE)
+		result = testdir.runpytest('-v', 'test_node_id_not_found.py::test_x', '--with-dependencies')
+		result.stderr.fnmatch_lines([
+			'*not found: test_node_id_not_found.py::test_x',
+		])
+		assert result.ret == 4
+
+	def test_dependents_of_node_id(self, testdir):
+		testdir.makepyfile(self.FILE)
+		result = testdir.runpytest('-v', 'test_dependents_of_node_id.py::test_a', '--with-dependents')
+		result.assert_outcomes(passed = 4, deselected = 1)
+
+
+class TestChangedFiles(object):
+	def make_files(self, testdir):
+		testdir.makepyfile(
+			test_a="""
+				import pytest
+				def test_build():
+					pass
+				@pytest.mark.depends(on=['test_build'])
+				def test_api():
+					pass
+			""",
+			test_b="""
+				import pytest
+				@pytest.mark.depends(on=['test_a.py::test_api'])
+				def test_client():
+					pass
+				def test_other():
+					pass
+			""",
+			test_c="""
+				def test_unrelated():
+					pass
+			""",
+		)
+
+	def test_changed_file(self, testdir):
+		self.make_files(testdir)
+		result = testdir.runpytest('-v', '--changed-file=test_b.py')
+		result.stdout.fnmatch_lines(['*Selected 2 tests affected by 1 changed files'])
+		result.stdout.fnmatch_lines([
+			'*test_a.py::test_build PASSED*',
+			'*test_a.py::test_api PASSED*',
+			'*test_b.py::test_client PASSED*',
+			'*test_b.py::test_other PASSED*',
+		])
+		result.assert_outcomes(passed = 4, deselected = 1)
+
+	def test_dependents(self, testdir):
+		self.make_files(testdir)
+		result = testdir.runpytest('-v', '--changed-file=test_a.py', '--changed-file=test_c.py')
+		result.stdout.fnmatch_lines(['*Selected 4 tests affected by 2 changed files'])
+		result.assert_outcomes(passed = 4, deselected = 1)
+
+	def test_conftest(self, testdir):
+		self.make_files(testdir)
+		testdir.makeconftest('')
+		result = testdir.runpytest('-v', '--changed-file=conftest.py')
+		result.assert_outcomes(passed = 5)
+
+	def test_unmapped_file(self, testdir):
+		self.make_files(testdir)
+		result = testdir.runpytest('-v', '--changed-file=test_b.py', '--changed-file=src/app.py')
+		result.stdout.fnmatch_lines(['*Running all tests, as 1 changed files do not belong to any test: src?app.py'])
+		result.assert_outcomes(passed = 5)
+
+	def test_deleted_conftest(self, testdir):
+		self.make_files(testdir)
+		result = testdir.runpytest('-v', '--changed-file=conftest.py')
+		result.assert_outcomes(passed = 5)
+		assert 'Running all tests' not in result.stdout.str()
+
+	def test_without_dependencies(self, testdir):
+		testdir.makepyfile(
+			test_a="""
+				def test_foo():
+					pass
+			""",
+			test_b="""
+				def test_bar():
+					pass
+			""",
+		)
+		result = testdir.runpytest('-v', '--changed-file=test_b.py')
+		result.assert_outcomes(passed = 1, deselected = 1)
+
+	def test_changed_since(self, testdir):
+		self.make_files(testdir)
+		git = ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com']
+		for args in [['init', '-q'], ['add', '.'], ['commit', '-q', '-m', 'initial']]:
+			subprocess.run(git + args, cwd = str(testdir.tmpdir), check = True)
+		testdir.makepyfile(test_c="""
+			def test_unrelated():
+				assert 1 == 1
+		""")
+		testdir.makepyfile(test_d="""
+			def test_new():
+				pass
+		""")
+		result = testdir.runpytest('-v', '--changed-since=HEAD')
+		result.stdout.fnmatch_lines(['*Selected 2 tests affected by 2 changed files'])
+		result.assert_outcomes(passed = 2, deselected = 4)
+
+	def test_changed_since_special_characters(self, testdir):
+		self.make_files(testdir)
+		git = ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com']
+		for args in [['init', '-q'], ['add', '.'], ['commit', '-q', '-m', 'initial']]:
+			subprocess.run(git + args, cwd = str(testdir.tmpdir), check = True)
+		testdir.makepyfile(**{'test_\u00e4 b': """
+			def test_new():
+				pass
+		"""})
+		result = testdir.runpytest('-v', '--changed-since=HEAD')
+		result.stdout.fnmatch_lines(['*Selected 1 tests affected by 1 changed files'])
+		result.assert_outcomes(passed = 1, deselected = 5)
+
+	def test_option_ref(self, testdir):
+		self.make_files(testdir)
+		subprocess.run(['git', 'init', '-q'], cwd = str(testdir.tmpdir), check = True)
+		result = testdir.runpytest('-v', '--changed-since=--output=changes.txt')
+		result.stderr.fnmatch_lines(['*Invalid git ref: --output=changes.txt'])
+		assert result.ret == pytest.ExitCode.USAGE_ERROR
+		assert not testdir.tmpdir.join('changes.txt').exists()
+
+	def test_invalid_ref(self, testdir):
+		self.make_files(testdir)
+		subprocess.run(['git', 'init', '-q'], cwd = str(testdir.tmpdir), check = True)
+		result = testdir.runpytest('-v', '--changed-since=missing')
+		result.stderr.fnmatch_lines(['*Failed to run git diff*'])
+		assert result.ret != 0
+
+
+class TestDependencyConcurrency(object):
+	def test_concurrent(self, testdir):
+		testdir.makepyfile("""
+			import threading
+			import pytest
+			barrier = threading.Barrier(3, timeout=10)
+			@pytest.fixture(scope='module')
+			def client():
+				return 'client'
+			@pytest.mark.depends(concurrent=True)
+			def test_a(client):
+				barrier.wait()
+			@pytest.mark.depends(concurrent=True)
+			def test_b(client):
+				barrier.wait()
+			@pytest.mark.depends(concurrent=True)
+			def test_c():
+				barrier.wait()
+		""")
+		result = testdir.runpytest('-v', '--dependency-concurrency=3')
+		result.stdout.fnmatch_lines([
+			'*::test_a PASSED*',
+			'*::test_b PASSED*',
+			'*::test_c PASSED*',
+		])
+		assert result.ret == 0
+
+	def test_parametrized(self, testdir):
+		testdir.makepyfile("""
+			import threading
+			import pytest
+			barrier = threading.Barrier(4, timeout=10)
+			@pytest.mark.depends(concurrent=True)
+			@pytest.mark.parametrize('num', range(4))
+			def test_a(num):
+				barrier.wait()
+		""")
+		result = testdir.runpytest('-v', '--dependency-concurrency=4')
+		result.assert_outcomes(passed = 4)
+
+	def test_dependencies(self, testdir):
+		testdir.makepyfile("""
+			import pytest
+			done = []
+			@pytest.mark.depends(concurrent=True)
+			def test_a():
+				done.append('a')
+			@pytest.mark.depends(concurrent=True, on=['test_a'])
+			def test_b():
+				assert done == ['a']
+			@pytest.mark.depends(concurrent=True)
+			def test_c():
+				assert 1 == 2
+			@pytest.mark.depends(concurrent=True, on=['test_c'])
+			def test_d():
+				pass
+		""")
+		result = testdir.runpytest('-v', '--dependency-concurrency=4')
+		result.stdout.fnmatch_lines([
+			'*::test_a PASSED*',
+			'*::test_b PASSED*',
+			'*::test_c FAILED*',
+			'*::test_d SKIPPED*',
+		])
+		assert result.ret != 0
+
+	def test_function_fixtures(self, testdir):
+		testdir.makepyfile("""
+			import pytest
+			@pytest.fixture
+			def resource():
+				state = {'open': True}
+				yield state
+				state['open'] = False
+			@pytest.mark.depends(concurrent=True)
+			def test_a(resource):
+				assert resource['open']
+			@pytest.mark.depends(concurrent=True)
+			def test_b(resource):
+				assert resource['open']
+		""")
+		result = testdir.runpytest('-v', '--dependency-concurrency=2')
+		result.assert_outcomes(passed = 2)
+
+	def test_not_marked(self, testdir):
+		testdir.makepyfile("""
+			import threading
+			import pytest
+			threads = set()
+			@pytest.mark.depends(name='a')
+			def test_a():
+				threads.add(threading.get_ident())
+			def test_b():
+				threads.add(threading.get_ident())
+				assert threads == {threading.main_thread().ident}
+		""")
+		result = testdir.runpytest('-v', '--dependency-concurrency=2')
+		result.assert_outcomes(passed = 2)
+
+	def test_warning_filters(self, testdir):
+		testdir.makepyfile("""
+			import threading
+			import warnings
+			import pytest
+			pytestmark = [pytest.mark.filterwarnings('error')]
+			barrier = threading.Barrier(2, timeout=10)
+			@pytest.mark.depends(concurrent=True)
+			def test_a():
+				barrier.wait()
+				warnings.warn(UserWarning('deprecated'))
+			@pytest.mark.depends(concurrent=True)
+			def test_b():
+				barrier.wait()
+		""")
+		result = testdir.runpytest('-v', '--dependency-concurrency=2')
+		result.stdout.fnmatch_lines([
+			'*::test_a FAILED*',
+			'*::test_b PASSED*',
+		])
+		assert result.ret != 0
+
+	def test_different_warning_filters(self, testdir):
+		testdir.makepyfile("""
+			import threading
+			import warnings
+			import pytest
+			threads = set()
+			@pytest.mark.depends(concurrent=True)
+			@pytest.mark.filterwarnings('error')
+			def test_a():
+				threads.add(threading.get_ident())
+			@pytest.mark.depends(concurrent=True)
+			def test_b():
+				threads.add(threading.get_ident())
+				warnings.warn(UserWarning('deprecated'))
+			def test_c():
+				assert threads == {threading.main_thread().ident}
+		""")
+		result = testdir.runpytest('-v', '--dependency-concurrency=2')
+		result.assert_outcomes(passed = 3, warnings = 1)
+
+	def test_call_hooks(self, testdir):
+		testdir.makeconftest("""
+			import pytest
+			calls = []
+			@pytest.hookimpl(hookwrapper=True)
+			def pytest_runtest_call(item):
+				calls.append(item.name)
+				yield
+			def pytest_terminal_summary(terminalreporter):
+				terminalreporter.write_line(f'CALLS {sorted(calls)}')
+		""")
+		testdir.makepyfile("""
+			import threading
+			import pytest
+			barrier = threading.Barrier(2, timeout=10)
+			@pytest.mark.depends(concurrent=True)
+			def test_a():
+				barrier.wait()
+			@pytest.mark.depends(concurrent=True)
+			def test_b():
+				barrier.wait()
+		""")
+		result = testdir.runpytest('-v', '--dependency-concurrency=2')
+		result.stdout.fnmatch_lines(["CALLS ['test_a', 'test_b']"])
+		result.assert_outcomes(passed = 2)
+
+	def test_output(self, testdir):
+		testdir.makepyfile("""
+			import threading
+			import pytest
+			barrier = threading.Barrier(2, timeout=10)
+			@pytest.mark.depends(concurrent=True)
+			def test_a():
+				barrier.wait()
+				print('output of a')
+				barrier.wait()
+			@pytest.mark.depends(concurrent=True)
+			def test_b():
+				barrier.wait()
+				print('output of b')
+				barrier.wait()
+		""")
+		result = testdir.runpytest('-rA', '--dependency-concurrency=2')
+		result.stdout.fnmatch_lines([
+			'*_ test_a _*',
+			'*Captured stdout call*',
+			'output of a',
+			'*_ test_b _*',
+			'*Captured stdout call*',
+			'output of b',
+		], consecutive = True)
+		result.assert_outcomes(passed = 2)
+
+	def test_async(self, testdir):
+		testdir.makepyfile("""
+			import threading
+			import pytest
+			threads = set()
+			@pytest.mark.depends(concurrent=True)
+			def test_a():
+				threads.add(threading.get_ident())
+			@pytest.mark.depends(concurrent=True)
+			async def test_b():
+				pass
+			def test_c():
+				assert threads == {threading.main_thread().ident}
+		""")
+		result = testdir.runpytest('-v', '--dependency-concurrency=2')
+		result.stdout.fnmatch_lines(['*::test_a PASSED*', '*::test_c PASSED*'])
+
+
+class TestDependencyProfile(object):
+	def test_profile(self, testdir):
+		testdir.makepyfile("""
+			import pytest
+			@pytest.mark.depends(on=['test_bar', 'missing'])
+			def test_foo():
+				pass
+			def test_bar():
+				pass
+		""")
+		result = testdir.runpytest(
+			'-v', '--dependency-profile', '--dependency-profile-path=profile.json', '--missing-dependency-action=run',
+		)
+		result.stdout.fnmatch_lines([
+			'*pytest-depends overhead*',
+			'*calls  collection',
+		])
+		assert result.ret == 0
+
+		with open(testdir.tmpdir.join('profile.json')) as f:
+			data = json.load(f)
+		assert set(data['timings']) >= {'collection', 'name_mapping', 'resolution', 'sorting', 'register_result'}
+		assert data['timings']['register_result']['calls'] == 6
+		assert data['timings']['check_dependencies']['calls'] == 2
+		assert data['counts']['tests'] == 2
+		assert data['counts']['lookups'] == 2
+		assert data['counts']['unresolved_names'] == 1
+
+	def test_default_path(self, testdir):
+		testdir.makepyfile("""
+			import pytest
+			@pytest.mark.depends(on=['test_bar'])
+			def test_foo():
+				pass
+			def test_bar():
+				pass
+		""")
+		result = testdir.runpytest('-v', '--dependency-profile', testdir.tmpdir.strpath)
+		result.stdout.fnmatch_lines([
+			'*::test_bar PASSED*',
+			'*::test_foo PASSED*',
+			'Written to pytest-depends-profile.json',
+		])
+		assert testdir.tmpdir.join('pytest-depends-profile.json').exists()
+		assert result.ret == 0
+
+	def test_unwritable_path(self, testdir):
+		testdir.makepyfile("""
+			def test_foo():
+				pass
+		""")
+		result = testdir.runpytest('--dependency-profile', '--dependency-profile-path', testdir.tmpdir.strpath)
+		result.stdout.fnmatch_lines([
+			'Could not write to *: Is a directory',
+		])
+		assert result.ret == 0
+
+	def test_disabled(self, testdir):
+		testdir.makepyfile("""
+			import pytest
+			@pytest.mark.depends(on=['test_bar'])
+			def test_foo():
+				pass
+			def test_bar():
+				pass
+		""")
+		result = testdir.runpytest('-v')
+		result.stdout.no_fnmatch_line('*pytest-depends overhead*')
+		assert not testdir.tmpdir.join('pytest-depends-profile.json').exists()
+		assert result.ret == 0
+
+
+class TestDependsExport(object):
+	SOURCE = """
+		import pytest
+		@pytest.mark.depends(on=['test_bar', 'missing'], cost=2)
+		def test_foo():
+			pass
+		@pytest.mark.depends(name='both')
+		def test_bar():
+			pass
+		@pytest.mark.depends(name='both')
+		def test_baz():
+			pass
+		@pytest.mark.depends(on=['both'])
+		def test_qux():
+			pass
+	"""
+
+	def test_json(self, testdir):
+		testdir.makepyfile(test_export=self.SOURCE)
+		result = testdir.runpytest('--depends-export=graph.json', '--missing-dependency-action=run')
+		assert result.ret == 0
+
+		with open(testdir.tmpdir.join('graph.json')) as f:
+			data = json.load(f)
+		assert data['tests'] == [
+			{'id': 0, 'nodeid': 'test_export.py::test_foo', 'cost': 2},
+			{'id': 1, 'nodeid': 'test_export.py::test_bar'},
+			{'id': 2, 'nodeid': 'test_export.py::test_baz'},
+			{'id': 3, 'nodeid': 'test_export.py::test_qux'},
+		]
+		assert data['groups'] == [{'id': 4, 'name': 'test_export.py'}, {'id': 5, 'name': 'both'}]
+		assert {'source': 0, 'target': 1} in data['edges']
+		assert {'source': 3, 'target': 5} in data['edges']
+		assert {'source': 5, 'target': 1} in data['edges']
+		assert {'source': 5, 'target': 2} in data['edges']
+		assert data['unresolved'] == [{'test': 0, 'name': 'missing'}]
+
+	def test_json_without_dependencies(self, testdir):
+		testdir.makepyfile("""
+			def test_foo():
+				pass
+		""")
+		result = testdir.runpytest('--depends-export=graph.json')
+		assert result.ret == 0
+
+		with open(testdir.tmpdir.join('graph.json')) as f:
+			data = json.load(f)
+		assert data == {
+			'tests': [{'id': 0, 'nodeid': 'test_json_without_dependencies.py::test_foo'}],
+			'groups': [],
+			'edges': [],
+			'unresolved': [],
+		}
+
+	def test_ndjson(self, testdir):
+		testdir.makepyfile(test_export=self.SOURCE)
+		testdir.runpytest('--depends-export=graph.ndjson', '--missing-dependency-action=run')
+
+		with open(testdir.tmpdir.join('graph.ndjson')) as f:
+			records = [json.loads(line) for line in f]
+		assert records[0] == {'type': 'test', 'id': 0, 'nodeid': 'test_export.py::test_foo', 'cost': 2}
+		assert {'type': 'edge', 'source': 0, 'target': 1} in records
+		assert records[-1] == {'type': 'unresolved', 'test': 0, 'name': 'missing'}
+
+	def test_dot(self, testdir):
+		testdir.makepyfile(test_export=self.SOURCE)
+		testdir.runpytest('--depends-export=graph.dot', '--missing-dependency-action=run')
+
+		lines = testdir.tmpdir.join('graph.dot').read().splitlines()
+		assert lines[0] == 'digraph dependencies {'
+		assert '\t0 [label="test_export.py::test_foo"];' in lines
+		assert '\t5 [label="both", shape=box];' in lines
+		assert '\t0 -> 1;' in lines
+		assert '\t"unresolved:missing" [label="missing", style=dashed, color=red];' in lines
+		assert '\t0 -> "unresolved:missing" [style=dashed, color=red];' in lines
+		assert lines[-1] == '}'
+
+	def test_dot_unresolved_names(self, testdir):
+		testdir.makepyfile("""
+			import pytest
+			@pytest.mark.depends(on=['0', 'caf\u00e9'])
+			def test_foo():
+				pass
+		""")
+		testdir.runpytest('--depends-export=graph.dot', '--missing-dependency-action=run')
+
+		lines = testdir.tmpdir.join('graph.dot').read_text('utf-8').splitlines()
+		assert '\t0 -> "unresolved:0" [style=dashed, color=red];' in lines
+		assert '\t0 -> "unresolved:caf\u00e9" [style=dashed, color=red];' in lines
+
+	def test_unknown_format(self, testdir):
+		testdir.makepyfile(test_export=self.SOURCE)
+		result = testdir.runpytest('--depends-export=graph.txt')
+		result.stderr.fnmatch_lines(['*Unsupported format for graph.txt*'])
+		assert result.ret == 4
+
+	def test_unwritable_path(self, testdir):
+		testdir.makepyfile(test_export=self.SOURCE)
+		result = testdir.runpytest('--depends-export=missing/graph.json')
+		result.stderr.fnmatch_lines(['*Could not write the dependency graph to missing/graph.json: *'])
+		assert result.ret == 4
+
+
+class TestResultStore(object):
+	def test_success(self):
+		store = testmodule.ResultStore(2)
+		for step in testmodule.ResultStore.STEPS:
+			store.register(1, step, 'passed')
+		assert (store.success[0], store.failed[0]) == (0, 0)
+		assert (store.success[1], store.failed[1]) == (1, 0)
+
+	def test_failed(self):
+		store = testmodule.ResultStore(1)
+		store.register(0, 'setup', 'passed')
+		store.register(0, 'call', 'failed')
+		assert (store.success[0], store.failed[0]) == (0, 1)
+		assert store.get_outcomes(0) == {'setup': 'passed', 'call': 'failed'}
+
+	def test_unknown_outcome(self):
+		store = testmodule.ResultStore(1)
+		store.register(0, 'setup', 'rerun')
+		assert store.get_outcomes(0) == {'setup': 'rerun'}
+		assert store.failed[0]
+
+	def test_view(self):
+		result = testmodule.TestResult('test_file.py::test')
+		result.register_result(testmodule.SharedResult('setup', 'passed'))
+		assert result.results == {'setup': 'passed'}
+		assert not result.success
+		result.register_result(testmodule.SharedResult('call', 'passed'))
+		result.register_result(testmodule.SharedResult('teardown', 'passed'))
+		assert result.success
+		assert not result.failed
+
+	def test_unknown_step(self):
+		with pytest.raises(ValueError):
+			testmodule.TestResult('test_file.py::test').register_result(testmodule.SharedResult('other', 'passed'))
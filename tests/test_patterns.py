@@ -0,0 +1,54 @@
+import pytest_depends.patterns as testmodule
+
+
+class TestGetLiteralPrefix(object):
+	def test_glob(self):
+		assert testmodule.get_literal_prefix('glob:tests/api/*::test_create_*') == 'tests/api/'
+
+	def test_glob_without_wildcards(self):
+		assert testmodule.get_literal_prefix('glob:test_file.py') == 'test_file.py'
+
+	def test_regex_group(self):
+		assert testmodule.get_literal_prefix('re:tests/(api|db)/.*') == 'tests/'
+
+	def test_regex_optional(self):
+		assert testmodule.get_literal_prefix('re:tests?/.*') == 'test'
+
+	def test_regex_alternatives(self):
+		assert testmodule.get_literal_prefix('re:test_a|test_b') == ''
+
+
+class TestPatternIndex(object):
+	NAMES = [
+		'tests/api/test_users.py',
+		'tests/api/test_users.py::test_create_user',
+		'tests/api/test_users.py::test_delete_user',
+		'tests/db/test_users.py::test_create_user',
+		'setup',
+	]
+
+	def test_glob(self):
+		index = testmodule.PatternIndex(self.NAMES)
+		assert index.match('glob:tests/*::test_create_*') == [
+			'tests/api/test_users.py::test_create_user',
+			'tests/db/test_users.py::test_create_user',
+		]
+
+	def test_regex(self):
+		index = testmodule.PatternIndex(self.NAMES)
+		assert index.match('re:tests/api/.*_user') == [
+			'tests/api/test_users.py::test_create_user',
+			'tests/api/test_users.py::test_delete_user',
+		]
+
+	def test_regex_must_match_entire_name(self):
+		index = testmodule.PatternIndex(self.NAMES)
+		assert index.match('re:tests/api/test_users') == []
+
+	def test_regex_alternatives(self):
+		index = testmodule.PatternIndex(self.NAMES)
+		assert index.match('re:setup|tests/db/.*') == ['setup', 'tests/db/test_users.py::test_create_user']
+
+	def test_no_match(self):
+		index = testmodule.PatternIndex(self.NAMES)
+		assert index.match('glob:other/*') == []
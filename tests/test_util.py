@@ -58,6 +58,17 @@ class TestGetAbsoluteNodeid(object):
 		assert actual == 'test_file2.py::TestClass2::test2'
 
 
+class TestGetNodeidScope(object):
+	def test_directories(self):
+		assert testmodule.get_nodeid_scope('tests/api/test_file.py::test') == ('tests', 'tests/api', 'tests/api/test_file.py')
+
+	def test_class(self):
+		assert testmodule.get_nodeid_scope('test_file.py::TestClass::test') == ('test_file.py', 'test_file.py::TestClass')
+
+	def test_parameters(self):
+		assert testmodule.get_nodeid_scope('test_file.py::test[a::b/c]') == ('test_file.py',)
+
+
 class TestAsList(object):
 	def test_input_list(self):
 		assert testmodule.as_list(['foo']) == ['foo']